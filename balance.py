@@ -0,0 +1,430 @@
+"""
+Checking every magic.json, and the numbers worked out from them.
+
+validate_magic_info wants six dimensions under both deals and takes, each with
+a whole amount of 0 or more, and spells for every dimension that deals
+anything. A BalanceIndex holds, for each form (nested ones included):
+
+    able        the dimensions they have spells for, in their file's order
+    matchups    (attacker, defender) -> the dimension that hits hardest, how
+                hard, and what a random spell (the computer's way) does on
+                average
+
+The game's index starts out empty and never goes near the disk. Each form gets
+checked and worked out from the character template in use (so a bundle, or
+content reloaded by content.py, is what counts) the first time somebody
+duels as it, and each matchup the first time it's asked for. So Game() costs
+the same however big the roster is.
+
+The whole table is a build step, kept in balance.index (JSON) along with each
+magic.json's mtime, size and hash, and `python balance.py build` is the only
+thing that writes it. Building again only stats the files: anything whose
+mtime or size changed gets read again and hashed, and only what really changed
+gets checked and worked out again, along with its matchups. The index is only
+written back when something did change.
+
+    python balance.py build      # check everything, write balance.index
+    python balance.py show       # expected damage per turn, every matchup
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from collections import namedtuple
+from collections.abc import Mapping
+
+import character
+from character import CharacterTemplate, get_template, is_latest, list_namepaths
+from damage import DamageTable, hit_row, reach
+from game_macros import BALANCE_INDEX, CHARACTERS_DIR, DIMENSIONS, thaw
+
+# 2: hashes are of the magic info in use, not the file's bytes
+VERSION = 2
+
+MatchupNumbers = namedtuple(
+    "MatchupNumbers", ["best_dimension", "best_hit", "expected_damage"]
+)
+
+
+def _is_amount(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def validate_magic_info(magic_info, where="magic.json"):
+    """Everything wrong with one parsed magic.json, as a list of messages."""
+    if not isinstance(magic_info, Mapping):
+        return [f"{where}: should be a JSON object"]
+    problems = []
+    for section in ("deals", "takes"):
+        entries = magic_info.get(section)
+        if not isinstance(entries, Mapping):
+            problems.append(f"{where}: no {section!r} object")
+            continue
+        for dimension in entries:
+            if dimension not in DIMENSIONS:
+                problems.append(f"{where}: unknown dimension {section}.{dimension}")
+        for dimension in DIMENSIONS:
+            info = entries.get(dimension)
+            if not isinstance(info, Mapping):
+                problems.append(f"{where}: no {section}.{dimension}")
+                continue
+            amount = info.get("amount")
+            if not _is_amount(amount):
+                problems.append(
+                    f"{where}: {section}.{dimension}.amount should be a whole "
+                    f"number, 0 or more (not {amount!r})"
+                )
+            if section == "takes":
+                continue
+            spells = info.get("spells")
+            if isinstance(spells, str) or not isinstance(spells, (list, tuple)):
+                problems.append(f"{where}: deals.{dimension}.spells should be a list")
+            elif not all(isinstance(spell, str) and spell for spell in spells):
+                problems.append(f"{where}: deals.{dimension}.spells has a blank")
+            elif _is_amount(amount) and amount > 0 and not spells:
+                problems.append(
+                    f"{where}: deals.{dimension} deals {amount} but has no spells"
+                )
+    return problems
+
+
+def _form_entry(magic_info):
+    deals, takes = magic_info["deals"], magic_info["takes"]
+    return {
+        "able": [dim for dim, info in deals.items() if info["spells"]],
+        "deals": [deals[dim]["amount"] for dim in DIMENSIONS],
+        "takes": [takes[dim]["amount"] for dim in DIMENSIONS],
+    }
+
+
+def _vectors(form):
+    """A form entry as damage.py's (deals, takes, able)."""
+    able = set(form["able"])
+    return form["deals"], form["takes"], [dim in able for dim in DIMENSIONS]
+
+
+def _numbers(able, hits):
+    """MatchupNumbers for an attacker with the given able dimensions (file
+    order), from the six hits they land (see damage.hit_row).
+    """
+    if not able:
+        return MatchupNumbers(None, 0, 0.0)
+    by_dimension = {dim: hits[DIMENSIONS.index(dim)] for dim in able}
+    # the first of the hardest hitters, in file order
+    best = max(by_dimension, key=by_dimension.get)
+    return MatchupNumbers(
+        best, by_dimension[best], sum(by_dimension.values()) / len(able)
+    )
+
+
+def _matchup(attacker, defender):
+    deals, _, able = _vectors(attacker)
+    hits = list(hit_row(reach(deals, able), defender["takes"]))
+    return _numbers(attacker["able"], hits)
+
+
+def _info_hash(magic_info):
+    canonical = json.dumps(thaw(magic_info), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _stamp(filepath):
+    """[mtime_ns, size] of a magic.json, or None if there's no file to go by
+    (like with a bundle in use, see bundle.py).
+    """
+    if character._bundle is not None:
+        return None
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class BalanceIndex:
+    def __init__(self, path=None):
+        # where it lives on disk (None: it doesn't)
+        self.path = path
+        # magic.json path -> [mtime_ns, size, sha256] as of the last check
+        self.files = {}
+        # namepath -> {"able": [...], "deals": [...], "takes": [...]}
+        self.forms = {}
+        # namepath -> tuple of able dimensions (what the game asks for)
+        self.able = {}
+        # (attacker namepath, defender namepath) -> MatchupNumbers
+        self.matchups = {}
+        # whether there's anything save() would write that isn't on disk yet
+        self.dirty = False
+
+    def load(self):
+        """Read the index from disk, if it's there and of this version."""
+        if self.path is None or not os.path.exists(self.path):
+            return self
+        try:
+            with open(self.path) as index_fl:
+                stored = json.load(index_fl)
+        except (OSError, ValueError):
+            return self
+        if stored.get("version") != VERSION:
+            return self
+        self.files = stored["files"]
+        self.forms = stored["forms"]
+        self.able = {
+            namepath: tuple(form["able"]) for namepath, form in self.forms.items()
+        }
+        self.matchups = {
+            tuple(pair.split("|")): MatchupNumbers(*numbers)
+            for pair, numbers in stored["matchups"].items()
+        }
+        self.dirty = False
+        return self
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        stored = {
+            "version": VERSION,
+            "files": self.files,
+            "forms": self.forms,
+            "matchups": {
+                "|".join(pair): list(numbers)
+                for pair, numbers in self.matchups.items()
+            },
+        }
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "w") as index_fl:
+                json.dump(stored, index_fl, ensure_ascii=False)
+            os.replace(temporary, self.path)
+        except OSError:
+            # a read-only checkout can still play, it just works things out
+            # again next time
+            return
+        self.dirty = False
+
+    def _magic_info(self, namepath, fresh=False):
+        """The template in use's magic info for namepath (or, if fresh, what's
+        in its magic.json right now), and everything wrong with it.
+        """
+        where = f"{namepath}/magic.json"
+        template = CharacterTemplate(namepath) if fresh else get_template(namepath)
+        try:
+            magic_info = template.magic_info
+        except ValueError as exc:
+            return None, [f"{where}: not valid JSON ({exc})"]
+        return magic_info, validate_magic_info(magic_info, where)
+
+    def _add(self, namepath, magic_info):
+        self.forms[namepath] = _form_entry(magic_info)
+        self.able[namepath] = tuple(self.forms[namepath]["able"])
+        self.dirty = True
+        return self.forms[namepath]
+
+    def form(self, namepath):
+        """The indexed entry for namepath, checked and worked out from the
+        template in use the first time anybody asks.
+        """
+        form = self.forms.get(namepath)
+        if form is None:
+            magic_info, problems = self._magic_info(namepath)
+            if problems:
+                raise ValueError("Bad magic.json:\n" + "\n".join(problems))
+            form = self._add(namepath, magic_info)
+        return form
+
+    def _check_form(self, namepath):
+        """(magic info to index, or None if nothing changed; everything wrong
+        with it).
+        """
+        filepath = f"{namepath}/magic.json"
+        stamp = _stamp(filepath)
+        known = self.files.get(filepath)
+        up_to_date = stamp is not None and known and known[:2] == stamp
+        if up_to_date and namepath in self.forms:
+            return None, []
+        # the file moved on, so whatever template is cached might be behind it
+        magic_info, problems = self._magic_info(namepath, fresh=stamp is not None)
+        if problems:
+            # so it gets looked at again next time
+            self.files.pop(filepath, None)
+            return None, problems
+        digest = _info_hash(magic_info)
+        record = [*(stamp or [None, None]), digest]
+        if record != known:
+            self.files[filepath] = record
+            self.dirty = True
+        if known and known[2] == digest and namepath in self.forms:
+            # touched, not changed
+            return None, []
+        return magic_info, []
+
+    def refresh(self, characters_dirs=(CHARACTERS_DIR,)):
+        """Bring the index up to date with every form under characters_dirs,
+        checking whatever changed (ValueError listing everything wrong).
+        Matchups of the forms that changed are dropped, to be worked out again
+        when asked for. Return the namepaths that changed.
+        """
+        changed = set()
+        problems = []
+        seen = set()
+        for characters_dir in characters_dirs:
+            for namepath in list_namepaths(characters_dir):
+                seen.add(namepath)
+                magic_info, found = self._check_form(namepath)
+                problems.extend(found)
+                if magic_info is not None:
+                    self._add(namepath, magic_info)
+                    changed.add(namepath)
+        self._drop_matchups(changed)
+        if problems:
+            raise ValueError("Bad magic.json:\n" + "\n".join(problems))
+
+        # whoever was indexed under these directories but isn't there anymore
+        prefixes = tuple(f"{characters_dir}/" for characters_dir in characters_dirs)
+        self.forget(
+            [
+                namepath
+                for namepath in self.forms
+                if namepath.startswith(prefixes) and namepath not in seen
+            ]
+        )
+        return changed
+
+    def _drop_matchups(self, namepaths):
+        if namepaths and self.matchups:
+            self.matchups = {
+                pair: numbers
+                for pair, numbers in self.matchups.items()
+                if pair[0] not in namepaths and pair[1] not in namepaths
+            }
+            self.dirty = True
+
+    def forget(self, namepaths):
+        """Drop everything worked out about these forms (content.py does this
+        when they get reloaded), so it gets worked out again when asked for.
+        """
+        namepaths = set(namepaths)
+        for namepath in namepaths:
+            if self.forms.pop(namepath, None) is not None:
+                self.dirty = True
+            self.able.pop(namepath, None)
+            self.files.pop(f"{namepath}/magic.json", None)
+        self._drop_matchups(namepaths)
+
+    def able_dimensions(self, character):
+        """Dimensions the character has spells for (drunk or not, that's the
+        same), in the order their magic.json lists them.
+        """
+        if not is_latest(character):
+            # from before their files got reloaded (see content.py), so they
+            # go by their own magic
+            deals = character.magic_info["deals"]
+            return tuple(dim for dim, info in deals.items() if info["spells"])
+        able = self.able.get(character.namepath)
+        if able is None:
+            self.form(character.namepath)
+            able = self.able[character.namepath]
+        return able
+
+    def fill_matchups(self):
+        """Work out every matchup between the indexed forms that isn't yet,
+        all at once from a damage.DamageTable.
+        """
+        namepaths = list(self.forms)
+        missing = [
+            (attacker, defender)
+            for attacker in range(len(namepaths))
+            for defender in range(len(namepaths))
+            if (namepaths[attacker], namepaths[defender]) not in self.matchups
+        ]
+        if not missing:
+            return
+        table = DamageTable(
+            namepaths, [_vectors(self.forms[namepath]) for namepath in namepaths]
+        )
+        for attacker, defender in missing:
+            pair = (namepaths[attacker], namepaths[defender])
+            self.matchups[pair] = _numbers(
+                self.forms[pair[0]]["able"], table.hits(attacker, defender)
+            )
+        self.dirty = True
+
+    def matchup(self, attacker, defender):
+        """MatchupNumbers for two namepaths (or names, for the roster), worked
+        out the first time they're asked for.
+        """
+        pair = (_namepath(attacker), _namepath(defender))
+        numbers = self.matchups.get(pair)
+        if numbers is None:
+            numbers = self.matchups[pair] = _matchup(
+                self.form(pair[0]), self.form(pair[1])
+            )
+            self.dirty = True
+        return numbers
+
+
+def _namepath(name):
+    return name if "/" in name else f"{CHARACTERS_DIR}/{name.lower()}"
+
+
+# the index the game reads from (in memory only; see balance_index)
+_index = None
+
+
+def balance_index():
+    """The index the game reads from, started empty the first time."""
+    global _index
+    if _index is None:
+        _index = BalanceIndex()
+    return _index
+
+
+def able_dimensions(character):
+    """BalanceIndex.able_dimensions, from the index the game reads from."""
+    return (_index or balance_index()).able_dimensions(character)
+
+
+def build_balance_index(characters_dirs=(CHARACTERS_DIR,), path=BALANCE_INDEX):
+    """Check every form under characters_dirs (ValueError listing everything
+    wrong), work out every matchup between them, and write it all to path,
+    starting from whatever is there already.
+    """
+    index = BalanceIndex(path).load()
+    index.refresh(characters_dirs)
+    index.fill_matchups()
+    index.save()
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and index magic.json.")
+    parser.add_argument("command", choices=("build", "show"))
+    parser.add_argument("--characters-dir", default=CHARACTERS_DIR)
+    parser.add_argument("--index", default=BALANCE_INDEX)
+    args = parser.parse_args()
+
+    index = build_balance_index((args.characters_dir,), path=args.index)
+    if args.command == "build":
+        print(
+            f"{len(index.forms)} forms checked, "
+            f"{len(index.matchups)} matchups in {args.index}"
+        )
+        return
+
+    prefix = f"{args.characters_dir}/"
+    for (attacker, defender), numbers in sorted(index.matchups.items()):
+        if attacker == defender:
+            continue
+        attacker, defender = (
+            namepath.removeprefix(prefix) for namepath in (attacker, defender)
+        )
+        print(
+            f"{attacker:22} vs. {defender:22} {numbers.expected_damage:4.2f} "
+            f"per spell, best "
+            f"{numbers.best_dimension} for {numbers.best_hit}"
+        )
+
+
+if __name__ == "__main__":
+    main()
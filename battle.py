@@ -0,0 +1,436 @@
+"""
+Battles: any number of fighters at once, every one for themselves or in teams.
+
+Game is a duel, with exactly one player and one opponent. A Battle holds a
+whole list of combatants (plain Characters), each on a team (in a free-for-all,
+everybody is a team of one), and takes them round in turns: pick somebody from
+another team, then throw a spell at them or use a special ability, by the same
+rules as a duel (spells hit through Game.hit itself). Last team standing wins.
+Teams are told apart by where they are in the line-up, so two of the same
+name are still two teams.
+
+No turn gets more expensive with more fighters in the battle:
+    - whose turn it is comes off a queue, and the fallen are skipped when they
+      come up instead of being hunted down and taken out
+    - who is still up, overall and per team (and outside the biggest team, see
+      Battle.outsiders), is kept in lists that the fallen get swapped out of,
+      so picking a random target or checking for a winner doesn't mean going
+      through everybody, or every team
+    - lingering effects wear off through each fighter's own EffectScheduler,
+      which keeps track of every effect by whoever caused it (see effects.py)
+
+    python battle.py --team nora winston --team bastion adrian --battles 1000
+    python battle.py --free-for-all nora winston bastion --copies 100 --seed 7
+    python battle.py --free-for-all nora stella lucian --watch
+"""
+
+import argparse
+import time
+from collections import Counter, deque, namedtuple
+
+from character import Character
+from game import Game
+from frontend import NullFrontend, use_frontend
+from game_macros import SpellChoice, pause, say
+from rng import Stream, current_rng, use_rng
+from roster import Roster
+from simulation import DEFAULT_MAX_TURNS, POLICIES, random_policy
+from special_abilities import SpecialAbility
+
+BattleResult = namedtuple(
+    "BattleResult", ["winner", "turns", "survivors", "damage_by_team"]
+)
+
+
+## Targeting: given the battle and the index of whoever's turn it is, return
+## the index of somebody still up on another team.
+
+
+def random_target(battle, me):
+    """Anybody still up on another team, all equally likely."""
+    rng = current_rng()
+    team = battle.team_of[me]
+    alive = battle.alive
+    friends = len(battle.alive_by_team[team])
+    if 2 * friends <= len(alive):
+        # at least even odds of an enemy every try, so two tries on average
+        while True:
+            target = alive[rng.randrange(len(alive))]
+            if battle.team_of[target] != team:
+                return target
+
+    # Mostly friends left, so pick from the ones who aren't instead.
+    enemies = battle.outsiders(team)
+    return enemies[rng.randrange(len(enemies))]
+
+
+def focus_target(battle, me):
+    """Whoever they went after last time, until they fall; then somebody new."""
+    target = battle.last_target[me]
+    if target is not None and battle.is_up(target):
+        return target
+    return random_target(battle, me)
+
+
+TARGETING = {
+    "random": random_target,
+    "focus": focus_target,
+}
+
+
+class Battle:
+    def __init__(self, combatants, teams=None, team_names=None):
+        self.combatants = list(combatants)
+        fighters = range(len(self.combatants))
+        # team of each combatant (an index into team_names), by index;
+        # everybody for themselves if not given
+        self.team_of = list(teams) if teams is not None else list(fighters)
+        # what each team is called, by index
+        self.team_names = (
+            list(team_names)
+            if team_names is not None
+            else [str(team) for team in range(max(self.team_of, default=-1) + 1)]
+        )
+        self.turn = 0
+        # a headless Game, only for its rules (Game.hit), so that battles and
+        # duels can't drift apart
+        self.rules = Game.for_duel()
+
+        # Indices of everybody still up, in no particular order, and where
+        # each of them sits in that list (None once they fall)
+        self.alive = list(fighters)
+        self._alive_slot = list(fighters)
+        # team -> indices of its members still up (and where they sit in
+        # there); a team is gone from here as soon as its last member falls
+        self.alive_by_team = {}
+        self._team_slot = [None] * len(self.combatants)
+        for idx, team in enumerate(self.team_of):
+            members = self.alive_by_team.setdefault(team, [])
+            self._team_slot[idx] = len(members)
+            members.append(idx)
+        # Everybody still up who isn't on one particular team (and where they
+        # sit in there), kept for whichever team last needed it; see outsiders
+        self._outsiders_team = None
+        self._outsiders = []
+        self._outsider_slot = [None] * len(self.combatants)
+
+        # whose turn is next, in order; the fallen stay in until they come up
+        self._queue = deque(fighters)
+        # index -> whoever they went after last (see focus_target)
+        self.last_target = [None] * len(self.combatants)
+        # team -> damage its members have dealt
+        self.damage_by_team = Counter()
+
+    def is_up(self, idx):
+        return self._alive_slot[idx] is not None
+
+    def is_over(self):
+        return len(self.alive_by_team) <= 1
+
+    def outsiders(self, team):
+        """Everybody still up who isn't on team. Going through everybody only
+        when a different team asks than last time, and kept up to date as they
+        fall. Only a team with most of the fighters left needs this (see
+        random_target), and there can only be one of those.
+        """
+        if self._outsiders_team != team:
+            self._outsiders_team = team
+            self._outsiders = [idx for idx in self.alive if self.team_of[idx] != team]
+            for slot, idx in enumerate(self._outsiders):
+                self._outsider_slot[idx] = slot
+        return self._outsiders
+
+    def winner(self):
+        """The last team standing (its index), or None if the battle is not
+        over (or nobody is left at all).
+        """
+        if len(self.alive_by_team) == 1:
+            return next(iter(self.alive_by_team))
+        return None
+
+    def survivors(self):
+        return [self.combatants[idx] for idx in self.alive]
+
+    def next_fighter(self):
+        """Index of whoever's turn it is now."""
+        queue = self._queue
+        while True:
+            idx = queue.popleft()
+            if self.is_up(idx):
+                queue.append(idx)
+                return idx
+
+    @staticmethod
+    def _swap_out(members, slots, idx):
+        # take idx out of members by moving the last one into its place
+        slot = slots[idx]
+        last = members.pop()
+        if last != idx:
+            members[slot] = last
+            slots[last] = slot
+        slots[idx] = None
+
+    def fall(self, idx):
+        team = self.team_of[idx]
+        self._swap_out(self.alive, self._alive_slot, idx)
+        members = self.alive_by_team[team]
+        self._swap_out(members, self._team_slot, idx)
+        if not members:
+            del self.alive_by_team[team]
+        if self._outsiders_team not in (None, team):
+            self._swap_out(self._outsiders, self._outsider_slot, idx)
+        say(f"{self.combatants[idx].name} is out of the fight!\n")
+        pause(1)
+
+    def take_turn(self, policy=random_policy, targeting=random_target):
+        """Play the next fighter's turn: pick a target, then a move for the
+        policy (as in simulation.py, given the fighter and their target).
+        Return the mover's index.
+        """
+        self.turn += 1
+        me = self.next_fighter()
+        target = targeting(self, me)
+        self.last_target[me] = target
+        attacker, defender = self.combatants[me], self.combatants[target]
+
+        choice = policy(attacker, defender)
+        if isinstance(choice, SpellChoice):
+            spells = attacker.magic_info["deals"][choice.dimension]["spells"]
+            say(
+                f"{attacker.name} casts "
+                f'"{current_rng().choice(spells)}" at {defender.name}!\n'
+            )
+            pause(1)
+            rules = self.rules
+            rules.player, rules.opponent, rules.turn = attacker, defender, self.turn
+            hit = rules.hit(defender, choice.dimension, choice.hit)
+            self.damage_by_team[self.team_of[me]] += hit
+            defender.possibly_react()
+        else:
+            # Abilities change the characters in place, so nobody needs
+            # putting back anywhere (unlike in Game.use_special_ability).
+            SpecialAbility(
+                player=attacker, opponent=defender, effect=choice.effect
+            ).perform(is_computer=True, onlooker=True)
+
+        for effect in attacker.effects.wear_down():
+            attacker.reset(
+                opponent_name=effect.source.name, is_computer=True, onlooker=True
+            )
+
+        # Unlike a duel, anybody who hits 0 is out, whoever's move it was
+        # (some special abilities cost the mover life).
+        for idx in (target, me):
+            if self.combatants[idx].life <= 0 and self.is_up(idx):
+                self.fall(idx)
+        return me
+
+
+def _numbered(names):
+    """names, with any that show up more than once numbered (nora #1...)."""
+    totals = Counter(names)
+    seen = Counter()
+    numbered = []
+    for name in names:
+        if totals[name] > 1:
+            seen[name] += 1
+            name = f"{name} #{seen[name]}"
+        numbered.append(name)
+    return numbered
+
+
+def team_names(teams):
+    """What each team in teams (see line_up) gets called, in order."""
+    return _numbered([name for name, _ in teams])
+
+
+def line_up(teams, copies=1):
+    """A fresh Battle. teams is a list of (team name, roster names (e.g.
+    "nora")), and each team gets copies of each of its fighters. Teams are
+    told apart by where they are in the list, not by name; anybody (or any
+    team) who shows up more than once gets numbered.
+    """
+    fighters = [
+        (team, name)
+        for team, (_, members) in enumerate(teams)
+        for name in members
+    ] * copies
+    names = _numbered([name.title() for _, name in fighters])
+    combatants = []
+    for (_, roster_name), name in zip(fighters, names):
+        character = Character(name=roster_name.title())
+        character.name = name
+        combatants.append(character)
+    return Battle(
+        combatants,
+        teams=[team for team, _ in fighters],
+        team_names=team_names(teams),
+    )
+
+
+def play_battle(
+    battle, policy=random_policy, targeting=random_target, max_turns=None
+):
+    """Play the battle out, and return a BattleResult; winner is the last
+    team standing, or None for a draw. By default it's a draw after
+    simulation.DEFAULT_MAX_TURNS turns per fighter.
+    """
+    if max_turns is None:
+        max_turns = DEFAULT_MAX_TURNS * len(battle.combatants)
+    while not battle.is_over() and battle.turn < max_turns:
+        battle.take_turn(policy=policy, targeting=targeting)
+    winner = battle.winner()
+    return BattleResult(
+        winner=None if winner is None else battle.team_names[winner],
+        turns=battle.turn,
+        survivors=[character.name for character in battle.survivors()],
+        damage_by_team=Counter(
+            {
+                battle.team_names[team]: damage
+                for team, damage in battle.damage_by_team.items()
+            }
+        ),
+    )
+
+
+class BattleStats:
+    """Running tally over a number of battles between the same teams."""
+
+    def __init__(self, teams):
+        self.teams = list(teams)
+        self.battles = 0
+        self.wins = Counter()
+        self.draws = 0
+        self.total_turns = 0
+        self.damage_by_team = Counter()
+
+    def record(self, result):
+        self.battles += 1
+        if result.winner is None:
+            self.draws += 1
+        else:
+            self.wins[result.winner] += 1
+        self.total_turns += result.turns
+        self.damage_by_team.update(result.damage_by_team)
+
+    def summary(self, top=10):
+        """A line for the battles overall, then one per team, best first (the
+        top few only, for a free-for-all of hundreds).
+        """
+        lines = [
+            f"{self.battles} battles, {self.draws} draws, "
+            f"{self.total_turns / (self.battles or 1):.1f} turns on average"
+        ]
+        ranked = sorted(self.teams, key=lambda team: -self.wins[team])
+        for team in ranked[:top]:
+            lines.append(
+                f"  {team}: {self.wins[team] / (self.battles or 1):.1%} won, "
+                f"{self.damage_by_team[team] / (self.battles or 1):.1f} "
+                f"damage dealt on average"
+            )
+        if len(ranked) > top:
+            lines.append(f"  ...and {len(ranked) - top} more")
+        return "\n".join(lines)
+
+
+def simulate_battles(
+    teams,
+    battles,
+    copies=1,
+    policy=random_policy,
+    targeting=random_target,
+    max_turns=None,
+    seed=None,
+):
+    """Run a number of silent battles between the same teams (see line_up),
+    all drawing from one rng.Stream(seed), and return their BattleStats.
+    """
+    stats = BattleStats(team_names(teams))
+    previous_frontend = use_frontend(NullFrontend())
+    previous_rng = use_rng(Stream(seed))
+    try:
+        for _ in range(battles):
+            stats.record(
+                play_battle(
+                    line_up(teams, copies),
+                    policy=policy,
+                    targeting=targeting,
+                    max_turns=max_turns,
+                )
+            )
+    finally:
+        use_rng(previous_rng)
+        use_frontend(previous_frontend)
+    return stats
+
+
+def main():
+    roster = sorted(Roster())
+    parser = argparse.ArgumentParser(description="Magic Fight, everybody at once.")
+    sides = parser.add_mutually_exclusive_group(required=True)
+    sides.add_argument(
+        "--team",
+        nargs="+",
+        action="append",
+        choices=roster,
+        help="one team's fighters (give --team once per team)",
+    )
+    sides.add_argument(
+        "--free-for-all", nargs="+", choices=roster, help="everybody on their own"
+    )
+    parser.add_argument(
+        "--copies", type=int, default=1, help="of each fighter (on the same side)"
+    )
+    parser.add_argument("--battles", type=int, default=100)
+    parser.add_argument("--policy", default="random", choices=POLICIES)
+    parser.add_argument("--targeting", default="random", choices=TARGETING)
+    parser.add_argument("--max-turns", type=int)
+    parser.add_argument("--seed", help="for reproducible results")
+    parser.add_argument(
+        "--watch", action="store_true", help="narrate one battle, like a duel"
+    )
+    args = parser.parse_args()
+
+    if args.team:
+        teams = [(" + ".join(members), members) for members in args.team]
+        copies = args.copies
+    else:
+        # a team of one for every fighter, copies included (same names get
+        # numbered, see team_names)
+        teams = [
+            (name, [name]) for name in args.free_for_all for _ in range(args.copies)
+        ]
+        copies = 1
+
+    if args.watch:
+        use_rng(Stream(args.seed))
+        result = play_battle(
+            line_up(teams, copies),
+            policy=POLICIES[args.policy],
+            targeting=TARGETING[args.targeting],
+            max_turns=args.max_turns,
+        )
+        winner = str(result.winner or "nobody").title()
+        say(f"{winner} wins after {result.turns} turns!")
+        return
+
+    start = time.perf_counter()
+    stats = simulate_battles(
+        teams,
+        args.battles,
+        copies=copies,
+        policy=POLICIES[args.policy],
+        targeting=TARGETING[args.targeting],
+        max_turns=args.max_turns,
+        seed=args.seed,
+    )
+    elapsed = time.perf_counter() - start
+    print(stats.summary())
+    print(
+        f"{stats.total_turns} turns in {elapsed:.2f}s "
+        f"({1e6 * elapsed / (stats.total_turns or 1):.1f}µs per turn)"
+    )
+
+
+if __name__ == "__main__":
+    main()
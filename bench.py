@@ -0,0 +1,309 @@
+"""
+Benchmarks for the paths everything else leans on: building characters,
+starting a Game, the spell menu, hits, every special ability, and whole
+headless duels. Plain stdlib timing, no network, nothing to install.
+
+    python bench.py                          # time everything
+    python bench.py --save bench.json        # ...and keep it as the baseline
+    python bench.py --compare bench.json     # exit 1 if anything got slower
+    python bench.py --only ability           # just the cases matching this
+
+Each case is timed like timeit does it: enough operations to take at least
+--min-time seconds, repeated a few times, and the best run counts (the others
+just caught the machine doing something else). Baselines only mean anything
+on the machine and Python they were saved on, which gets saved with them.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+from character import Character, list_character_dirs, use_bundle
+from frontend import NullFrontend, use_frontend
+from game import Game
+from game_macros import CHARACTERS_DIR
+from rng import Stream, use_rng
+from simulation import simulate_matchup
+from special_abilities import SpecialAbility
+
+DEFAULT_MIN_TIME = 0.2
+DEFAULT_REPEAT = 5
+# how much slower than the baseline counts as a regression
+DEFAULT_TOLERANCE = 0.25
+# who fights in the headless duel case
+DUELISTS = ("nora", "winston")
+
+
+def all_forms(characters_dir=CHARACTERS_DIR):
+    """(name, namepath) for every roster entry and every form nested in one
+    (like nora/norm), the way special_abilities.py would name them.
+    """
+    forms = []
+    for directory in sorted(list_character_dirs(characters_dir)):
+        namepath = f"{characters_dir}/{directory}"
+        forms.append((directory.title(), namepath))
+        for nested in sorted(list_character_dirs(namepath)):
+            name = nested.replace("_", " ").title()
+            forms.append((name, f"{namepath}/{nested}"))
+    return forms
+
+
+## Cases: each takes a number of operations, does whatever setup it needs,
+## and returns how long just the operations took.
+
+
+def _character_case(name, namepath):
+    def case(ops):
+        start = time.perf_counter()
+        for _ in range(ops):
+            Character(name=name, special_namepath=namepath)
+        return time.perf_counter() - start
+
+    return case
+
+
+def character_cold(ops):
+    """Every form built with nothing cached, files read and all."""
+    forms = all_forms()
+    elapsed = 0.0
+    for idx in range(ops):
+        name, namepath = forms[idx % len(forms)]
+        # forgets every template
+        use_bundle(None)
+        start = time.perf_counter()
+        Character(name=name, special_namepath=namepath)
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def game_startup(ops):
+    start = time.perf_counter()
+    for _ in range(ops):
+        Game()
+    return time.perf_counter() - start
+
+
+def _game_with_everyone():
+    games = []
+    for name, namepath in all_forms():
+        game = Game()
+        game.player = Character(name=name, special_namepath=namepath)
+        game.opponent = Character(name=name, special_namepath=namepath)
+        games.append(game)
+    return games
+
+
+def spell_choices(ops):
+    games = _game_with_everyone()
+    start = time.perf_counter()
+    for idx in range(ops):
+        games[idx % len(games)]._construct_player_spell_choices()
+    return time.perf_counter() - start
+
+
+def hit(ops):
+    games = _game_with_everyone()
+    start = time.perf_counter()
+    for idx in range(ops):
+        game = games[idx % len(games)]
+        game.hit(game.opponent, "chaotic", 3)
+    return time.perf_counter() - start
+
+
+# effect -> who uses it, and whether they have to be drunk for it
+ABILITY_USERS = {
+    "change_to_norm": ("Nora", False),
+    "change_to_nora": ("Norm", False),
+    "change_to_meadow_sprite": ("Nora", False),
+    "potionify": ("Winston", False),
+    "attempt_sobering": ("Winston", True),
+    "orbs_of_disorderify": ("Winfield", False),
+}
+
+
+def _ability_case(effect):
+    name, drunk = ABILITY_USERS[effect]
+    namepath = dict(all_forms())[name]
+
+    def case(ops):
+        # abilities change both characters, so everybody is fresh
+        users = [
+            Character(name=name, special_namepath=namepath).become(drunk=drunk)
+            if drunk
+            else Character(name=name, special_namepath=namepath)
+            for _ in range(ops)
+        ]
+        targets = [Character(name="Bastion") for _ in range(ops)]
+        start = time.perf_counter()
+        for user, target in zip(users, targets):
+            SpecialAbility(player=user, opponent=target, effect=effect).perform(
+                is_computer=True
+            )
+        return time.perf_counter() - start
+
+    return case
+
+
+def headless_duel(ops):
+    start = time.perf_counter()
+    simulate_matchup(*DUELISTS, ops, seed=0)
+    return time.perf_counter() - start
+
+
+def cases():
+    """name -> case, in the order they get run."""
+    found = {}
+    for name, namepath in all_forms():
+        found[f"character/{namepath}"] = _character_case(name, namepath)
+    found["character/cold"] = character_cold
+    found["game/startup"] = game_startup
+    found["game/spell_choices"] = spell_choices
+    found["game/hit"] = hit
+    for effect in ABILITY_USERS:
+        found[f"ability/{effect}"] = _ability_case(effect)
+    found["duel/" + "_vs_".join(DUELISTS)] = headless_duel
+    return found
+
+
+## Timing
+
+
+def time_case(case, min_time=DEFAULT_MIN_TIME, repeat=DEFAULT_REPEAT):
+    """Seconds per operation, best of repeat runs of at least min_time each.
+    The garbage collector is off while timing, same as in timeit.
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        ops = 1
+        while True:
+            elapsed = case(ops)
+            if elapsed >= min_time:
+                break
+            # aim a bit past min_time, but never grow more than 10x at once
+            wanted = int(ops * 1.2 * min_time / (elapsed or 1e-9))
+            ops = max(ops + 1, min(ops * 10, wanted))
+        best = elapsed / ops
+        for _ in range(repeat - 1):
+            gc.collect()
+            best = min(best, case(ops) / ops)
+        return best
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def run(only=None, min_time=DEFAULT_MIN_TIME, repeat=DEFAULT_REPEAT):
+    """Time every case (whose name contains only, if given) with the game
+    silent and a fixed seed, printing each as it is done. Return dict of
+    name -> seconds per operation.
+    """
+    results = {}
+    previous_frontend = use_frontend(NullFrontend())
+    previous_rng = use_rng(Stream(0))
+    try:
+        for name, case in cases().items():
+            if only and only not in name:
+                continue
+            results[name] = time_case(case, min_time=min_time, repeat=repeat)
+            print(f"{name:45} {_format(results[name]):>12}")
+    finally:
+        use_rng(previous_rng)
+        use_frontend(previous_frontend)
+    return results
+
+
+def _format(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.2f}µs"
+    return f"{seconds * 1e3:.2f}ms"
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_baseline(path, results):
+    with open(path, "w") as baseline_fl:
+        json.dump(
+            {"environment": environment(), "seconds_per_op": results},
+            baseline_fl,
+            indent=2,
+            sort_keys=True,
+        )
+        baseline_fl.write("\n")
+
+
+def load_baseline(path):
+    with open(path) as baseline_fl:
+        return json.load(baseline_fl)
+
+
+def compare(baseline, results, tolerance=DEFAULT_TOLERANCE):
+    """Lines comparing results to a loaded baseline, and the names of the
+    cases that got more than tolerance slower.
+    """
+    lines = []
+    if baseline.get("environment") != environment():
+        lines.append(f"(baseline was saved on {baseline.get('environment')})")
+    before = baseline["seconds_per_op"]
+    regressions = []
+    for name, seconds in results.items():
+        if name not in before:
+            lines.append(f"{name:45} {_format(seconds):>12}   (new)")
+            continue
+        change = seconds / before[name] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  SLOWER"
+        lines.append(
+            f"{name:45} {_format(seconds):>12} {_format(before[name]):>12} "
+            f"{change:+8.1%}{flag}"
+        )
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time Magic Fight's hot paths.")
+    parser.add_argument("--only", help="just the cases with this in their name")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--save", metavar="JSON", help="save results as a baseline")
+    parser.add_argument(
+        "--compare", metavar="JSON", help="check results against a baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="how much slower counts as a regression (0.25 is 25%%)",
+    )
+    args = parser.parse_args()
+
+    results = run(only=args.only, min_time=args.min_time, repeat=args.repeat)
+    if args.save:
+        save_baseline(args.save, results)
+    if args.compare:
+        lines, regressions = compare(
+            load_baseline(args.compare), results, tolerance=args.tolerance
+        )
+        print(f"{'case':45} {'now':>12} {'baseline':>12} {'change':>8}")
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} slower than the baseline allows")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
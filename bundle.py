@@ -0,0 +1,158 @@
+"""
+Pack the whole characters/ tree (nested forms like nora/norm included) into
+one file, and read it back through mmap.
+
+    python bundle.py build                 # writes characters.bundle
+    python bundle.py build --out my.bundle
+
+Layout of a bundle file:
+
+    header  MAGIC, then index length and format version as two little-endian
+            uint32s
+    index   UTF-8 JSON: {"files": {path: [offset, length]}, "dirs": {path: [names]}}
+            (paths exactly as the game spells them, e.g. "characters/nora/magic.json")
+    blobs   every file's contents back to back (JSON re-dumped compactly)
+
+Nothing past the index gets decoded until a character template asks for that
+particular file.
+
+The game only reads from a bundle when asked to (--bundle), and says so if
+anything under characters/ has changed since it was built. Anything outside
+the packed directory (community packs, say) is still read from plain files.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+
+from game_macros import CHARACTERS_BUNDLE, CHARACTERS_DIR
+
+MAGIC = b"MFBUNDLE"
+VERSION = 1
+_HEADER = struct.Struct("<8sII")
+
+
+def _compact(filepath):
+    with open(filepath, "r") as fl:
+        if filepath.endswith("json"):
+            return json.dumps(
+                json.load(fl), ensure_ascii=False, separators=(",", ":")
+            ).encode("utf-8")
+        return fl.read().encode("utf-8")
+
+
+def build_bundle(out_path=CHARACTERS_BUNDLE, characters_dir=CHARACTERS_DIR):
+    """Pack every .txt and .json file under characters_dir into out_path."""
+    files = {}
+    dirs = {}
+    blobs = []
+    offset = 0
+
+    for dirpath, dirnames, filenames in os.walk(characters_dir):
+        dirnames.sort()
+        dirpath = dirpath.replace(os.sep, "/")
+        dirs[dirpath] = list(dirnames)
+        for filename in sorted(filenames):
+            if not filename.endswith(("txt", "json")):
+                continue
+            blob = _compact(os.path.join(dirpath, filename))
+            files[f"{dirpath}/{filename}"] = [offset, len(blob)]
+            blobs.append(blob)
+            offset += len(blob)
+
+    index = json.dumps({"files": files, "dirs": dirs}, separators=(",", ":"))
+    index = index.encode("utf-8")
+    with open(out_path, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, len(index), VERSION))
+        out.write(index)
+        for blob in blobs:
+            out.write(blob)
+
+    return out_path
+
+
+def is_stale(path=CHARACTERS_BUNDLE, characters_dir=CHARACTERS_DIR):
+    """Whether anything under characters_dir is newer than the bundle at path
+    (so the bundle is missing changes).
+    """
+    built = os.stat(path).st_mtime_ns
+    for dirpath, _, filenames in os.walk(characters_dir):
+        if os.stat(dirpath).st_mtime_ns > built:
+            return True
+        for filename in filenames:
+            if os.stat(os.path.join(dirpath, filename)).st_mtime_ns > built:
+                return True
+    return False
+
+
+def open_bundle(path=CHARACTERS_BUNDLE, characters_dir=CHARACTERS_DIR):
+    """A CharacterBundle for --bundle, with a warning if it's out of date."""
+    if is_stale(path, characters_dir):
+        print(
+            f"Warning: {characters_dir}/ has changed since {path} was built; "
+            f"run `python bundle.py build` to bring it up to date."
+        )
+    return CharacterBundle(path)
+
+
+class CharacterBundle:
+    """Read-only view of a bundle file, mapped into memory."""
+
+    def __init__(self, path=CHARACTERS_BUNDLE):
+        self.path = path
+        with open(path, "rb") as fl:
+            self._mmap = mmap.mmap(fl.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, index_length, version = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a version {VERSION} character bundle: {path}")
+
+        index_start = _HEADER.size
+        index = json.loads(self._mmap[index_start : index_start + index_length])
+        self._files = index["files"]
+        self._dirs = index["dirs"]
+        # os.walk put the packed directory itself first
+        self.root = next(iter(self._dirs), None)
+        self._blobs_start = index_start + index_length
+
+    def covers(self, path):
+        """Whether path is the packed directory or anywhere under it."""
+        return self.root is not None and (
+            path.rstrip("/") == self.root or path.startswith(f"{self.root}/")
+        )
+
+    def exists(self, filepath):
+        return filepath in self._files
+
+    def read(self, filepath):
+        """Return the text of the packed file, or None if it was not packed."""
+        location = self._files.get(filepath)
+        if location is None:
+            return None
+        offset, length = location
+        start = self._blobs_start + offset
+        return self._mmap[start : start + length].decode("utf-8")
+
+    def listdir(self, dirpath):
+        """Names of the subdirectories packed under dirpath."""
+        return self._dirs.get(dirpath.rstrip("/"), [])
+
+    def close(self):
+        self._mmap.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Magic Fight bundle.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--out", default=CHARACTERS_BUNDLE)
+    parser.add_argument("--characters-dir", default=CHARACTERS_DIR)
+    args = parser.parse_args()
+
+    path = build_bundle(args.out, args.characters_dir)
+    print(f"Packed {args.characters_dir}/ into {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
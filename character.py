@@ -1,15 +1,240 @@
 import json
 import os
-import random
-import time
+from functools import cached_property
+from types import MappingProxyType
 
+from effects import Effect, EffectScheduler
 from game_macros import (
     CHARACTERS_DIR,
     GAME_LIFE,
     SpecialChoice,
     SpellChoice,
     did_it_happen,
+    freeze,
+    pause,
+    say,
 )
+from rng import current_rng
+
+
+# namepath -> CharacterTemplate, shared by every Character in the process.
+# Never changed in place once content gets reloaded: publish_templates swaps
+# in a whole new dict, and characters made earlier keep the one they had.
+_templates = {}
+# string -> the same string reversed, which is how the drunk see things
+_drunken = {}
+# Where character files come from: plain files, unless a compiled bundle (see
+# bundle.py) has been switched on with use_bundle() and they're packed in it.
+_bundle = None
+
+
+def use_bundle(bundle):
+    """Load character data packed in the given CharacterBundle from it from
+    now on (or from plain files again, if bundle is None).
+    """
+    global _bundle
+    _bundle = bundle
+    publish_templates({})
+
+
+def publish_templates(templates):
+    """Make templates (namepath -> CharacterTemplate) the ones every new
+    Character gets from now on, all at once (see content.py). Characters
+    that already exist keep theirs, shapeshifts and all.
+    """
+    global _templates
+    _templates = templates
+
+
+def list_character_dirs(characters_dir):
+    """Names of the character directories in characters_dir (from the bundle,
+    if one is on and characters_dir is packed in it).
+    """
+    if _bundle is not None and _bundle.covers(characters_dir):
+        return list(_bundle.listdir(characters_dir))
+    with os.scandir(characters_dir) as entries:
+        return [entry.name for entry in entries if entry.is_dir()]
+
+
+def list_namepaths(characters_dir):
+    """Every character directory under characters_dir, nested forms (like
+    nora/norm) included, each right after whoever it's nested in.
+    """
+    for name in list_character_dirs(characters_dir):
+        namepath = f"{characters_dir}/{name}"
+        yield namepath
+        yield from list_namepaths(namepath)
+
+
+def _read_raw(filepath):
+    if _bundle is not None and _bundle.covers(filepath):
+        return _bundle.read(filepath)
+    if os.path.exists(filepath):
+        with open(filepath, "r") as attr_fl:
+            return attr_fl.read()
+    return None
+
+
+def drunken(string):
+    """The string reversed, worked out once per string and then remembered."""
+    reversed_string = _drunken.get(string)
+    if reversed_string is None:
+        reversed_string = _drunken[string] = string[::-1]
+    return reversed_string
+
+
+def _drunken_lines(info, key):
+    """info (taunts or reactions) with its list of lines under key reversed."""
+    if info is None:
+        return None
+    return MappingProxyType({**info, key: tuple(map(drunken, info[key]))})
+
+
+def _read_character_file(
+    attr,
+    filepath,
+    strip=False,
+    allow_empty=False,
+    empty_val=None,
+):
+    """
+    Read character data from a file, or return empty_val if file does not exist.
+
+    If strip is true, well...do strip() to get rid of whitespace on the ends.
+    JSON data comes back frozen (see game_macros.freeze), since it gets shared.
+    """
+    raw = _read_raw(filepath)
+    if raw is not None:
+        if filepath.endswith("txt"):
+            val = raw.strip() if strip else raw
+        elif filepath.endswith("json"):
+            val = json.loads(raw)
+        else:
+            raise ValueError(f"Unsupported filetype at the moment: {filepath}")
+        return freeze(val)
+    elif allow_empty:
+        return freeze(empty_val)
+    else:
+        raise FileNotFoundError(
+            f"Could not set {attr}! Expected file not found: {filepath}"
+        )
+
+
+class CharacterTemplate:
+    """Parsed, read-only data for the character at namepath. Each file is only
+    read the first time somebody asks for its field (so just browsing bios in
+    the character menu never touches anyone's magic.json), and never again.
+    """
+
+    def __init__(self, namepath):
+        self.namepath = namepath
+
+    def load(self):
+        """Read every file now instead of whenever it's first asked for, so
+        the template is all of a piece even if the files change later.
+        """
+        for field in (
+            "bio",
+            "ascii_art",
+            "drunk_magic_info",
+            "drunk_taunts",
+            "drunk_reactions",
+            "special_abilities_info",
+            "drunk_special_abilities_info",
+        ):
+            getattr(self, field)
+        return self
+
+    @cached_property
+    def bio(self):
+        # a short description of the character
+        return _read_character_file("bio", f"{self.namepath}/bio.txt", strip=True)
+
+    @cached_property
+    def ascii_art(self):
+        # this game has ✨ advanced graphics ✨
+        return _read_character_file(
+            "ascii_art",
+            f"{self.namepath}/ascii_art.txt",
+            strip=True,
+            allow_empty=True,
+            empty_val="",
+        )
+
+    @cached_property
+    def magic_info(self):
+        return _read_character_file("magic_info", f"{self.namepath}/magic.json")
+
+    @cached_property
+    def drunk_magic_info(self):
+        # same magic, every spell description upside down (amounts and takes
+        # are shared with magic_info)
+        magic_info = self.magic_info
+        deals = {
+            dimension: MappingProxyType(
+                {**info, "spells": tuple(map(drunken, info["spells"]))}
+            )
+            for dimension, info in magic_info["deals"].items()
+        }
+        return MappingProxyType({**magic_info, "deals": MappingProxyType(deals)})
+
+    @cached_property
+    def taunts(self):
+        return _read_character_file(
+            "taunts", f"{self.namepath}/taunts.json", allow_empty=True
+        )
+
+    @cached_property
+    def reactions(self):
+        return _read_character_file(
+            "reactions", f"{self.namepath}/reactions.json", allow_empty=True
+        )
+
+    @cached_property
+    def drunk_taunts(self):
+        return _drunken_lines(self.taunts, "taunts")
+
+    @cached_property
+    def drunk_reactions(self):
+        return _drunken_lines(self.reactions, "reactions")
+
+    @cached_property
+    def special_abilities_info(self):
+        return _read_character_file(
+            "special_abilities_info",
+            f"{self.namepath}/special.json",
+            allow_empty=True,
+            empty_val={},
+        )
+
+    @cached_property
+    def drunk_special_abilities_info(self):
+        return _read_character_file(
+            "special_abilities_info",
+            f"{self.namepath}/drunk_special.json",
+            allow_empty=True,
+            empty_val={},
+        )
+
+
+def get_template(namepath, templates=None):
+    """Return the parsed, read-only data for the character at namepath, going
+    to disk only the first time anyone asks for any given piece of it. From
+    the templates in use, unless given some other (earlier) ones.
+    """
+    if templates is None:
+        templates = _templates
+    template = templates.get(namepath)
+    if template is None:
+        template = templates[namepath] = CharacterTemplate(namepath)
+    return template
+
+
+def is_latest(character):
+    """Whether the character's data is the latest published (it's not if the
+    content got reloaded since they were made).
+    """
+    return _templates.get(character.namepath) is character._template
 
 
 class Character:
@@ -19,125 +244,147 @@ class Character:
         self.name = name
         # how to get to the files (because shapeshifters)
         self.namepath = special_namepath or f"{CHARACTERS_DIR}/{name.lower()}"
-        # countdown of turns left by character causing effect. naming is hard.
-        self.affected_by_character_turns_left = {}
+        # lingering effects from other characters, and when they wear off
+        self.effects = EffectScheduler()
+        # only ever true for somebody who has been at the potions
+        self.drunk = False
 
-        # a short description of the character
-        self._set_bio()
-        # this game has ✨ advanced graphics ✨
-        self._set_ascii_art()
+        # Everything below is shared with every other character made from
+        # the same files. Whatever happens to a character (potions, orbs...)
+        # just swaps in different shared data, or lays a few changes over it.
+        # Shapeshifts come from the same templates too, even once newer ones
+        # are published, so a duel never mixes versions.
+        self._templates = _templates
+        self._template = get_template(self.namepath, self._templates)
         self._set_magic_info()
         self._set_taunts()
         self._set_reactions()
         self._set_special_abilities()
 
-    def _set_attr_from_file(
-        self,
-        attr,
-        filepath,
-        strip=False,
-        allow_empty=False,
-        empty_val=None,
-    ):
-        """
-        Read and set character data from a file, and set the character attribute
-        to empty_val if file does not exist.
+    @property
+    def bio(self):
+        return self._template.bio
 
-        If strip is true, well...do strip() to get rid of whitespace on the ends.
-        """
-        if os.path.exists(filepath):
-            with open(filepath, "r") as attr_fl:
-                if filepath.endswith("txt"):
-                    val = attr_fl.read()
-                    if strip:
-                        val = val.strip()
-                elif filepath.endswith("json"):
-                    val = json.load(attr_fl)
-                else:
-                    raise ValueError(f"Unsupported filetype at the moment: {filepath}")
-            setattr(self, attr, val)
-        elif allow_empty:
-            setattr(self, attr, empty_val)
-        else:
-            raise FileNotFoundError(
-                f"Could not set {attr}! Expected file not found: {filepath}"
-            )
-
-    def _set_bio(self):
-        self._set_attr_from_file(
-            attr="bio",
-            filepath=f"{self.namepath}/bio.txt",
-            strip=True,
-        )
-
-    def _set_ascii_art(self):
-        self._set_attr_from_file(
-            attr="ascii_art",
-            filepath=f"{self.namepath}/ascii_art.txt",
-            strip=True,
-            allow_empty=True,
-            empty_val="",
-        )
+    @property
+    def ascii_art(self):
+        return self._template.ascii_art
 
     def _set_magic_info(self):
-        self._set_attr_from_file(
-            attr="magic_info",
-            filepath=f"{self.namepath}/magic.json",
+        template = self._template
+        self.magic_info = (
+            template.drunk_magic_info if self.drunk else template.magic_info
         )
+        # then whatever the effects still on have changed, in the order they came
+        for effect in self.effects:
+            if effect.deal_sources:
+                self.move_deal_amounts(effect.deal_sources)
 
     def _set_taunts(self):
-        self._set_attr_from_file(
-            attr="taunts",
-            filepath=f"{self.namepath}/taunts.json",
-            allow_empty=True,
-            empty_val=None,
-        )
+        template = self._template
+        self.taunts = template.drunk_taunts if self.drunk else template.taunts
 
     def _set_reactions(self):
-        self._set_attr_from_file(
-            attr="reactions",
-            filepath=f"{self.namepath}/reactions.json",
-            allow_empty=True,
-            empty_val=None,
+        template = self._template
+        self.reactions = (
+            template.drunk_reactions if self.drunk else template.reactions
         )
 
-    def _set_special_abilities(self, special_path=None):
-        self._set_attr_from_file(
-            attr="special_abilities_info",
-            filepath=special_path or f"{self.namepath}/special.json",
-            allow_empty=True,
-            empty_val={},
+    def _set_special_abilities(self):
+        self.special_abilities_info = (
+            self._template.drunk_special_abilities_info
+            if self.drunk
+            else self._template.special_abilities_info
+        )
+
+    def become(self, name=None, special_namepath=None, drunk=False):
+        """Turn into someone else (shapeshifters) and/or get drunk or sober,
+        in place. Life carries over; everything else is as fresh as a new
+        Character's would be, lingering effects included (there are none).
+        """
+        if name is not None:
+            self.name = name
+            self.namepath = special_namepath or f"{CHARACTERS_DIR}/{name.lower()}"
+            self._template = get_template(self.namepath, self._templates)
+        self.drunk = drunk
+        self.effects.clear()
+        self._set_magic_info()
+        self._set_taunts()
+        self._set_reactions()
+        self._set_special_abilities()
+        return self
+
+    def add_effect(self, source, name, turns, deal_sources=None):
+        """Put a lingering effect from source on for this character's next
+        turns turns, moving deal amounts around (dimension -> the dimension
+        whose current amount it gets) until it wears off.
+        """
+        effect = Effect(source, name, deal_sources)
+        replaced = self.effects.add(effect, turns)
+        if replaced is None or not replaced.deal_sources:
+            if deal_sources:
+                self.move_deal_amounts(deal_sources)
+            return
+        # The same source's same effect again takes over from the old one,
+        # starting from what the old one had done (the new one's sources were
+        # picked from that), so it carries both changes and wearing off
+        # undoes both.
+        if deal_sources:
+            effect.deal_sources = {}
+            for dimension in {**replaced.deal_sources, **deal_sources}:
+                moved = deal_sources.get(dimension, dimension)
+                effect.deal_sources[dimension] = replaced.deal_sources.get(moved, moved)
+        self._set_magic_info()
+
+    def move_deal_amounts(self, sources):
+        """Lay moved deal amounts (dimension -> the dimension whose current
+        amount it gets) over the current magic; spells and takes stay shared.
+        """
+        current = self.magic_info["deals"]
+        deals = {
+            dimension: MappingProxyType(
+                {**info, "amount": current[sources[dimension]]["amount"]}
+            )
+            if dimension in sources
+            else info
+            for dimension, info in current.items()
+        }
+        self.magic_info = MappingProxyType(
+            {**self.magic_info, "deals": MappingProxyType(deals)}
         )
 
     def print_life(self):
-        print(f'{self.name}: {"+"*self.life}({self.life} sparks left)')
+        say(f'{self.name}: {"+"*self.life}({self.life} sparks left)')
 
     def possibly_taunt(self):
         """Depending on their percent chance of doing so and whether they actually have taunts,
         (some characters are nicer), pick and say a random taunt.
         """
         if self.taunts is not None and did_it_happen(self.taunts["chance"]):
-            print(f'{self.name} says: {random.choice(self.taunts["taunts"])}\n')
-            time.sleep(1)
+            say(f'{self.name} says: {current_rng().choice(self.taunts["taunts"])}\n')
+            pause(1)
 
     def possibly_react(self):
         """If character can verbally react to a hit (some are more vocal),
         do so based on their chance.
         """
         if self.reactions is not None and did_it_happen(self.reactions["chance"]):
-            print(
-                f"{self.name} says: " f'{random.choice(self.reactions["reactions"])}\n'
-            )
-            time.sleep(1)
+            reaction = current_rng().choice(self.reactions["reactions"])
+            say(f"{self.name} says: {reaction}\n")
+            pause(1)
+
+    def reset(self, opponent_name, is_computer=False, onlooker=False):
+        """Announce that an effect from opponent_name wore off, and undo what
+        it did: magic goes back to the shared template data (drunk or sober as
+        the case may be), with only the effects still on laid over it.
 
-    def reset(self, opponent_name, is_computer=False):
-        # for now broad blind reset; later more specific how (and if) based
-        # on character and status of same affected areas from other characters
+        onlooker is for when nobody in particular is "you" (see battle.py).
+        """
         self._set_magic_info()
-        self._set_taunts()
-        self._set_reactions()
 
         affected_phrase = f"{self.name} has" if is_computer else "You have"
         affector_phrase = "your" if is_computer else f"{opponent_name}'s"
-        print(f"{affected_phrase} recovered from {affector_phrase} magical effect!\n")
-        time.sleep(1)
+        if onlooker:
+            affected_phrase = f"{self.name} has"
+            affector_phrase = f"{opponent_name}'s"
+        say(f"{affected_phrase} recovered from {affector_phrase} magical effect!\n")
+        pause(1)
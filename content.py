@@ -0,0 +1,136 @@
+"""
+Picking up changes to the character files without a restart.
+
+A ContentWatcher keeps the mtime and size of every file a character is made
+from, for every form under its directories. Each poll() stats them all, and
+only the forms whose files changed (or that are new, or gone) get read again:
+into fresh CharacterTemplates, read in full right away, checked like they
+would be anyway (magic.json as in balance.py, special abilities as in
+special_abilities.py). Whatever checks out gets published all at once (see
+character.publish_templates): new Characters, so new duels, get the new
+version, and anybody already made keeps the version they were made from until
+their duel is over. A form that doesn't check out keeps its old version, and
+the watcher says what's wrong with it.
+
+    watcher = ContentWatcher()
+    watcher.poll()      # -> namepaths reloaded this time
+
+The server polls every --watch-content seconds. With a bundle in use, there
+are no files to watch, and poll() does nothing.
+"""
+
+import os
+
+import balance
+import character
+from balance import validate_magic_info
+from character import CharacterTemplate, list_namepaths, publish_templates
+from game_macros import CHARACTERS_DIR
+from special_abilities import special_ability_problems
+
+# everything a CharacterTemplate reads
+WATCHED_FILES = (
+    "magic.json",
+    "taunts.json",
+    "reactions.json",
+    "special.json",
+    "drunk_special.json",
+    "bio.txt",
+    "ascii_art.txt",
+)
+
+
+def _stamps(namepath):
+    """(mtime_ns, size) of each watched file, None where it doesn't exist."""
+    stamps = []
+    for filename in WATCHED_FILES:
+        try:
+            stat = os.stat(f"{namepath}/{filename}")
+        except OSError:
+            stamps.append(None)
+        else:
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+class ContentWatcher:
+    def __init__(self, characters_dirs=(CHARACTERS_DIR,), report=print):
+        self.characters_dirs = tuple(characters_dirs)
+        self.report = report
+        # namepath -> _stamps as of the version in use
+        self.stamps = {}
+        # namepath -> _stamps of files that didn't check out (said once)
+        self.rejected = {}
+        # how many times new content has been published
+        self.version = 0
+        for characters_dir in self.characters_dirs:
+            for namepath in list_namepaths(characters_dir):
+                self.stamps[namepath] = _stamps(namepath)
+
+    def changed(self):
+        """Namepaths whose files changed since the version in use (new forms
+        included), and the ones that are gone.
+        """
+        changed = {}
+        seen = set()
+        for characters_dir in self.characters_dirs:
+            for namepath in list_namepaths(characters_dir):
+                seen.add(namepath)
+                stamps = _stamps(namepath)
+                if stamps != self.stamps.get(namepath):
+                    changed[namepath] = stamps
+        return changed, set(self.stamps) - seen
+
+    def _load(self, namepath):
+        """A fully read template for namepath, and what's wrong with it."""
+        template = CharacterTemplate(namepath)
+        try:
+            template.load()
+        except (OSError, ValueError) as exc:
+            return template, [f"{namepath}: {exc}"]
+        problems = validate_magic_info(template.magic_info, f"{namepath}/magic.json")
+        return template, problems + special_ability_problems(template)
+
+    def poll(self):
+        """Reload whatever changed, publish it, and return the namepaths that
+        got a new version (or got dropped).
+        """
+        if character._bundle is not None:
+            return set()
+        changed, removed = self.changed()
+        if not changed and not removed:
+            return set()
+
+        templates = dict(character._templates)
+        reloaded = set()
+        for namepath, stamps in changed.items():
+            if self.rejected.get(namepath) == stamps:
+                continue
+            template, problems = self._load(namepath)
+            if problems:
+                self.report(
+                    f"Not reloading {namepath}:\n  " + "\n  ".join(problems)
+                )
+                self.rejected[namepath] = stamps
+                continue
+            self.rejected.pop(namepath, None)
+            templates[namepath] = template
+            self.stamps[namepath] = stamps
+            reloaded.add(namepath)
+        for namepath in removed:
+            templates.pop(namepath, None)
+            del self.stamps[namepath]
+            reloaded.add(namepath)
+        if not reloaded:
+            return reloaded
+
+        publish_templates(templates)
+        # anything the balance index says is worked out from the templates,
+        # and gets worked out again from the new ones when next asked for
+        balance.balance_index().forget(reloaded)
+        self.version += 1
+        self.report(
+            f"Content version {self.version}: reloaded "
+            + ", ".join(sorted(reloaded))
+        )
+        return reloaded
@@ -0,0 +1,145 @@
+"""
+The roster's damage model, compiled into flat arrays: the one place hit
+amounts get worked out ahead of time.
+
+Every magic_info has the same shape: the six DIMENSIONS, each with a "deals"
+amount (plus spells) and a "takes" amount. DamageTable lines those up as rows
+of six small ints per form, and works Game.hit's rule, min(takes, max_hit),
+out for every attacker x defender x dimension at once. balance.py builds its
+matchup table from one over the whole roster, and slim.py looks its duels'
+spell hits up in one over both sides' forms.
+
+All plain Python and the array module. Still no dependencies!
+
+    python damage.py    # best hit of every form against every other form
+"""
+
+import argparse
+from array import array
+
+from character import get_template, list_namepaths
+from game_macros import CHARACTERS_DIR, DIMENSIONS
+
+N_DIMENSIONS = len(DIMENSIONS)
+
+
+def roster_namepaths(characters_dirs=(CHARACTERS_DIR,)):
+    """Namepaths of every character plus every nested form (nora/norm, ...),
+    however deep.
+    """
+    namepaths = []
+    for characters_dir in characters_dirs:
+        namepaths.extend(sorted(list_namepaths(characters_dir)))
+    return namepaths
+
+
+def magic_vectors(magic_info):
+    """Return (deals, takes, able) for one magic_info, as arrays of six in
+    DIMENSIONS order. able is 1 wherever there are spells to cast.
+    """
+    deals, takes = magic_info["deals"], magic_info["takes"]
+    return (
+        array("h", (deals[dim]["amount"] for dim in DIMENSIONS)),
+        array("h", (takes[dim]["amount"] for dim in DIMENSIONS)),
+        array("b", (1 if deals[dim]["spells"] else 0 for dim in DIMENSIONS)),
+    )
+
+
+def reach(deals, able):
+    """The most an attacker can land in each dimension: what they deal, or 0
+    where they have no spells to cast.
+    """
+    return array("h", (deal if can else 0 for deal, can in zip(deals, able)))
+
+
+def hit_row(attack, takes):
+    """Game.hit's rule, min(takes, max_hit), in all six dimensions at once,
+    for an attacker's reach (see above) against a defender's takes.
+    """
+    return map(min, takes, attack)
+
+
+class DamageTable:
+    """Dense deals/takes/able arrays for a list of forms (namepaths), six
+    entries per form, plus the attacker x defender x dimension hit tensor.
+    The forms' (deals, takes, able) come from their templates, unless given
+    (vectors, in the same order as namepaths).
+    """
+
+    def __init__(self, namepaths=None, vectors=None):
+        self.namepaths = list(namepaths or roster_namepaths())
+        self.index = {namepath: idx for idx, namepath in enumerate(self.namepaths)}
+        if vectors is None:
+            vectors = (
+                magic_vectors(get_template(namepath).magic_info)
+                for namepath in self.namepaths
+            )
+        # "h", not "b": amounts past 127 are rare, but allowed in magic.json
+        self.deals = array("h")
+        self.takes = array("h")
+        self.able = array("b")
+        for deals, takes, able in vectors:
+            self.deals.extend(deals)
+            self.takes.extend(takes)
+            self.able.extend(able)
+        self._tensor = None
+
+    def __len__(self):
+        return len(self.namepaths)
+
+    def row(self, values, idx):
+        return values[idx * N_DIMENSIONS : (idx + 1) * N_DIMENSIONS]
+
+    @property
+    def tensor(self):
+        """Flat array where the hit attacker a lands on defender d with
+        dimension k sits at (a * len(self) + d) * 6 + k. It is zero for
+        dimensions the attacker has no spells in.
+        """
+        if self._tensor is None:
+            takes_rows = [self.row(self.takes, idx) for idx in range(len(self))]
+            tensor = array("h")
+            for attacker in range(len(self)):
+                attack = reach(
+                    self.row(self.deals, attacker), self.row(self.able, attacker)
+                )
+                for takes in takes_rows:
+                    tensor.extend(hit_row(attack, takes))
+            self._tensor = tensor
+        return self._tensor
+
+    def hits(self, attacker, defender):
+        """The six hits attacker (index) would land on defender (index)."""
+        start = (attacker * len(self) + defender) * N_DIMENSIONS
+        return self.tensor[start : start + N_DIMENSIONS]
+
+    def best_hit(self, attacker, defender):
+        return max(self.hits(attacker, defender))
+
+
+def format_best_hits(table):
+    names = [namepath.split("/", 1)[-1] for namepath in table.namepaths]
+    width = max(len(name) for name in names) + 2
+    lines = [
+        "best hit (rows: attacker, columns: defender)",
+        " " * width + "".join(name.rsplit("/")[-1][:6].rjust(7) for name in names),
+    ]
+    for attacker, name in enumerate(names):
+        lines.append(
+            name.ljust(width)
+            + "".join(
+                str(table.best_hit(attacker, defender)).rjust(7)
+                for defender in range(len(table))
+            )
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the roster damage tensor.")
+    parser.parse_args()
+    print(format_best_hits(DamageTable()))
+
+
+if __name__ == "__main__":
+    main()
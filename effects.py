@@ -0,0 +1,92 @@
+"""
+Lingering effects (the Orbs of Disorder, so far) and when they wear off.
+
+Every Character has an EffectScheduler. An effect lasts for a number of the
+affected character's own turns. The scheduler keeps its effects in a heap by
+the turn they run out on, so ending a turn only looks at the ones that are
+actually due: O(log n) per effect that wears off, and nothing at all for the
+rest. Each Effect records exactly what it changed, relative to whatever was
+underneath it (which dimension's deal amount went where, say, rather than the
+amounts that came out), so taking it off undoes that and nothing else, however
+many effects from however many sources overlap: the character's magic is the
+template's, with the changes of the effects still on laid over it in order.
+"""
+
+import heapq
+from itertools import count
+
+
+class Effect:
+    __slots__ = ("source", "name", "deal_sources", "expires_at", "active")
+
+    def __init__(self, source, name, deal_sources=None):
+        # the Character who caused it
+        self.source = source
+        # what it is, e.g. the special ability effect ("orbs_of_disorderify")
+        self.name = name
+        # dimension -> the dimension whose deal amount (as it was underneath
+        # this effect) it gets instead; None if it leaves deals alone
+        self.deal_sources = deal_sources
+        # turn of the affected character's that it wears off at (the scheduler's)
+        self.expires_at = None
+        self.active = False
+
+
+class EffectScheduler:
+    def __init__(self):
+        # how many of their turns the affected character has finished
+        self.turns_ended = 0
+        # (expires_at, tiebreak, Effect); replaced effects stay behind,
+        # inactive, until they reach the top
+        self._heap = []
+        self._tiebreak = count()
+        # (source, name) -> active Effect, in the order they went on
+        self._active = {}
+
+    def add(self, effect, turns):
+        """Put effect on for the next turns turns. The same source using the
+        same effect again replaces the old one (and its timer), which gets
+        returned.
+        """
+        key = (effect.source, effect.name)
+        replaced = self._active.pop(key, None)
+        if replaced is not None:
+            replaced.active = False
+        effect.expires_at = self.turns_ended + turns
+        effect.active = True
+        self._active[key] = effect
+        heapq.heappush(self._heap, (effect.expires_at, next(self._tiebreak), effect))
+        return replaced
+
+    def wear_down(self):
+        """Count one more turn ended, and return the effects that ran out."""
+        self.turns_ended += 1
+        expired = []
+        heap = self._heap
+        while heap and heap[0][0] <= self.turns_ended:
+            effect = heapq.heappop(heap)[2]
+            if effect.active:
+                effect.active = False
+                del self._active[(effect.source, effect.name)]
+                expired.append(effect)
+        return expired
+
+    def turns_left(self):
+        """Turns until the last active effect wears off (0 if there are none)."""
+        if not self._active:
+            return 0
+        last = max(effect.expires_at for effect in self._active.values())
+        return last - self.turns_ended
+
+    def clear(self):
+        for effect in self._active.values():
+            effect.active = False
+        self._active.clear()
+        self._heap.clear()
+
+    def __iter__(self):
+        """The active effects, oldest first."""
+        return iter(self._active.values())
+
+    def __len__(self):
+        return len(self._active)
@@ -0,0 +1,100 @@
+"""
+What happened in a duel, as a list of typed events, and an append-only log to
+keep them in.
+
+A log file is JSON Lines: one compact array per event, its type first, e.g.
+
+    ["DuelStarted",8812734,false,"Nora","characters/nora","Winston",...]
+    ["Move",1,"player","spell","dark",3]
+    ["Damage",1,"opponent","dark",2,13]
+
+Every duel starts with its DuelStarted, so a log can hold as many duels as
+anyone cares to append to it. See replay.py for playing them back.
+"""
+
+import json
+from collections import namedtuple
+
+# The seed of the duel's random stream (and whether it was an rng.BatchedStream),
+# and who is fighting (names as shown, namepaths as loaded).
+DuelStarted = namedtuple(
+    "DuelStarted",
+    ["seed", "batched", "player", "player_namepath", "opponent", "opponent_namepath"],
+)
+# side is "player" or "opponent"; kind is "spell" (value is the dimension, hit
+# the most it can do) or "special" (value is the effect, hit is 0)
+Move = namedtuple("Move", ["turn", "side", "kind", "value", "hit"])
+# side took amount of dimension damage, and has life left
+Damage = namedtuple("Damage", ["turn", "side", "dimension", "amount", "life"])
+# who everyone is once side's special ability is done with them
+SpecialEffect = namedtuple(
+    "SpecialEffect",
+    ["turn", "side", "effect", "player_namepath", "opponent_namepath"],
+)
+# side is back to normal after whatever caused_by (a name) did to them
+EffectExpired = namedtuple("EffectExpired", ["turn", "side", "caused_by"])
+DuelEnded = namedtuple("DuelEnded", ["turn", "winner", "player_life", "opponent_life"])
+
+EVENT_TYPES = {
+    event_type.__name__: event_type
+    for event_type in (
+        DuelStarted,
+        Move,
+        Damage,
+        SpecialEffect,
+        EffectExpired,
+        DuelEnded,
+    )
+}
+
+
+def encode_event(event):
+    return json.dumps(
+        [type(event).__name__, *event], ensure_ascii=False, separators=(",", ":")
+    )
+
+
+def decode_event(line):
+    event_type, *fields = json.loads(line)
+    return EVENT_TYPES[event_type](*fields)
+
+
+class EventLog:
+    """Where a Game sends its events. With a path, they are appended to that
+    file (and flushed at the end of every duel); without one, they are just
+    kept in self.events.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.events = []
+        self._file = None if path is None else open(path, "a", encoding="utf-8")
+
+    def record(self, event):
+        if self._file is None:
+            self.events.append(event)
+            return
+        self._file.write(encode_event(event) + "\n")
+        if isinstance(event, DuelEnded):
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def read_events(path):
+    with open(path, "r", encoding="utf-8") as fl:
+        for line in fl:
+            if line.strip():
+                yield decode_event(line)
+
+
+def split_duels(events):
+    """Group a stream of events into one list per duel."""
+    duels = []
+    for event in events:
+        if isinstance(event, DuelStarted) or not duels:
+            duels.append([])
+        duels[-1].append(event)
+    return duels
@@ -0,0 +1,189 @@
+"""
+Frontends: where everything the game says goes, and where the player's answers
+come from.
+
+Nothing in the game prints, sleeps or reads input by itself. It all goes
+through game_macros.say/pause/get_input_choice/confirm_input_choice, which hand
+it to the frontend in use right now:
+
+    TerminalFrontend   print, time.sleep and input(), like always (the default)
+    NullFrontend       says nothing, waits for nothing, picks menu options at random
+    BufferedFrontend   records everything as events, answers from a script
+
+    previous = use_frontend(BufferedFrontend(answers=["4", "y", "8", "y"]))
+    Game().play()
+
+The frontend in use is a context variable, so every asyncio task (see
+server.py) or thread can have its own.
+"""
+
+import time
+from contextvars import ContextVar
+
+from rng import current_rng
+
+## Menus, the same for every frontend.
+
+
+def menu_choices(choices, offer_random_choice=False):
+    """Number the choices from 0, plus the random pick at the end if offered."""
+    input_choices = dict(enumerate(choices))
+    if offer_random_choice:
+        input_choices[len(choices)] = "Choose for me! 🔮"
+    return input_choices
+
+
+def menu_label(item, capitalize_choice=True):
+    return item.title() if capitalize_choice else item
+
+
+def parse_menu_answer(answer, input_choices):
+    """The menu number typed in, or None if it is not one of them."""
+    try:
+        choice = int(answer.strip())
+    except Exception:
+        return None
+    # ...but the enum made this 'interface' easy to validate.
+    return choice if choice in input_choices else None
+
+
+def resolve_menu_choice(choice, input_choices, offer_random_choice=False):
+    """What the menu number stands for, rolling the dice for the random pick."""
+    random_choice_index = len(input_choices) - 1
+    if offer_random_choice and choice == random_choice_index:
+        return current_rng().choice(
+            [item for idx, item in input_choices.items() if idx != choice]
+        )
+    return input_choices[choice]
+
+
+def parse_confirm_answer(answer):
+    """True for y, False for n, None for anything else."""
+    try:
+        answer = answer.strip().lower()
+    except Exception:
+        return None
+    return {"y": True, "n": False}.get(answer)
+
+
+## The frontends themselves
+
+
+class Frontend:
+    """Subclasses say, pause and read lines; menus and y/n questions are
+    built on top of those.
+    """
+
+    def say(self, text=""):
+        raise NotImplementedError
+
+    def pause(self, seconds=1):
+        raise NotImplementedError
+
+    def read(self):
+        """One line of the player's answer."""
+        raise NotImplementedError
+
+    def choose(
+        self, prompt, choices, capitalize_choice=True, offer_random_choice=False
+    ):
+        """Show a numbered menu of choices until one gets picked, and return it."""
+        input_choices = menu_choices(choices, offer_random_choice)
+        while True:
+            self.say(prompt)
+            for idx, item in input_choices.items():
+                self.say(f"{idx}: {menu_label(item, capitalize_choice)}\n")
+            choice = parse_menu_answer(self.read(), input_choices)
+            if choice is not None:
+                return resolve_menu_choice(choice, input_choices, offer_random_choice)
+            self.say("Please choose a number in the given range.")
+
+    def confirm(self, prompt):
+        """Ask for y/n about prompt until one of them comes back; True for y."""
+        while True:
+            self.say(prompt)
+            self.say("Confirm choice? Type y or n.")
+            confirmed = parse_confirm_answer(self.read())
+            if confirmed is not None:
+                return confirmed
+            self.say('Please type "y" or "n"')
+
+
+class TerminalFrontend(Frontend):
+    def say(self, text=""):
+        print(text)
+
+    def pause(self, seconds=1):
+        time.sleep(seconds)
+
+    def read(self):
+        return input(">>> ")
+
+
+class NullFrontend(Frontend):
+    """For headless runs: silent, instant, and never asks anybody anything."""
+
+    def say(self, text=""):
+        pass
+
+    def pause(self, seconds=1):
+        pass
+
+    def read(self):
+        raise EOFError("nobody to ask")
+
+    def choose(
+        self, prompt, choices, capitalize_choice=True, offer_random_choice=False
+    ):
+        return current_rng().choice(list(choices))
+
+    def confirm(self, prompt):
+        return True
+
+
+class BufferedFrontend(Frontend):
+    """Keeps events instead of showing them: ("say", text), ("pause", seconds)
+    and ("read", answer), in order. Answers are taken from answers (any
+    iterable of lines, as if typed); running out of them is an EOFError, same
+    as input() at the end of stdin.
+    """
+
+    def __init__(self, answers=()):
+        self.events = []
+        self.answers = iter(answers)
+
+    def say(self, text=""):
+        self.events.append(("say", text))
+
+    def pause(self, seconds=1):
+        self.events.append(("pause", float(seconds)))
+
+    def read(self):
+        answer = next(self.answers, None)
+        if answer is None:
+            raise EOFError("out of scripted answers")
+        self.events.append(("read", answer))
+        return answer
+
+    def drain(self):
+        """Hand over the events so far, and start a fresh list."""
+        events, self.events = self.events, []
+        return events
+
+    def transcript(self):
+        """Everything said so far, as one string."""
+        return "\n".join(text for kind, text in self.events if kind == "say")
+
+
+_frontend = ContextVar("frontend", default=TerminalFrontend())
+
+
+def current_frontend():
+    return _frontend.get()
+
+
+def use_frontend(frontend):
+    """Switch (this context) over to frontend, and return the one it replaces."""
+    previous = _frontend.get()
+    _frontend.set(frontend)
+    return previous
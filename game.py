@@ -1,9 +1,7 @@
-import json
-import os
-import random
-import time
-
-from character import Character
+from balance import able_dimensions
+from bundle import CharacterBundle
+from character import use_bundle
+from events import Damage, DuelEnded, DuelStarted, EffectExpired, Move, SpecialEffect
 from game_macros import (
     CHARACTERS_DIR,
     OPPONENT_SPECIAL_ABILITY_CHANCE,
@@ -12,35 +10,105 @@ from game_macros import (
     confirm_input_choice,
     did_it_happen,
     get_input_choice,
+    pause,
+    say,
 )
-from special_abilities import SpecialAbility
+from policy_table import load_policy_table
+from rng import BatchedStream, Stream, current_rng, use_rng
+from roster import Roster
+from special_abilities import SpecialAbility, validate_special_abilities
+
+
+def pick_computer_move(character):
+    """The computer's way of fighting: every so often, try a special ability
+    (if the character has any); otherwise just fling a random spell from
+    whatever dimensions they can actually cast.
+
+    Return a SpecialChoice or SpellChoice, just like the player's menu would.
+    """
+    if character.special_abilities_info and did_it_happen(
+        OPPONENT_SPECIAL_ABILITY_CHANCE
+    ):
+        abilities = list(character.special_abilities_info.values())
+        ability_info = current_rng().choice(abilities)
+        return SpecialChoice(
+            description=ability_info["description"], effect=ability_info["effect"]
+        )
+
+    spell_info = character.magic_info["deals"]
+    # Recall that not everyone can deal every kind, as a cost to being
+    # super strong in some (which the balance index knows already).
+    dimension = current_rng().choice(able_dimensions(character))
+    return SpellChoice(dimension=dimension, hit=spell_info[dimension]["amount"])
 
 
 class Game:
-    def __init__(self):
+    def __init__(
+        self,
+        characters_dirs=(CHARACTERS_DIR,),
+        bundle_path=None,
+        difficulty="normal",
+        event_log=None,
+        headless=False,
+    ):
+        """headless is for games whose duelists get brought along rather than
+        picked (simulations, see for_duel): no roster, and nothing on it gets
+        checked.
+        """
+        if bundle_path is not None:
+            use_bundle(CharacterBundle(bundle_path))
+        if not headless:
+            # A typo'd effect in somebody's special.json should stop us here,
+            # not halfway through a duel when they finally use it.
+            validate_special_abilities(characters_dirs)
+
+        # kept for whoever needs to make the same Game again (see snapshot.py)
+        self.characters_dirs = tuple(characters_dirs)
+        self.difficulty = difficulty
         self.player = None
         self.opponent = None
-        self.all_characters = {}
+        # "hard" opponents look up the best move in a table of optimal play
+        # (built ahead of time by `python policy_table.py build`)
+        self.policy_table = load_policy_table() if difficulty == "hard" else None
+        # Nobody else's files get read until they are looked at or picked (see
+        # Roster)
+        self.all_characters = Roster(() if headless else characters_dirs)
+        # an events.EventLog to report every move, hit and effect to, if any
+        self.event_log = event_log
+        self.seed = None
+        self.turn = 0
+        # this duel's rng.Stream, and the one split off it for play_move
+        self.rng = None
+        self.rules_rng = None
 
-        for name in os.listdir(f"{CHARACTERS_DIR}"):
-            character = Character(name=name.title())
-            self.all_characters[name] = character
+    @classmethod
+    def for_duel(cls, player=None, opponent=None, **kwargs):
+        """A headless Game with the given duelists already in place."""
+        game = cls(headless=True, **kwargs)
+        game.player = player
+        game.opponent = opponent
+        return game
 
     def select_character(self, prompt="Press a key to choose a character:\n"):
-        chosen_input = get_input_choice(
-            prompt=prompt,
-            choices=self.all_characters,
-            capitalize_choice=True,
-            offer_random_choice=True,
-        )
-        chosen_confirmed = confirm_input_choice(
-            choice=chosen_input,
-            prompt=f"{self.all_characters[chosen_input].ascii_art}\n\n{self.all_characters[chosen_input].bio}\n",
-            deny_func=self.select_character,
-            deny_func_kwargs={"prompt": prompt},
-        )
-
-        return chosen_confirmed
+        """Ask for a character until one gets confirmed. A loop rather than
+        asking again from deny_func, so saying no any number of times doesn't
+        run out of stack.
+        """
+        while True:
+            chosen_input = get_input_choice(
+                prompt=prompt,
+                choices=self.all_characters,
+                capitalize_choice=True,
+                offer_random_choice=True,
+            )
+            chosen_template = self.all_characters.template(chosen_input)
+            chosen_confirmed = confirm_input_choice(
+                choice=chosen_input,
+                prompt=f"{chosen_template.ascii_art}\n\n{chosen_template.bio}\n",
+                deny_func=lambda: None,
+            )
+            if chosen_confirmed is not None:
+                return chosen_confirmed
 
     def _construct_player_spell_choices(
         self,
@@ -52,13 +120,14 @@ class Game:
         """
         choices = {}
 
-        for dimension, dimension_info in self.player.magic_info["deals"].items():
-            # Not everyone can do every kind of magic, which means they
-            # might be better at fewer things.
-            if not dimension_info["spells"]:
-                continue
+        deals = self.player.magic_info["deals"]
+        # Not everyone can do every kind of magic, which means they
+        # might be better at fewer things.
+        for dimension in able_dimensions(self.player):
+            dimension_info = deals[dimension]
             # Rotate among the available spells for each dimension
-            choice_key = f'{random.choice(dimension_info["spells"])} ({dimension})'
+            spell = current_rng().choice(dimension_info["spells"])
+            choice_key = f"{spell} ({dimension})"
             choices[choice_key] = SpellChoice(
                 dimension=dimension, hit=dimension_info["amount"]
             )
@@ -76,98 +145,170 @@ class Game:
         """
         hit = min(whom.magic_info["takes"][dimension]["amount"], max_hit)
         whom.life -= hit
-        print(f"{whom.name} takes {hit} {dimension} damage!\n")
-        time.sleep(1)
-
-    def wear_down_existing_effects(self, affected, is_computer=False):
-        # if 0, do nothing
-        # if 1, reset magic infos (e.g., if affected by Orbs of Disorder, regular magic is restored
-        # if >= 1, decrement
-        # right now this is kinda silly because there is one opponent at a time,
-        # and when that one opponent's effect wears off, 'everyone's' does
-        # but who knows...maybe there will be a future
-        for character, turns_left in affected.affected_by_character_turns_left.items():
-            if turns_left == 0:
-                continue
+        side = "player" if whom is self.player else "opponent"
+        self.record(Damage(self.turn, side, dimension, hit, whom.life))
+        say(f"{whom.name} takes {hit} {dimension} damage!\n")
+        pause(1)
 
-            if turns_left == 1:
-                affected.reset(opponent_name=character.name, is_computer=is_computer)
+        return hit
 
-            affected.affected_by_character_turns_left[character] -= 1
+    def wear_down_existing_effects(self, affected, is_computer=False):
+        # One more of the affected character's turns is over. Only the effects
+        # that run out right now get looked at (see effects.py), each one from
+        # whoever caused it, and each takes back just what it changed.
+        for effect in affected.effects.wear_down():
+            affected.reset(opponent_name=effect.source.name, is_computer=is_computer)
+            side = "opponent" if is_computer else "player"
+            self.record(EffectExpired(self.turn, side, effect.source.name))
 
         return affected
 
-    def player_turn(self):
-        spell_infos = self._construct_player_spell_choices()
-        spell = get_input_choice(
-            prompt="\nChoose your spell:\n",
-            choices=spell_infos,
-            capitalize_choice=False,
-        )
-        choice = spell_infos[spell]
-
-        if isinstance(choice, SpellChoice):
-            dimension, max_hit = choice.dimension, choice.hit
-            self.hit(self.opponent, dimension, max_hit)
-            self.opponent.possibly_react()
-
-        elif isinstance(choice, SpecialChoice):
-            description, effect = choice.description, choice.effect
-            special_confirmed = confirm_input_choice(
-                choice=spell,
-                prompt=description,
-                deny_func=self.player_turn,
-            )
-            if special_confirmed in self.player.special_abilities_info:
-                ability = SpecialAbility(
-                    player=self.player, opponent=self.opponent, effect=choice.effect
-                )
-                self.player, self.opponent = ability.perform()
-
-        self.player = self.wear_down_existing_effects(self.player, is_computer=False)
-
-    def opponent_turn(self):
-        self.opponent.possibly_taunt()
-
-        if self.opponent.special_abilities_info and did_it_happen(
-            OPPONENT_SPECIAL_ABILITY_CHANCE
-        ):
-            special_ability = SpecialAbility(
-                player=self.opponent,
-                opponent=self.player,
-                effect=random.choice(
-                    [
-                        info["effect"]
-                        for info in self.opponent.special_abilities_info.values()
-                    ]
-                ),
+    def use_special_ability(self, effect, is_computer=False):
+        """Perform a special ability effect on behalf of the player (or the
+        opponent, if is_computer), and put the possibly transformed characters
+        back where they belong.
+        """
+        if is_computer:
+            ability = SpecialAbility(
+                player=self.opponent, opponent=self.player, effect=effect
             )
             # The opponent of the opponent is of course the player, let's be super
             # clear about player, opponent result format returned by perform()
             (
                 modified_opponent_as_player,
                 modified_player_as_opponent,
-            ) = special_ability.perform(is_computer=True)
+            ) = ability.perform(is_computer=True)
             self.opponent, self.player = (
                 modified_opponent_as_player,
                 modified_player_as_opponent,
             )
-        # If the opponent does not activate a special ability, they just choose a spell:
         else:
-            spell_info = self.opponent.magic_info["deals"]
-            # Recall that not everyone can deal every kind, as a cost to being
-            # super strong in some.
-            able_dimensions = [
-                dim for dim, info in spell_info.items() if info["spells"]
-            ]
-            dimension = random.choice(able_dimensions)
-            spell = random.choice(spell_info[dimension]["spells"])
+            ability = SpecialAbility(
+                player=self.player, opponent=self.opponent, effect=effect
+            )
+            self.player, self.opponent = ability.perform()
+
+        self.record(
+            SpecialEffect(
+                self.turn,
+                "opponent" if is_computer else "player",
+                effect,
+                self.player.namepath,
+                self.opponent.namepath,
+            )
+        )
+
+    def record(self, event):
+        if self.event_log is not None:
+            self.event_log.record(event)
+
+    def begin_duel(self, seed=None, batched=False):
+        """Start counting turns for a duel between self.player and self.opponent,
+        and give it its own random stream (a BatchedStream, if batched). The
+        seed is drawn from the current stream if not given.
+
+        Everything play_move does draws from a stream split off that one, so
+        how the duel plays out is down to the seed and the moves made; with
+        an event log, that is all that needs writing down to replay it (see
+        replay.py).
+        """
+        self.turn = 0
+        if seed is None:
+            seed = current_rng().getrandbits(32)
+        self.seed = seed
+        self.rng = (BatchedStream if batched else Stream)(seed)
+        self.rules_rng = self.rng.split("rules")
+        # A bad magic.json should stop us here rather than mid-duel too. Each
+        # form gets checked the first time anybody duels as it (see balance.py)
+        able_dimensions(self.player)
+        able_dimensions(self.opponent)
+        self.record(
+            DuelStarted(
+                seed,
+                batched,
+                self.player.name,
+                self.player.namepath,
+                self.opponent.name,
+                self.opponent.namepath,
+            )
+        )
+
+    def play_move(self, choice, is_computer=False):
+        """Carry out an already chosen SpellChoice or SpecialChoice for the
+        player (or the opponent, if is_computer), then wear down the mover's
+        effects. Return the damage a spell did, if any.
+        """
+        self.turn += 1
+        if self.rules_rng is None:
+            return self._play_move(choice, is_computer)
+        previous_rng = use_rng(self.rules_rng)
+        try:
+            return self._play_move(choice, is_computer)
+        finally:
+            use_rng(previous_rng)
+
+    def _play_move(self, choice, is_computer):
+        side = "opponent" if is_computer else "player"
+        if isinstance(choice, SpellChoice):
+            self.record(Move(self.turn, side, "spell", choice.dimension, choice.hit))
+        else:
+            self.record(Move(self.turn, side, "special", choice.effect, 0))
 
-            print(f'{self.opponent.name} chooses: "{spell}"\n')
-            time.sleep(1)
-            self.hit(self.player, dimension, max_hit=spell_info[dimension]["amount"])
+        damage = 0
+        if isinstance(choice, SpellChoice) and is_computer:
+            spells = self.opponent.magic_info["deals"][choice.dimension]["spells"]
+            say(f'{self.opponent.name} chooses: "{current_rng().choice(spells)}"\n')
+            pause(1)
+            damage = self.hit(self.player, choice.dimension, max_hit=choice.hit)
+        elif isinstance(choice, SpellChoice):
+            damage = self.hit(self.opponent, choice.dimension, choice.hit)
+            self.opponent.possibly_react()
+        else:
+            self.use_special_ability(choice.effect, is_computer=is_computer)
+
+        if is_computer:
+            self.opponent = self.wear_down_existing_effects(self.opponent, True)
+        else:
+            self.player = self.wear_down_existing_effects(self.player, False)
+
+        # Only the one who just got attacked is checked for defeat, as in play()
+        if (self.player if is_computer else self.opponent).life <= 0:
+            self.record(
+                DuelEnded(self.turn, side, self.player.life, self.opponent.life)
+            )
+        return damage
+
+    def choose_player_move(self):
+        """Ask for the player's spell, or special ability (which they have to
+        confirm, or else choose again).
+        """
+        while True:
+            spell_infos = self._construct_player_spell_choices()
+            spell = get_input_choice(
+                prompt="\nChoose your spell:\n",
+                choices=spell_infos,
+                capitalize_choice=False,
+            )
+            choice = spell_infos[spell]
+            if isinstance(choice, SpellChoice) or confirm_input_choice(
+                choice=spell, prompt=choice.description, deny_func=lambda: None
+            ):
+                return choice
+
+    def player_turn(self):
+        self.play_move(self.choose_player_move())
+
+    def pick_opponent_move(self):
+        choice = None
+        if self.policy_table is not None:
+            choice = self.policy_table.best_move(self)
+        # anything the table does not cover, the computer just wings it
+        return choice or pick_computer_move(self.opponent)
+
+    def opponent_turn(self):
+        self.opponent.possibly_taunt()
 
-        self.opponent = self.wear_down_existing_effects(self.opponent, is_computer=True)
+        self.play_move(self.pick_opponent_move(), is_computer=True)
 
     def play(self):
         player_choice = self.select_character()
@@ -179,28 +320,30 @@ class Game:
             prompt="Press a key to choose your opponent:\n"
         )
         self.opponent = self.all_characters[opponent_choice]
+        self.begin_duel()
+        use_rng(self.rng)
 
-        print(f"\n{self.opponent.name} is ready to duel!\n")
-        time.sleep(1)
-        print("Ready?\n")
-        time.sleep(2)
+        say(f"\n{self.opponent.name} is ready to duel!\n")
+        pause(1)
+        say("Ready?\n")
+        pause(2)
 
         # well it is a start
         while True:
             self.player.print_life()
             self.opponent.print_life()
-            time.sleep(1)
+            pause(1)
 
             self.player_turn()
             if self.opponent.life <= 0:
-                print(
+                say(
                     f"You have defeated {self.opponent.name}! Congratulations, Sorcerer."
                 )
-                time.sleep(2)
+                pause(2)
                 return
 
             self.opponent_turn()
             if self.player.life <= 0:
-                print(f"{self.opponent.name} has bested you. Game over.")
-                time.sleep(2)
+                say(f"{self.opponent.name} has bested you. Game over.")
+                pause(2)
                 return
@@ -2,13 +2,21 @@
 Currently the dumping ground of constants and shared utils
 """
 
-import random
 from collections import namedtuple
+from types import MappingProxyType
+
+from frontend import current_frontend
+from rng import current_rng
 
 ## Constants
 
 CHARACTERS_DIR = "characters"
+CHARACTERS_BUNDLE = "characters.bundle"  # see bundle.py
+HARD_OPPONENT_POLICY = "hard_opponent.policy"  # see policy_table.py
+BALANCE_INDEX = "balance.index"  # see balance.py
 GAME_LIFE = 15
+# every magic.json has all six of these under both "deals" and "takes"
+DIMENSIONS = ("dark", "light", "chaotic", "ordered", "hot", "cold")
 OPPONENT_SPECIAL_ABILITY_CHANCE = 0.2
 DEFAULT_SPECIAL_ABILITY_TURNS = (
     3  # number of turns a special ability lasts by default, if it affects any state
@@ -27,11 +35,58 @@ SpecialChoice = namedtuple("SpecialChoice", ["description", "effect"])
 ## ...anyway, next comes: General helper utils
 
 
+## Talking and waiting. Everything the game narrates or sleeps on goes through
+## these two, and on to whichever frontend is in use (see frontend.py).
+
+
+def say(text=""):
+    current_frontend().say(text)
+
+
+def pause(seconds=1):
+    current_frontend().pause(seconds)
+
+
 def did_it_happen(chance=0.5):
     """Helper for all kinds of things that occur at a given chance between
     0 and 1.
+
+    Not quite that chance, though: it rolls a whole number from 0 to 100 (101
+    equally likely outcomes) and counts the rolls below 100 * chance. So it
+    comes out true with probability min(ceil(100 * chance), 101) / 101 for any
+    chance above 0, and never for 0 or below: 0.5 is really 50/101, 1 is
+    100/101, and anything from 0.001 up to 0.01 is 1/101. The balance of the
+    roster (and solver.py) is built on exactly these odds.
+    """
+    return 100 * chance > current_rng().roll()
+
+
+def chance_of_happening(chance=0.5):
+    """The exact probability that did_it_happen(chance) comes out true (see
+    there), e.g. 50/101 for 0.5.
     """
-    return 100 * chance > random.randint(0, 100)
+    return sum(1 for roll in range(101) if 100 * chance > roll) / 101
+
+
+def freeze(data):
+    """Return a read-only version of parsed JSON data (dicts become mapping
+    proxies and lists become tuples, all the way down), so it can be shared
+    between characters without anyone scribbling on it.
+    """
+    if isinstance(data, dict):
+        return MappingProxyType({key: freeze(val) for key, val in data.items()})
+    if isinstance(data, list):
+        return tuple(freeze(val) for val in data)
+    return data
+
+
+def thaw(data):
+    """The opposite of freeze: a fresh, mutable copy of (possibly frozen) data."""
+    if isinstance(data, (dict, MappingProxyType)):
+        return {key: thaw(val) for key, val in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [thaw(val) for val in data]
+    return data
 
 
 def get_input_choice(
@@ -44,35 +99,12 @@ def get_input_choice(
     make a choice, and insist that they do so correctly until a proper
     one can be returned.
     """
-    input_choices = dict(enumerate(choices))
-    random_choice_index = len(choices)
-    if offer_random_choice:
-        input_choices[random_choice_index] = "Choose for me! 🔮"
-
-    choice = None
-    while choice is None:
-        print(prompt)
-        for idx, item in input_choices.items():
-            print(f"{idx}: {item.title() if capitalize_choice else item}\n")
-
-        choice_input = input(">>> ")
-        try:
-            choice = int(choice_input.strip())
-        except Exception:
-            print("Please choose a number in the given range.")
-            choice = None
-            continue
-
-        # ...but the enum made this 'interface' easy to validate.
-        if choice not in input_choices:
-            print("Please choose a number in the given range.")
-            choice = None
-
-    if choice == random_choice_index and offer_random_choice:
-        del input_choices[random_choice_index]
-        return random.choice(list(input_choices.values()))
-
-    return input_choices[choice]
+    return current_frontend().choose(
+        prompt,
+        choices,
+        capitalize_choice=capitalize_choice,
+        offer_random_choice=offer_random_choice,
+    )
 
 
 def confirm_input_choice(
@@ -87,25 +119,6 @@ def confirm_input_choice(
     Call given deny_func to custom 'reset' if they do not confirm.
     """
     deny_func_kwargs = deny_func_kwargs or {}
-    confirmed_choice = None
-
-    while confirmed_choice is None:
-        print(prompt)
-        print(f"Confirm choice? Type y or n.")
-
-        confirm = input(">>> ")
-        try:
-            confirm = confirm.strip().lower()
-        except Exception:
-            print('Please type "y" or "n"')
-            continue
-
-        if confirm == "y":
-            confirmed_choice = choice
-        elif confirm == "n":
-            return deny_func(**deny_func_kwargs)
-        else:
-            print('Please type "y" or "n"')
-            continue
-
-    return confirmed_choice
+    if current_frontend().confirm(prompt):
+        return choice
+    return deny_func(**deny_func_kwargs)
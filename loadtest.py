@@ -0,0 +1,352 @@
+"""
+Load-testing the interactive flow: thousands of whole games, characters picked
+through the menus and all, played by scripted players who can be as awkward as
+asked (saying no to everything, typing nonsense). No pauses are slept through.
+
+    python loadtest.py --games 2000               # Game.play, in this process
+    python loadtest.py --games 2000 --server      # all at once, over the wire
+    python loadtest.py --deny 0.5 --garbage 0.3   # awkward players
+    python loadtest.py --games 10 --deny-streak 5000
+
+In process, each game gets its own thread (--workers at a time), frontend and
+random stream, and every step is timed:
+
+    select      picking a character, from the first menu to a confirmed yes
+    spell_menu  putting the spell menu together
+    turn        carrying out a move (either side's)
+
+along with how deep the stack got under Game.play whenever a player was asked
+something, which is what would grow if saying no asked again from deeper in.
+Over the wire (--server), every game is a client of an in-process server.py,
+and what gets timed is each round trip from an answer to the next question,
+during character selection and during the duel.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from frontend import Frontend, use_frontend
+from game import Game
+from game_macros import did_it_happen
+from policy_table import require_policy_table
+from rng import Stream, current_rng, derive_seed, use_rng
+from server import DEFAULT_HOST, start_duel_server
+
+DEFAULT_GAMES = 1000
+DEFAULT_WORKERS = 8
+# things a player might type that aren't answers
+GARBAGE = ("", "banana", "-1", "99", "yes please", "🔮")
+PERCENTILES = (50, 90, 99)
+
+
+class ScriptedPlayer:
+    """Answers for one game: a random menu option, yes to confirmations, but
+    no with chance deny (and always, for the first deny_streak
+    confirmations), and something that isn't an answer at all with chance
+    garbage.
+    """
+
+    def __init__(self, deny=0.0, garbage=0.0, deny_streak=0):
+        self.deny = deny
+        self.garbage = garbage
+        self.deny_streak = deny_streak
+
+    def _garbage(self):
+        if did_it_happen(self.garbage):
+            return current_rng().choice(GARBAGE)
+        return None
+
+    def menu_answer(self, options):
+        return self._garbage() or current_rng().choice(options)
+
+    def confirm_answer(self):
+        garbage = self._garbage()
+        if garbage is not None:
+            return garbage
+        if self.deny_streak > 0:
+            self.deny_streak -= 1
+            return "n"
+        return "n" if did_it_happen(self.deny) else "y"
+
+
+def _stack_depth():
+    depth = 0
+    frame = sys._getframe(1)
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+## In process
+
+
+class ScriptedFrontend(Frontend):
+    """Silent, never sleeps, and answers for a ScriptedPlayer."""
+
+    def __init__(self, player):
+        self.player = player
+        self.options = None
+        # stack depth when the game started, and the most since then
+        self.base_depth = _stack_depth()
+        self.max_depth = 0
+        self.questions = 0
+
+    def say(self, text=""):
+        pass
+
+    def pause(self, seconds=1):
+        pass
+
+    def choose(
+        self, prompt, choices, capitalize_choice=True, offer_random_choice=False
+    ):
+        count = len(choices) + (1 if offer_random_choice else 0)
+        self.options = [str(idx) for idx in range(count)]
+        return super().choose(prompt, choices, capitalize_choice, offer_random_choice)
+
+    def confirm(self, prompt):
+        self.options = None
+        return super().confirm(prompt)
+
+    def read(self):
+        self.questions += 1
+        self.max_depth = max(self.max_depth, _stack_depth() - self.base_depth)
+        if self.options is None:
+            return self.player.confirm_answer()
+        return self.player.menu_answer(self.options)
+
+
+class TimedGame(Game):
+    """A Game that times its steps into timings (step -> list of seconds)."""
+
+    def __init__(self, timings, **kwargs):
+        super().__init__(**kwargs)
+        self.timings = timings
+
+    def select_character(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().select_character(*args, **kwargs)
+        finally:
+            self.timings["select"].append(time.perf_counter() - start)
+
+    def _construct_player_spell_choices(self):
+        start = time.perf_counter()
+        try:
+            return super()._construct_player_spell_choices()
+        finally:
+            self.timings["spell_menu"].append(time.perf_counter() - start)
+
+    def play_move(self, choice, is_computer=False):
+        start = time.perf_counter()
+        try:
+            return super().play_move(choice, is_computer=is_computer)
+        finally:
+            self.timings["turn"].append(time.perf_counter() - start)
+
+
+def _play_one(player, seed, difficulty):
+    """Play one game through Game.play; return (timings, deepest stack,
+    questions asked).
+    """
+    timings = defaultdict(list)
+    frontend = ScriptedFrontend(player)
+    use_frontend(frontend)
+    use_rng(Stream(seed))
+    TimedGame(timings, difficulty=difficulty).play()
+    return timings, frontend.max_depth, frontend.questions
+
+
+def run_local(
+    games, workers=DEFAULT_WORKERS, seed=0, difficulty="normal", **player_options
+):
+    """Play games on a thread pool, each in a context of its own. Return
+    (step -> every time taken, deepest stack seen, questions asked in all).
+    """
+    timings = defaultdict(list)
+    max_depth = questions = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                copy_context().run,
+                _play_one,
+                ScriptedPlayer(**player_options),
+                derive_seed(seed, "game", idx),
+                difficulty,
+            )
+            for idx in range(games)
+        ]
+        for future in futures:
+            game_timings, depth, asked = future.result()
+            for step, seconds in game_timings.items():
+                timings[step].extend(seconds)
+            max_depth = max(max_depth, depth)
+            questions += asked
+    return timings, max_depth, questions
+
+
+## Over the wire
+
+
+async def scripted_client(host, port, player, timings):
+    """One scripted game against a server.py server; every round trip from an
+    answer (or the HELLO) to the next question goes into timings, under
+    "select" or "duel". Return the winner from the BYE.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    options = []
+    dueling = False
+    try:
+        writer.write(b"HELLO bot\n")
+        await writer.drain()
+        sent = time.perf_counter()
+        while True:
+            line = await reader.readline()
+            if not line:
+                return "quit"
+            kind, _, rest = line.decode("utf-8").rstrip("\n").partition(" ")
+            if kind == "SAY" and "is ready to duel" in rest:
+                dueling = True
+            elif kind == "CHOICE":
+                options.append(rest.split(" ", 1)[0])
+            elif kind in ("ASK", "BYE"):
+                timings["duel" if dueling else "select"].append(
+                    time.perf_counter() - sent
+                )
+                if kind == "BYE":
+                    return rest
+                if rest == "menu":
+                    answer = player.menu_answer(options)
+                else:
+                    answer = player.confirm_answer()
+                options = []
+                writer.write(f"{answer}\n".encode("utf-8"))
+                await writer.drain()
+                sent = time.perf_counter()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_server(games, seed=0, difficulty="normal", **player_options):
+    """Serve on a free local port and play every game at once against it.
+    Return (step -> every round trip, list of winners).
+    """
+    use_rng(Stream(seed))
+    timings = defaultdict(list)
+    server = await start_duel_server(DEFAULT_HOST, 0, difficulty=difficulty, pace=0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        winners = await asyncio.gather(
+            *(
+                scripted_client(
+                    DEFAULT_HOST, port, ScriptedPlayer(**player_options), timings
+                )
+                for _ in range(games)
+            )
+        )
+    return timings, winners
+
+
+## Reporting
+
+
+def percentiles(seconds):
+    """{"p50": ..., "p90": ..., "p99": ..., "max": ...} (nearest rank)."""
+    ordered = sorted(seconds)
+    result = {
+        f"p{percent}": ordered[max(0, -(-percent * len(ordered) // 100) - 1)]
+        for percent in PERCENTILES
+    }
+    result["max"] = ordered[-1]
+    return result
+
+
+def _format(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}µs"
+    return f"{seconds * 1e3:.2f}ms"
+
+
+def report(timings):
+    lines = [
+        f"{'step':12} {'count':>9} "
+        + " ".join(f"{name:>10}" for name in (*(f"p{p}" for p in PERCENTILES), "max"))
+    ]
+    for step, seconds in timings.items():
+        if not seconds:
+            continue
+        values = percentiles(seconds).values()
+        lines.append(
+            f"{step:12} {len(seconds):>9} "
+            + " ".join(f"{_format(value):>10}" for value in values)
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the interactive flow.")
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES)
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS, help="threads, in process"
+    )
+    parser.add_argument(
+        "--server", action="store_true", help="play against server.py instead"
+    )
+    parser.add_argument("--hard", action="store_true")
+    parser.add_argument(
+        "--deny", type=float, default=0.0, help="chance of saying no to a confirm"
+    )
+    parser.add_argument(
+        "--deny-streak",
+        type=int,
+        default=0,
+        help="say no to this many confirmations first, every game",
+    )
+    parser.add_argument(
+        "--garbage", type=float, default=0.0, help="chance of typing nonsense"
+    )
+    parser.add_argument("--seed", default="0")
+    args = parser.parse_args()
+    player_options = {
+        "deny": args.deny,
+        "garbage": args.garbage,
+        "deny_streak": args.deny_streak,
+    }
+
+    difficulty = "hard" if args.hard else "normal"
+    if args.hard:
+        require_policy_table()
+    start = time.perf_counter()
+    if args.server:
+        timings, winners = asyncio.run(
+            run_server(
+                args.games, seed=args.seed, difficulty=difficulty, **player_options
+            )
+        )
+        summary = f"{winners.count('player')} won by the player"
+    else:
+        timings, max_depth, questions = run_local(
+            args.games,
+            workers=args.workers,
+            seed=args.seed,
+            difficulty=difficulty,
+            **player_options,
+        )
+        summary = (
+            f"{questions} questions answered, stack at most {max_depth} frames "
+            f"deeper than Game.play's caller"
+        )
+    elapsed = time.perf_counter() - start
+    print(report(timings))
+    print(f"{args.games} games in {elapsed:.2f}s, {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,51 @@
+import argparse
+
+from bundle import open_bundle
+from character import use_bundle
+from events import EventLog
 from game import Game
-from game_macros import GAME_LIFE
+from game_macros import CHARACTERS_BUNDLE, GAME_LIFE
+from metrics import enable as enable_metrics, write_prometheus
+from policy_table import require_policy_table
+from special_abilities import load_plugins
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Magic Fight!")
+    parser.add_argument(
+        "--hard",
+        action="store_true",
+        help="the opponent plays its best (see policy_table.py)",
+    )
+    parser.add_argument(
+        "--log", metavar="PATH", help="append the duel to this event log (replay.py)"
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="count hot paths, and write them here as Prometheus text at the end",
+    )
+    parser.add_argument(
+        "--bundle",
+        nargs="?",
+        const=CHARACTERS_BUNDLE,
+        metavar="PATH",
+        help="load everyone from a `python bundle.py build` file instead",
+    )
+    parser.add_argument(
+        "--plugin",
+        action="append",
+        default=[],
+        metavar="MODULE",
+        help="import this module first, for the special effects it registers",
+    )
+    args = parser.parse_args()
+    if args.metrics:
+        enable_metrics()
+    load_plugins(args.plugin)
+    if args.hard:
+        require_policy_table()
+
     print(
         f"""Welcome to Magic Fight!
 
@@ -20,8 +63,18 @@ def main():
         What kinds, and how much? You have to figure that out, too. Good luck!
         """
     )
-    game = Game()
+    if args.bundle:
+        use_bundle(open_bundle(args.bundle))
+    event_log = EventLog(args.log) if args.log else None
+    game = Game(
+        difficulty="hard" if args.hard else "normal",
+        event_log=event_log,
+    )
     game.play()
+    if event_log is not None:
+        event_log.close()
+    if args.metrics:
+        write_prometheus(args.metrics)
 
 
 if __name__ == "__main__":
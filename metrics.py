@@ -0,0 +1,219 @@
+"""
+Counting and timing the hot paths, for when somebody wants to know where the
+time goes: file loads, character constructions, transforms, hits, special
+abilities, effects going on and coming off.
+
+Off by default, and then it costs nothing at all: enable() wraps the functions
+listed in HOOKS in place (and disable() puts the originals back), so when it's
+off there is no wrapper to call. While on, every call is counted and timed by
+what it is (e.g. special ability "potionify"), and with track_allocations,
+tracemalloc also tallies the memory each one left allocated.
+
+    metrics.enable()
+    ...
+    metrics.snapshot()["ability"]["potionify"]  # {"calls": 3, "seconds": ...}
+    metrics.write_prometheus("magic_fight.prom")
+
+Times include whatever else got called inside (reset() goes through
+_set_magic_info, a shapeshift ability through become()...), so the paths
+overlap and don't add up to a total.
+"""
+
+import importlib
+import os
+import time
+import tracemalloc
+
+## What each call gets labelled with; same arguments as what they label.
+
+
+def _file_label(attr, filepath, *_, **__):
+    return attr
+
+
+def _character_label(self, name, special_namepath=None):
+    return name
+
+
+def _transform_label(self, name=None, special_namepath=None, drunk=False):
+    if name is not None:
+        return "shapeshift"
+    return "drunk" if drunk else "sober"
+
+
+def _effect_label(self, source, name, *_, **__):
+    return name
+
+
+def _reset_label(self, *_, **__):
+    return self.name
+
+
+def _hit_label(self, whom, dimension, max_hit):
+    return dimension
+
+
+def _ability_label(self, **_):
+    return self.effect_func.__name__
+
+
+# (module, attribute, path, label): wrap module.attribute, count it under path,
+# and label each call with what label(*args, **kwargs) returns
+HOOKS = (
+    ("character", "_read_character_file", "file_load", _file_label),
+    ("character", "Character.__init__", "character", _character_label),
+    ("character", "Character.become", "transform", _transform_label),
+    ("character", "Character.add_effect", "effect_added", _effect_label),
+    ("character", "Character.reset", "effect_reset", _reset_label),
+    ("game", "Game.hit", "hit", _hit_label),
+    ("special_abilities", "SpecialAbility.perform", "ability", _ability_label),
+)
+
+PROMETHEUS_PREFIX = "magic_fight"
+
+# (path, label) -> [calls, seconds, bytes]
+_stats = {}
+# (owner, attribute name, original), for disable()
+_originals = []
+_tracking_allocations = False
+
+
+def _instrument(func, path, label):
+    def instrumented(*args, **kwargs):
+        key = (path, label(*args, **kwargs))
+        tracking = _tracking_allocations
+        if tracking:
+            allocated_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = _stats.get(key)
+            if stats is None:
+                stats = _stats[key] = [0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += elapsed
+            if tracking:
+                stats[2] += tracemalloc.get_traced_memory()[0] - allocated_before
+
+    instrumented.__wrapped__ = func
+    instrumented.__name__ = func.__name__
+    instrumented.__doc__ = func.__doc__
+    return instrumented
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def enable(track_allocations=False):
+    """Start counting. With track_allocations, also start tracemalloc (which
+    slows everything down a good deal) and tally bytes per call.
+    """
+    global _tracking_allocations
+    if is_enabled():
+        return
+    for module_name, attribute, path, label in HOOKS:
+        owner = importlib.import_module(module_name)
+        *owner_path, name = attribute.split(".")
+        for part in owner_path:
+            owner = getattr(owner, part)
+        original = vars(owner)[name]
+        _originals.append((owner, name, original))
+        setattr(owner, name, _instrument(original, path, label))
+    if track_allocations:
+        _tracking_allocations = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def disable():
+    """Stop counting (what has been counted so far stays, see reset())."""
+    global _tracking_allocations
+    while _originals:
+        owner, name, original = _originals.pop()
+        setattr(owner, name, original)
+    if _tracking_allocations:
+        _tracking_allocations = False
+        tracemalloc.stop()
+
+
+def reset():
+    _stats.clear()
+
+
+def snapshot():
+    """Everything counted so far, as path -> label -> {"calls", "seconds",
+    "bytes"} (bytes is 0 unless allocations were tracked). A copy, so it
+    doesn't change as more gets counted.
+    """
+    result = {}
+    for (path, label), (calls, seconds, allocated) in sorted(_stats.items()):
+        result.setdefault(path, {})[label] = {
+            "calls": calls,
+            "seconds": seconds,
+            "bytes": allocated,
+        }
+    return result
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(prefix=PROMETHEUS_PREFIX):
+    """snapshot() in the Prometheus text exposition format."""
+    families = (
+        ("calls_total", "counter", "calls", "Calls to an instrumented path."),
+        ("seconds_total", "counter", "seconds", "Time spent in an instrumented path."),
+        # net memory, which goes down whenever a call frees more than it
+        # allocates, so not a counter
+        (
+            "allocated_bytes",
+            "gauge",
+            "bytes",
+            "Memory still allocated when an instrumented call returned.",
+        ),
+    )
+    counted = snapshot()
+    lines = []
+    for suffix, kind, field, description in families:
+        name = f"{prefix}_{suffix}"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for path, labels in counted.items():
+            for label, stats in labels.items():
+                lines.append(
+                    f'{name}{{path="{_escape(path)}",label="{_escape(label)}"}} '
+                    f"{stats[field]}"
+                )
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, prefix=PROMETHEUS_PREFIX):
+    """Write prometheus_text() to path, all at once (via a temporary file), so
+    that whoever picks it up (e.g. node_exporter's textfile collector) never
+    sees half of it.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as metrics_fl:
+        metrics_fl.write(prometheus_text(prefix))
+    os.replace(temporary, path)
+
+
+def summary(top=15):
+    """The paths and labels that took the most time, one line each."""
+    rows = sorted(
+        (
+            (stats["seconds"], path, label, stats)
+            for path, labels in snapshot().items()
+            for label, stats in labels.items()
+        ),
+        key=lambda row: -row[0],
+    )
+    return "\n".join(
+        f"{path + '/' + str(label):40} {stats['calls']:>10} calls "
+        f"{seconds:10.4f}s {stats['bytes']:>12} bytes"
+        for seconds, path, label, stats in rows[:top]
+    )
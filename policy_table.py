@@ -0,0 +1,305 @@
+"""
+The "hard" opponent: looks its moves up in a table of optimal play.
+
+Building the table means solving every ordered matchup on the roster exactly
+(see solver.py) with both sides playing their best, and writing down the best
+move for the opponent in every state where it is the opponent's turn:
+
+    python policy_table.py build             # writes hard_opponent.policy
+
+During a game, picking a move is then one dictionary lookup. The table is
+read once per process, and each matchup's part of it is only unpacked the
+first time that matchup comes up.
+
+Layout of a policy file:
+
+    header  MAGIC, then index length and format version as two little-endian
+            uint32s
+    index   UTF-8 JSON list, one entry per matchup: both namepaths, each side's
+            forms and canonical deals, the move labels, and where its codes sit
+    body    per matchup: state codes (uint64) followed by move label indexes
+            (uint8), in the same order
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from character import get_template
+from game_macros import (
+    CHARACTERS_DIR,
+    DEFAULT_SPECIAL_ABILITY_TURNS,
+    DIMENSIONS,
+    HARD_OPPONENT_POLICY,
+    SpecialChoice,
+    SpellChoice,
+)
+from rng import current_rng
+from roster import Roster
+from solver import LIFE_CAP, OPPONENT, canonical_deals, solve
+
+MAGIC = b"MFPOLICY"
+VERSION = 1
+_HEADER = struct.Struct("<8sII")
+
+
+def _radices(forms, canon):
+    return (
+        LIFE_CAP + 1,
+        LIFE_CAP + 1,
+        len(forms[0]),
+        len(forms[1]),
+        len(canon[0]),
+        len(canon[1]),
+        DEFAULT_SPECIAL_ABILITY_TURNS + 1,
+        DEFAULT_SPECIAL_ABILITY_TURNS + 1,
+    )
+
+
+def _encode(key, radices):
+    """Pack a solver state key (minus whose turn it is) into one integer."""
+    code = 0
+    for value, radix in zip(key, radices):
+        code = code * radix + value
+    return code
+
+
+def _solve_matchup(namepaths):
+    solved = solve(*namepaths, player_mode="optimal", opponent_mode="optimal")
+    radices = _radices(solved.forms, solved.canon)
+    labels = []
+    label_index = {}
+    codes = array("Q")
+    moves = array("B")
+    for key in solved.states:
+        if key[0] != OPPONENT:
+            continue
+        label = solved.best_move_for_key(key)
+        if label not in label_index:
+            label_index[label] = len(labels)
+            labels.append(label)
+        codes.append(_encode(key[1:], radices))
+        moves.append(label_index[label])
+
+    return {
+        "player": namepaths[0],
+        "opponent": namepaths[1],
+        "forms": [
+            [[form.namepath, form.drunk] for form in side_forms]
+            for side_forms in solved.forms
+        ],
+        "canon": [[list(map(list, key)) for key in side] for side in solved.canon],
+        "labels": labels,
+        "codes": codes.tobytes(),
+        "moves": moves.tobytes(),
+    }
+
+
+def build_policy_table(out_path=HARD_OPPONENT_POLICY, workers=None):
+    names = sorted(Roster())
+    matchups = [
+        (f"{CHARACTERS_DIR}/{player}", f"{CHARACTERS_DIR}/{opponent}")
+        for player in names
+        for opponent in names
+        if player != opponent
+    ]
+
+    index = []
+    body = []
+    offset = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for solved in executor.map(_solve_matchup, matchups):
+            codes, moves = solved.pop("codes"), solved.pop("moves")
+            solved["offset"] = offset
+            solved["count"] = len(moves)
+            index.append(solved)
+            body.extend((codes, moves))
+            offset += len(codes) + len(moves)
+
+    index = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    with open(out_path, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, len(index), VERSION))
+        out.write(index)
+        for chunk in body:
+            out.write(chunk)
+
+    return out_path
+
+
+class _MatchupPolicy:
+    def __init__(self, info, body):
+        self.forms = [
+            {(namepath, drunk): idx for idx, (namepath, drunk) in enumerate(side)}
+            for side in info["forms"]
+        ]
+        self.canon = [
+            {tuple(map(tuple, key)): idx for idx, key in enumerate(side)}
+            for side in info["canon"]
+        ]
+        self.labels = [tuple(label) for label in info["labels"]]
+        self.radices = _radices(info["forms"], info["canon"])
+
+        codes = array("Q")
+        moves = array("B")
+        start, count = info["offset"], info["count"]
+        codes.frombytes(body[start : start + 8 * count])
+        moves.frombytes(body[start + 8 * count : start + 9 * count])
+        self.moves = dict(zip(codes, moves))
+        # every form's takes, per side, for canonicalizing live deals
+        self.takes = [
+            [_takes(namepath) for namepath, _ in side] for side in info["forms"]
+        ]
+        self.able = [
+            {(namepath, drunk): _able(namepath) for namepath, drunk in side}
+            for side in info["forms"]
+        ]
+
+    def lookup(self, game):
+        """The best move label for the opponent right now, or None if this
+        state never came up when the table was built.
+        """
+        characters = (game.player, game.opponent)
+        key = [min(character.life, LIFE_CAP) for character in characters]
+        if min(key) <= 0:
+            return None
+        forms = [(character.namepath, character.drunk) for character in characters]
+        for side, form in enumerate(forms):
+            if form not in self.forms[side]:
+                return None
+            key.append(self.forms[side][form])
+        for side, character in enumerate(characters):
+            deals = character.magic_info["deals"]
+            canonical = canonical_deals(
+                self.able[side][forms[side]],
+                [deals[dim]["amount"] for dim in DIMENSIONS],
+                self.takes[1 - side],
+            )
+            if canonical not in self.canon[side]:
+                return None
+            key.append(self.canon[side][canonical])
+        for character in characters:
+            key.append(character.effects.turns_left())
+
+        move = self.moves.get(_encode(key, self.radices))
+        return None if move is None else self.labels[move]
+
+
+def _takes(namepath):
+    takes = get_template(namepath).magic_info["takes"]
+    return tuple(takes[dim]["amount"] for dim in DIMENSIONS)
+
+
+def _able(namepath):
+    deals = get_template(namepath).magic_info["deals"]
+    return tuple(idx for idx, dim in enumerate(DIMENSIONS) if deals[dim]["spells"])
+
+
+class PolicyTable:
+    """A whole policy file, read in one go."""
+
+    def __init__(self, path=HARD_OPPONENT_POLICY):
+        with open(path, "rb") as fl:
+            data = fl.read()
+        magic, index_length, version = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a version {VERSION} policy table: {path}")
+        index_start = _HEADER.size
+        self._body = data[index_start + index_length :]
+        self._index = {}
+        # (player namepath, opponent namepath) -> matchup they can turn up in,
+        # since shapeshifters do not stay at the namepath they started from
+        self._matchup_of = {}
+        for info in json.loads(data[index_start : index_start + index_length]):
+            key = (info["player"], info["opponent"])
+            self._index[key] = info
+            for player_namepath, _ in info["forms"][0]:
+                for opponent_namepath, _ in info["forms"][1]:
+                    self._matchup_of.setdefault(
+                        (player_namepath, opponent_namepath), key
+                    )
+        self._matchups = {}
+
+    def _matchup(self, player_namepath, opponent_namepath):
+        key = self._matchup_of.get((player_namepath, opponent_namepath))
+        if key is None:
+            return None
+        if key not in self._matchups:
+            self._matchups[key] = _MatchupPolicy(self._index[key], self._body)
+        return self._matchups[key]
+
+    def best_move(self, game):
+        """A SpellChoice or SpecialChoice for game.opponent, or None if the
+        table has nothing to say about this matchup or state.
+        """
+        policy = self._matchup(game.player.namepath, game.opponent.namepath)
+        label = policy and policy.lookup(game)
+        if label is None:
+            return None
+
+        kind, value = label
+        opponent = game.opponent
+        if kind == "special":
+            for info in opponent.special_abilities_info.values():
+                if info["effect"] == value:
+                    return SpecialChoice(
+                        description=info["description"], effect=info["effect"]
+                    )
+            return None
+
+        # Any dimension that lands that much damage is as good as any other
+        takes = game.player.magic_info["takes"]
+        dimensions = [
+            dim
+            for dim, info in opponent.magic_info["deals"].items()
+            if info["spells"] and min(takes[dim]["amount"], info["amount"]) == value
+        ]
+        if not dimensions:
+            return None
+        dimension = current_rng().choice(dimensions)
+        return SpellChoice(
+            dimension=dimension, hit=opponent.magic_info["deals"][dimension]["amount"]
+        )
+
+
+_loaded = {}
+
+
+def load_policy_table(path=HARD_OPPONENT_POLICY):
+    """The PolicyTable at path, read from disk only the first time."""
+    if path not in _loaded:
+        _loaded[path] = PolicyTable(path)
+    return _loaded[path]
+
+
+def require_policy_table(path=HARD_OPPONENT_POLICY):
+    """For --hard: load the table now, or exit saying how to build it (rather
+    than every Game(difficulty="hard") failing later on).
+    """
+    try:
+        return load_policy_table(path)
+    except OSError:
+        sys.exit(
+            f"No hard opponent table at {path}. Build it first with "
+            f"`python policy_table.py build`."
+        )
+    except ValueError as exc:
+        sys.exit(f"{exc}. Rebuild it with `python policy_table.py build`.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the hard opponent's table.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--out", default=HARD_OPPONENT_POLICY)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    path = build_policy_table(args.out, workers=args.workers)
+    print(f"Wrote {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Tuning the roster's deal and take amounts toward target win rates, so nobody
+has to hand-edit nine magic.json files and replay everything in between.
+
+The search is a plain (1 + lambda) evolution: every generation, a handful of
+mutants of the best roster so far (a few amounts nudged up or down by one,
+within the bounds) get scored, and the best of them takes over if it's at
+least as good. A roster's score is how far each pairing's win rate is outside
+the target band, squared and summed, plus a little for every point it moved
+away from the current files (so it only changes what it has to).
+
+Win rates come from slim.play_batch (a batch of duels per ordered matchup,
+from a fixed seed per matchup, so two rosters get compared on the same dice),
+or exactly from solver.py with --exact, which is a lot slower for anyone
+with the orbs. Each matchup's result is remembered by the amounts of the two
+sides, so a mutant only costs the matchups of whoever it changed, and those
+are farmed out to a process pool.
+
+Nested forms (nora/norm...) keep their amounts; only the roster entries get
+tuned. The result is written as a patch against the magic.json files:
+
+    python rebalance.py --band 0.4 0.6 --generations 50 --out rebalance.patch
+    git apply rebalance.patch
+"""
+
+import argparse
+import difflib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from balance import BalanceIndex
+from character import list_character_dirs
+from game_macros import CHARACTERS_DIR, DIMENSIONS
+from rng import BatchedStream, Stream, derive_seed
+from simulation import DEFAULT_MAX_TURNS
+from slim import DuelBatch, MatchupForms, play_batch
+from solver import SolvedMatchup
+
+DEFAULT_BAND = (0.4, 0.6)
+# (an able dimension dealing 0 would be a wasted spell)
+DEFAULT_DEAL_BOUNDS = (1, 5)
+DEFAULT_TAKE_BOUNDS = (0, 4)
+DEFAULT_DUELS = 2000
+DEFAULT_GENERATIONS = 30
+DEFAULT_POPULATION = 8
+# most amounts a mutant changes at once
+DEFAULT_MAX_CHANGES = 2
+# score per point of change from the files, next to squared win rate misses
+CHANGE_WEIGHT = 1e-4
+
+
+## Scoring matchups (in worker processes)
+
+
+def _score_matchup(task):
+    """(player's win rate, opponent's win rate) for one ordered matchup."""
+    player, opponent, overrides, duels, seed, exact = task
+    if exact:
+        return SolvedMatchup(player, opponent, overrides=overrides).win_probabilities()
+    stats = play_batch(
+        DuelBatch(MatchupForms(player, opponent, overrides=overrides), duels),
+        max_turns=DEFAULT_MAX_TURNS,
+        rng=BatchedStream(seed),
+    )
+    return stats.player_win_rate, stats.opponent_win_rate
+
+
+class Rebalancer:
+    def __init__(
+        self,
+        characters_dir=CHARACTERS_DIR,
+        band=DEFAULT_BAND,
+        deal_bounds=DEFAULT_DEAL_BOUNDS,
+        take_bounds=DEFAULT_TAKE_BOUNDS,
+        duels=DEFAULT_DUELS,
+        exact=False,
+        seed=0,
+    ):
+        self.characters_dir = characters_dir
+        self.band = band
+        self.bounds = (deal_bounds, take_bounds)
+        self.duels = duels
+        self.exact = exact
+        self.seed = seed
+        self.rng = Stream(derive_seed(seed, "mutations"))
+
+        # every form's amounts as they are in the files (no disk cache: the
+        # files are what we are about to change)
+        index = BalanceIndex(path=None)
+        index.refresh((characters_dir,))
+        self.forms = index.forms
+        self.names = sorted(list_character_dirs(characters_dir))
+        self.tunable = [f"{characters_dir}/{name}" for name in self.names]
+        # namepath -> (deals, takes) to start from: the files, inside the bounds
+        self.original = {
+            namepath: (
+                tuple(self.forms[namepath]["deals"]),
+                tuple(self.forms[namepath]["takes"]),
+            )
+            for namepath in self.tunable
+        }
+        self.start = {}
+        for namepath, both in self.original.items():
+            amounts = [list(part) for part in both]
+            for which, dim in self._mutable(namepath):
+                amounts[which][dim] = self._clamp(which, amounts[which][dim])
+            self.start[namepath] = tuple(tuple(part) for part in amounts)
+        # (player, opponent, player's amounts, opponent's amounts) -> win rates
+        self._results = {}
+
+    def _clamp(self, which, amount):
+        low, high = self.bounds[which]
+        return max(low, min(high, amount))
+
+    ## Mutations
+
+    def _mutable(self, namepath):
+        # (0 for deals / 1 for takes, dimension index): nobody's deals change
+        # in a dimension they have no spells for, so it stays at 0
+        able = self.forms[namepath]["able"]
+        return [(0, DIMENSIONS.index(dim)) for dim in able] + [
+            (1, idx) for idx in range(len(DIMENSIONS))
+        ]
+
+    def mutate(self, roster, max_changes=DEFAULT_MAX_CHANGES):
+        mutant = dict(roster)
+        for _ in range(self.rng.randint(1, max_changes)):
+            namepath = self.rng.choice(self.tunable)
+            which, dim = self.rng.choice(self._mutable(namepath))
+            amounts = [list(part) for part in mutant[namepath]]
+            amounts[which][dim] = self._clamp(
+                which, amounts[which][dim] + self.rng.choice((-1, 1))
+            )
+            mutant[namepath] = tuple(tuple(part) for part in amounts)
+        return mutant
+
+    ## Scoring rosters
+
+    def _task(self, roster, player, opponent):
+        overrides = {player: roster[player], opponent: roster[opponent]}
+        key = (player, opponent, overrides[player], overrides[opponent])
+        seed = derive_seed(self.seed, player, opponent)
+        return key, (player, opponent, overrides, self.duels, seed, self.exact)
+
+    def _pairs(self):
+        return [
+            (player, opponent)
+            for player in self.tunable
+            for opponent in self.tunable
+            if player != opponent
+        ]
+
+    def evaluate(self, rosters, executor_map=map):
+        """Score every matchup of every roster that isn't remembered yet,
+        through executor_map (e.g. a process pool's map).
+        """
+        todo = {}
+        for roster in rosters:
+            for player, opponent in self._pairs():
+                key, task = self._task(roster, player, opponent)
+                if key not in self._results:
+                    todo[key] = task
+        for key, rates in zip(todo, executor_map(_score_matchup, todo.values())):
+            self._results[key] = rates
+
+    def win_rates(self, roster):
+        """(a, b) -> a's chance of beating b, going first and second equally
+        often. Everything has to have been evaluate()d.
+        """
+        rates = {}
+        for player, opponent in self._pairs():
+            player_first = self._results[self._task(roster, player, opponent)[0]]
+            opponent_first = self._results[self._task(roster, opponent, player)[0]]
+            rates[player, opponent] = (player_first[0] + opponent_first[1]) / 2
+        return rates
+
+    def miss(self, roster):
+        """How far outside the band the pairings are, squared and summed."""
+        low, high = self.band
+        return sum(
+            max(0.0, low - rate, rate - high) ** 2
+            for rate in self.win_rates(roster).values()
+        )
+
+    def changes(self, roster):
+        return sum(
+            abs(new - old)
+            for namepath in self.tunable
+            for new_part, old_part in zip(roster[namepath], self.original[namepath])
+            for new, old in zip(new_part, old_part)
+        )
+
+    def score(self, roster):
+        return self.miss(roster) + CHANGE_WEIGHT * self.changes(roster)
+
+    ## Searching
+
+    def search(
+        self,
+        generations=DEFAULT_GENERATIONS,
+        population=DEFAULT_POPULATION,
+        workers=None,
+        report=print,
+    ):
+        """Evolve from the current files; return the best roster found."""
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            best = self.start
+            self.evaluate([best], executor.map)
+            best_score = self.score(best)
+            report(f"start: miss {self.miss(best):.4f}")
+            for generation in range(generations):
+                if self.miss(best) == 0:
+                    break
+                mutants = [self.mutate(best) for _ in range(population)]
+                self.evaluate(mutants, executor.map)
+                mutant = min(mutants, key=self.score)
+                if self.score(mutant) <= best_score:
+                    best, best_score = mutant, self.score(mutant)
+                report(
+                    f"generation {generation + 1}: miss {self.miss(best):.4f}, "
+                    f"{self.changes(best)} points changed, "
+                    f"{len(self._results)} matchups scored"
+                )
+        return best
+
+    ## Writing it out
+
+    def patch(self, roster):
+        """A unified diff of every magic.json the roster changes, relative to
+        the repository root (so `git apply` takes it).
+        """
+        diffs = []
+        for namepath in self.tunable:
+            if roster[namepath] == self.original[namepath]:
+                continue
+            filepath = f"{namepath}/magic.json"
+            with open(filepath) as magic_fl:
+                before = magic_fl.read()
+            magic_info = json.loads(before)
+            deals, takes = roster[namepath]
+            for idx, dim in enumerate(DIMENSIONS):
+                magic_info["deals"][dim]["amount"] = deals[idx]
+                magic_info["takes"][dim]["amount"] = takes[idx]
+            after = json.dumps(magic_info, indent=4, ensure_ascii=False) + "\n"
+            diffs.extend(
+                difflib.unified_diff(
+                    before.splitlines(keepends=True),
+                    after.splitlines(keepends=True),
+                    fromfile=f"a/{filepath}",
+                    tofile=f"b/{filepath}",
+                )
+            )
+        return "".join(diffs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the roster's amounts.")
+    parser.add_argument(
+        "--band", type=float, nargs=2, default=DEFAULT_BAND, metavar=("LOW", "HIGH")
+    )
+    parser.add_argument(
+        "--deal-bounds", type=int, nargs=2, default=DEFAULT_DEAL_BOUNDS
+    )
+    parser.add_argument(
+        "--take-bounds", type=int, nargs=2, default=DEFAULT_TAKE_BOUNDS
+    )
+    parser.add_argument("--duels", type=int, default=DEFAULT_DUELS)
+    parser.add_argument(
+        "--exact", action="store_true", help="score with solver.py (slow)"
+    )
+    parser.add_argument("--generations", type=int, default=DEFAULT_GENERATIONS)
+    parser.add_argument("--population", type=int, default=DEFAULT_POPULATION)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--out", default="rebalance.patch")
+    args = parser.parse_args()
+
+    rebalancer = Rebalancer(
+        band=tuple(args.band),
+        deal_bounds=tuple(args.deal_bounds),
+        take_bounds=tuple(args.take_bounds),
+        duels=args.duels,
+        exact=args.exact,
+        seed=args.seed,
+    )
+    best = rebalancer.search(
+        generations=args.generations,
+        population=args.population,
+        workers=args.workers,
+    )
+
+    low, high = rebalancer.band
+    prefix = f"{rebalancer.characters_dir}/"
+    for (player, opponent), rate in sorted(rebalancer.win_rates(best).items()):
+        if player < opponent and not low <= rate <= high:
+            print(
+                f"still out of band: {player.removeprefix(prefix)} beats "
+                f"{opponent.removeprefix(prefix)} {rate:.1%} of the time"
+            )
+    with open(args.out, "w") as patch_fl:
+        patch_fl.write(rebalancer.patch(best))
+    print(f"{rebalancer.changes(best)} points changed, see {args.out}")
+
+
+if __name__ == "__main__":
+    main()
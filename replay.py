@@ -0,0 +1,105 @@
+"""
+Play recorded duels back from an event log (see events.py), with no output
+and no waiting, and check that they come out the same way.
+
+    python replay.py duels.jsonl               # replay every duel, report mismatches
+    python replay.py duels.jsonl --show 3      # print the events of duel 3
+
+A duel is rebuilt from its DuelStarted (who fought, and the seed) and its
+Moves alone; every hit, special effect and expiry is worked out again by the
+current rules. So a rule change that alters any recorded outcome shows up as
+a mismatch.
+"""
+
+import argparse
+import time
+
+from character import Character
+from events import DuelStarted, EventLog, Move, read_events, split_duels
+from frontend import NullFrontend, use_frontend
+from game import Game
+from game_macros import SpecialChoice, SpellChoice
+
+
+def _choice(game, move):
+    if move.kind == "spell":
+        return SpellChoice(dimension=move.value, hit=move.hit)
+    mover = game.opponent if move.side == "opponent" else game.player
+    for info in mover.special_abilities_info.values():
+        if info["effect"] == move.value:
+            return SpecialChoice(description=info["description"], effect=move.value)
+    return SpecialChoice(description="", effect=move.value)
+
+
+def replay_duel(events):
+    """Play one recorded duel (its events, DuelStarted first) again, and
+    return the events the replay produced.
+    """
+    started = events[0]
+    if not isinstance(started, DuelStarted):
+        raise ValueError(f"A duel starts with DuelStarted, not {started}")
+
+    # headless: the duelists come from the log, so no roster to go through
+    game = Game.for_duel(
+        Character(name=started.player, special_namepath=started.player_namepath),
+        Character(name=started.opponent, special_namepath=started.opponent_namepath),
+        event_log=EventLog(),
+    )
+
+    previous_frontend = use_frontend(NullFrontend())
+    try:
+        game.begin_duel(seed=started.seed, batched=started.batched)
+        for move in events:
+            if isinstance(move, Move):
+                game.play_move(_choice(game, move), is_computer=move.side == "opponent")
+    finally:
+        use_frontend(previous_frontend)
+
+    return game.event_log.events
+
+
+def first_difference(recorded, replayed):
+    """Index of the first event where the two disagree, or None if they match."""
+    for idx, (ours, theirs) in enumerate(zip(recorded, replayed)):
+        if ours != theirs:
+            return idx
+    if len(recorded) != len(replayed):
+        return min(len(recorded), len(replayed))
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Magic Fight duels.")
+    parser.add_argument("log")
+    parser.add_argument("--show", type=int, metavar="DUEL", help="print one duel")
+    args = parser.parse_args()
+
+    duels = split_duels(read_events(args.log))
+    if args.show is not None:
+        for event in duels[args.show]:
+            print(event)
+        return
+
+    start = time.perf_counter()
+    mismatches = 0
+    moves = 0
+    for number, recorded in enumerate(duels):
+        replayed = replay_duel(recorded)
+        moves += sum(isinstance(event, Move) for event in recorded)
+        idx = first_difference(recorded, replayed)
+        if idx is None:
+            continue
+        mismatches += 1
+        print(f"duel {number} differs at event {idx}:")
+        print(f"  recorded: {recorded[idx] if idx < len(recorded) else None}")
+        print(f"  replayed: {replayed[idx] if idx < len(replayed) else None}")
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Replayed {len(duels)} duels ({moves} moves) in {elapsed:.2f}s, "
+        f"{mismatches} mismatched"
+    )
+
+
+if __name__ == "__main__":
+    main()
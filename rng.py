@@ -0,0 +1,95 @@
+"""
+Where the game's luck comes from.
+
+Nothing in the game calls the random module's functions directly. It draws
+from current_rng(), the stream in use right now. Like the frontend, that stream
+is a context variable, so each asyncio task or thread has its own. Each duel
+gets its own stream too (see Game.begin_duel).
+
+    Stream(seed)         a random.Random that remembers its seed and can split
+    BatchedStream(seed)  the same, except that percent rolls come from big
+                         pre-drawn blocks (for simulation hot loops)
+
+Splitting is how parallel runs stay reproducible. Stream(42).split("nora",
+"winston", 3) is the same stream in every process, whoever asks for it and in
+whatever order.
+"""
+
+import hashlib
+import os
+import random
+from contextvars import ContextVar
+
+# Percent rolls per block in BatchedStream
+DEFAULT_BLOCK_SIZE = 1 << 14
+
+# Random bytes 0..201 map two-to-one onto 0..100; the rest get thrown away, so
+# what is left is exactly uniform.
+_PERCENTS = bytes(byte % 101 for byte in range(256))
+_REJECTED = bytes(range(202, 256))
+
+
+def derive_seed(seed, *key):
+    """A 64-bit seed determined by seed and key alone (in any process)."""
+    text = "\x1f".join(str(part) for part in (seed, *key))
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class Stream(random.Random):
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = int.from_bytes(os.urandom(8), "little")
+        self.initial_seed = seed
+        super().__init__(seed)
+
+    def split(self, *key):
+        """A new, independent stream of the same kind, determined by this one's
+        seed and key (and not by how much of this one has been used).
+        """
+        return type(self)(derive_seed(self.initial_seed, *key))
+
+    def roll(self):
+        """A whole number from 0 to 100, all equally likely (see did_it_happen)."""
+        # what randint(0, 100) boils down to, minus the argument checking
+        return self._randbelow(101)
+
+
+class BatchedStream(Stream):
+    def __init__(self, seed=None, block_size=DEFAULT_BLOCK_SIZE):
+        self.block_size = block_size
+        super().__init__(seed)
+
+    def seed(self, *args, **kwargs):
+        # whatever was pre-drawn came from the old seed
+        self._rolls = iter(())
+        super().seed(*args, **kwargs)
+
+    def split(self, *key):
+        return type(self)(
+            derive_seed(self.initial_seed, *key), block_size=self.block_size
+        )
+
+    def roll(self):
+        roll = next(self._rolls, None)
+        while roll is None:
+            # one randbytes call and one translate per block, both in C (and
+            # another, if every byte of a small block got thrown away)
+            block = self.randbytes(self.block_size).translate(_PERCENTS, _REJECTED)
+            self._rolls = iter(block)
+            roll = next(self._rolls, None)
+        return roll
+
+
+_rng = ContextVar("rng", default=Stream())
+
+
+def current_rng():
+    return _rng.get()
+
+
+def use_rng(rng):
+    """Switch (this context) over to rng, and return the one it replaces."""
+    previous = _rng.get()
+    _rng.set(rng)
+    return previous
@@ -0,0 +1,54 @@
+from collections.abc import MutableMapping
+
+from character import Character, get_template, list_character_dirs
+from game_macros import CHARACTERS_DIR
+
+
+class Roster(MutableMapping):
+    """Everybody available to fight, as a dict of name -> Character that only
+    builds a Character when somebody actually asks for it.
+
+    Finding out who is on the roster is just a directory scan. Bios and art
+    can be peeked at through template() without building anyone, and magic
+    info is only ever loaded for the characters that end up dueling.
+
+    Extra character directories (community packs, say) can be listed after
+    the built-in one; a pack character with the same name as an earlier one
+    replaces it.
+    """
+
+    def __init__(self, characters_dirs=(CHARACTERS_DIR,)):
+        # name -> where their files live
+        self._namepaths = {}
+        # name -> Character, for whoever has been asked for so far
+        self._characters = {}
+
+        for characters_dir in characters_dirs:
+            for name in list_character_dirs(characters_dir):
+                self._namepaths[name] = f"{characters_dir}/{name}"
+
+    def template(self, name):
+        """Shared, lazily loaded data (bio, art, ...) for the named character."""
+        return get_template(self._namepaths[name])
+
+    def __getitem__(self, name):
+        character = self._characters.get(name)
+        if character is None:
+            character = self._characters[name] = Character(
+                name=name.title(), special_namepath=self._namepaths[name]
+            )
+        return character
+
+    def __setitem__(self, name, character):
+        self._namepaths[name] = character.namepath
+        self._characters[name] = character
+
+    def __delitem__(self, name):
+        del self._namepaths[name]
+        self._characters.pop(name, None)
+
+    def __iter__(self):
+        return iter(self._namepaths)
+
+    def __len__(self):
+        return len(self._namepaths)
@@ -0,0 +1,523 @@
+"""
+Magic Fight over the network: one asyncio process hosting lots of duels at
+once, each one a plain Game driven by a client on the other end of a socket.
+
+    python server.py                      # serve on 127.0.0.1:8765
+    python server.py --hard --port 9000
+    python server.py --bots 1000          # serve locally, fight 1000 bots, report
+
+The protocol is one UTF-8 line per message. The client opens with
+
+    HELLO human      (or HELLO bot, to skip all the dramatic pauses)
+
+and the server then talks with
+
+    SAY <text>              narration, one line of it
+    CHOICE <number> <text>  one option of the menu that follows
+    ASK menu                answer with one of the CHOICE numbers
+    ASK confirm             answer with y or n
+    BYE <winner>            player, opponent or quit; the server hangs up
+
+so `nc localhost 8765` is enough to play. Sessions never get a thread of their
+own: narration is collected per session (in a frontend.BufferedFrontend) and sent
+whenever the game stops to ask something, and pauses become asyncio sleeps
+(or nothing at all, for bots).
+
+With --evict-after, a duel whose player hasn't answered for that long gets
+saved to --sessions-dir (see snapshot.py) and the server says BYE saved <token>
+and hangs up. Opening with
+
+    RESUME <token>   (or RESUME <token> bot)
+
+instead of HELLO, on this server or any other sharing the directory, picks the
+duel up again at the start of the player's turn.
+
+With --watch-content, changes to the character files get picked up for new
+duels without a restart (see content.py).
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import secrets
+import time
+from collections import Counter
+from functools import partial
+
+from bundle import open_bundle
+from character import use_bundle
+from content import ContentWatcher
+from frontend import (
+    BufferedFrontend,
+    menu_choices,
+    menu_label,
+    parse_confirm_answer,
+    parse_menu_answer,
+    resolve_menu_choice,
+    use_frontend,
+)
+from game import Game
+from game_macros import CHARACTERS_BUNDLE, SpellChoice, did_it_happen, pause, say
+from metrics import enable as enable_metrics, write_prometheus
+from policy_table import require_policy_table
+from rng import current_rng, use_rng
+from snapshot import load_snapshot, save_snapshot
+from special_abilities import load_plugins, validate_special_abilities
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# pending connections the listening socket will queue up; big enough that a
+# crowd arriving at once does not get turned away
+BACKLOG = 4096
+# seconds between rewrites of the --metrics file
+METRICS_INTERVAL = 15
+DEFAULT_SESSIONS_DIR = "sessions"
+_TOKEN = re.compile(r"[0-9a-f]{32}")
+
+
+class SessionEvicted(Exception):
+    """The player went quiet for too long mid-duel, and the duel got saved."""
+
+    def __init__(self, token):
+        super().__init__(token)
+        self.token = token
+
+
+class DuelSession:
+    """One client, one Game. The async versions of Game.play, player_turn and
+    select_character live here; everything else is the Game's own logic.
+    """
+
+    def __init__(
+        self,
+        reader,
+        writer,
+        difficulty="normal",
+        pace=1.0,
+        evict_after=None,
+        sessions_dir=DEFAULT_SESSIONS_DIR,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.game = Game(difficulty=difficulty)
+        self.pace = pace
+        self.bot = False
+        # what the game has said and paused for since the last flush
+        self.frontend = BufferedFrontend()
+        # seconds to wait for the player mid-duel before saving it for later
+        # (None: forever)
+        self.evict_after = evict_after
+        self.sessions_dir = sessions_dir
+        self.dueling = False
+
+    async def readline(self):
+        if self.dueling and self.evict_after is not None:
+            try:
+                line = await asyncio.wait_for(
+                    self.reader.readline(), self.evict_after
+                )
+            except asyncio.TimeoutError:
+                raise SessionEvicted(self.evict()) from None
+        else:
+            line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("client hung up")
+        return line.decode("utf-8", "replace").strip()
+
+    async def send(self, *lines):
+        for line in lines:
+            self.writer.write(f"{line}\n".encode("utf-8"))
+        await self.writer.drain()
+
+    async def flush(self):
+        """Send everything said since the last flush, sleeping through the
+        pauses in between (humans only; bots do not need time to read).
+        """
+        for kind, value in self.frontend.drain():
+            if kind == "say":
+                for line in value.split("\n"):
+                    self.writer.write(f"SAY {line}\n".encode("utf-8"))
+            elif kind == "pause" and not self.bot and self.pace:
+                await self.writer.drain()
+                await asyncio.sleep(value * self.pace)
+        await self.writer.drain()
+
+    async def choose(
+        self, prompt, choices, capitalize_choice=True, offer_random_choice=False
+    ):
+        """get_input_choice, over the wire."""
+        input_choices = menu_choices(choices, offer_random_choice)
+        while True:
+            say(prompt)
+            await self.flush()
+            await self.send(
+                *(
+                    f"CHOICE {idx} {menu_label(item, capitalize_choice)}"
+                    for idx, item in input_choices.items()
+                ),
+                "ASK menu",
+            )
+            choice = parse_menu_answer(await self.readline(), input_choices)
+            if choice is not None:
+                return resolve_menu_choice(choice, input_choices, offer_random_choice)
+            say("Please choose a number in the given range.")
+
+    async def confirm(self, prompt):
+        """confirm_input_choice, over the wire. Just True or False, since the
+        caller can simply loop instead of handing over a deny_func.
+        """
+        while True:
+            say(prompt)
+            say("Confirm choice? Type y or n.")
+            await self.flush()
+            await self.send("ASK confirm")
+            confirmed = parse_confirm_answer(await self.readline())
+            if confirmed is not None:
+                return confirmed
+            say('Please type "y" or "n"')
+
+    async def select_character(self, prompt="Press a key to choose a character:\n"):
+        characters = self.game.all_characters
+        while True:
+            name = await self.choose(prompt, characters, offer_random_choice=True)
+            template = characters.template(name)
+            if await self.confirm(f"{template.ascii_art}\n\n{template.bio}\n"):
+                return name
+
+    async def player_turn(self):
+        game = self.game
+        while True:
+            spell_infos = game._construct_player_spell_choices()
+            spell = await self.choose(
+                "\nChoose your spell:\n", spell_infos, capitalize_choice=False
+            )
+            choice = spell_infos[spell]
+            if isinstance(choice, SpellChoice) or await self.confirm(
+                choice.description
+            ):
+                break
+
+        game.play_move(choice)
+
+    def _snapshot_path(self, token):
+        return os.path.join(self.sessions_dir, f"{token}.snapshot")
+
+    def evict(self):
+        """Save the duel (which is always at the start of the player's turn
+        when they are being waited on) and return the token to resume it by.
+        """
+        token = secrets.token_hex(16)
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        save_snapshot(self.game, self._snapshot_path(token))
+        return token
+
+    def resume(self, token):
+        """Take up the duel saved under token (once only: the file goes).
+        False if there is no such duel.
+        """
+        if not _TOKEN.fullmatch(token):
+            return False
+        path = self._snapshot_path(token)
+        try:
+            self.game = load_snapshot(path)
+            os.remove(path)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    async def play(self):
+        """Game.play, except that it returns who won ("player" or "opponent")."""
+        # this task's context only, so sessions do not hear each other
+        use_frontend(self.frontend)
+        game = self.game
+
+        player_choice = await self.select_character()
+        game.player = game.all_characters[player_choice]
+        del game.all_characters[player_choice]
+
+        opponent_choice = await self.select_character(
+            prompt="Press a key to choose your opponent:\n"
+        )
+        game.opponent = game.all_characters[opponent_choice]
+        game.begin_duel()
+
+        say(f"\n{game.opponent.name} is ready to duel!\n")
+        pause(1)
+        say("Ready?\n")
+        pause(2)
+        return await self.duel()
+
+    async def duel(self, resumed=False):
+        """The duel itself, from the start of the player's turn."""
+        use_frontend(self.frontend)
+        game = self.game
+        use_rng(game.rng)
+        self.dueling = True
+        if resumed:
+            say(f"\nWelcome back, Sorcerer. {game.opponent.name} has been waiting.\n")
+            pause(1)
+
+        while True:
+            game.player.print_life()
+            game.opponent.print_life()
+            pause(1)
+
+            await self.player_turn()
+            if game.opponent.life <= 0:
+                say(
+                    f"You have defeated {game.opponent.name}! Congratulations, Sorcerer."
+                )
+                pause(2)
+                await self.flush()
+                return "player"
+
+            # no questions get asked on the opponent's turn, so it runs straight
+            # through and its narration goes out with the next question
+            game.opponent_turn()
+            if game.player.life <= 0:
+                say(f"{game.opponent.name} has bested you. Game over.")
+                pause(2)
+                await self.flush()
+                return "opponent"
+
+
+async def serve_session(
+    reader,
+    writer,
+    difficulty="normal",
+    pace=1.0,
+    evict_after=None,
+    sessions_dir=DEFAULT_SESSIONS_DIR,
+):
+    session = DuelSession(
+        reader,
+        writer,
+        difficulty=difficulty,
+        pace=pace,
+        evict_after=evict_after,
+        sessions_dir=sessions_dir,
+    )
+    winner = "quit"
+    try:
+        hello = (await session.readline()).split()
+        if hello[:1] == ["HELLO"]:
+            session.bot = hello[1:] == ["bot"]
+            winner = await session.play()
+        elif hello[:1] == ["RESUME"] and len(hello) > 1:
+            session.bot = hello[2:] == ["bot"]
+            if session.resume(hello[1]):
+                winner = await session.duel(resumed=True)
+        await session.send(f"BYE {winner}")
+    except SessionEvicted as evicted:
+        await session.send(f"BYE saved {evicted.token}")
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_duel_server(
+    host=DEFAULT_HOST,
+    port=DEFAULT_PORT,
+    difficulty="normal",
+    pace=1.0,
+    evict_after=None,
+    sessions_dir=DEFAULT_SESSIONS_DIR,
+):
+    """An asyncio Server running one DuelSession per connection."""
+    return await asyncio.start_server(
+        partial(
+            serve_session,
+            difficulty=difficulty,
+            pace=pace,
+            evict_after=evict_after,
+            sessions_dir=sessions_dir,
+        ),
+        host,
+        port,
+        backlog=BACKLOG,
+    )
+
+
+async def bot_client(host=DEFAULT_HOST, port=DEFAULT_PORT, confirm_chance=0.8):
+    """A stand-in player: picks random menu options, says yes to most things,
+    and returns the winner from the server's BYE.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"HELLO bot\n")
+    options = []
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return "quit"
+            kind, _, rest = line.decode("utf-8").rstrip("\n").partition(" ")
+            if kind == "CHOICE":
+                options.append(rest.split(" ", 1)[0])
+            elif kind == "ASK":
+                if rest == "menu":
+                    answer = current_rng().choice(options)
+                else:
+                    answer = "y" if did_it_happen(confirm_chance) else "n"
+                options = []
+                writer.write(f"{answer}\n".encode("utf-8"))
+                await writer.drain()
+            elif kind == "BYE":
+                return rest
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_bots(bots, difficulty="normal"):
+    """Serve on a free local port and have that many bots play at once.
+
+    Return (Counter of winners, seconds it all took).
+    """
+    server = await start_duel_server(DEFAULT_HOST, 0, difficulty=difficulty)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        start = time.perf_counter()
+        winners = await asyncio.gather(
+            *(bot_client(DEFAULT_HOST, port) for _ in range(bots))
+        )
+        elapsed = time.perf_counter() - start
+    return Counter(winners), elapsed
+
+
+async def write_metrics_every(path, seconds=METRICS_INTERVAL):
+    while True:
+        await asyncio.sleep(seconds)
+        write_prometheus(path)
+
+
+async def watch_content_every(seconds, watcher=None):
+    watcher = watcher or ContentWatcher()
+    while True:
+        await asyncio.sleep(seconds)
+        watcher.poll()
+
+
+async def serve_forever(
+    host,
+    port,
+    difficulty,
+    pace,
+    metrics_path=None,
+    evict_after=None,
+    sessions_dir=DEFAULT_SESSIONS_DIR,
+    watch_content=None,
+):
+    server = await start_duel_server(
+        host,
+        port,
+        difficulty=difficulty,
+        pace=pace,
+        evict_after=evict_after,
+        sessions_dir=sessions_dir,
+    )
+    print(f"Magic Fight server listening on {host}:{port}")
+    if metrics_path:
+        metrics_task = asyncio.create_task(write_metrics_every(metrics_path))
+    if watch_content:
+        content_task = asyncio.create_task(watch_content_every(watch_content))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if watch_content:
+            content_task.cancel()
+        if metrics_path:
+            metrics_task.cancel()
+            write_prometheus(metrics_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host Magic Fight duels.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--hard", action="store_true")
+    parser.add_argument(
+        "--pace", type=float, default=1.0, help="multiply every pause by this"
+    )
+    parser.add_argument(
+        "--bots",
+        type=int,
+        default=0,
+        help="instead of serving, fight this many local bot clients and report",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="count hot paths, and keep a Prometheus text file of them here",
+    )
+    parser.add_argument(
+        "--evict-after",
+        type=float,
+        metavar="SECONDS",
+        help="save duels whose player has gone quiet this long, to resume later",
+    )
+    parser.add_argument("--sessions-dir", default=DEFAULT_SESSIONS_DIR)
+    parser.add_argument(
+        "--watch-content",
+        type=float,
+        metavar="SECONDS",
+        help="look for changed character files this often, for new duels to use",
+    )
+    parser.add_argument(
+        "--bundle",
+        nargs="?",
+        const=CHARACTERS_BUNDLE,
+        metavar="PATH",
+        help="load everyone from a `python bundle.py build` file instead",
+    )
+    parser.add_argument(
+        "--plugin",
+        action="append",
+        default=[],
+        metavar="MODULE",
+        help="import this module first, for the special effects it registers",
+    )
+    args = parser.parse_args()
+
+    if args.bundle:
+        use_bundle(open_bundle(args.bundle))
+    load_plugins(args.plugin)
+    # before anybody connects, rather than on the first one's Game()
+    validate_special_abilities()
+    difficulty = "hard" if args.hard else "normal"
+    if args.hard:
+        require_policy_table()
+    if args.metrics:
+        enable_metrics()
+
+    if args.bots:
+        winners, elapsed = asyncio.run(run_bots(args.bots, difficulty=difficulty))
+        print(
+            f"{args.bots} duels in {elapsed:.2f}s: "
+            + ", ".join(f"{winner} {count}" for winner, count in winners.most_common())
+        )
+        if args.metrics:
+            write_prometheus(args.metrics)
+        return
+
+    try:
+        asyncio.run(
+            serve_forever(
+                args.host,
+                args.port,
+                difficulty,
+                args.pace,
+                metrics_path=args.metrics,
+                evict_after=args.evict_after,
+                sessions_dir=args.sessions_dir,
+                watch_content=args.watch_content,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Headless duels: no printing, no sleeping, no typing. Just a lot of fighting.
+
+Runs the very same rules as Game (every move goes through Game.play_move)
+with pluggable policies standing in for the player and the computer, and
+tallies up who won, how long it took and how much damage got thrown around.
+Handy for balance tuning, since nobody wants to play Winston against Bastion a
+thousand times by hand.
+
+    python simulation.py --players nora --opponents winston bastion --matches 100000
+    python simulation.py --matches 100 --record duels.jsonl   # see replay.py
+"""
+
+import argparse
+import math
+from collections import Counter, namedtuple
+from statistics import NormalDist
+
+from balance import able_dimensions
+from character import Character
+from events import EventLog
+from frontend import NullFrontend, use_frontend
+from game import Game, pick_computer_move
+from game_macros import SpellChoice
+from metrics import enable as enable_metrics, summary as metrics_summary
+from rng import Stream, current_rng, derive_seed, use_rng
+from roster import Roster
+
+# Some matchups (looking at you, meadow sprite) can dance around forever,
+# so call it a draw eventually.
+DEFAULT_MAX_TURNS = 200
+DEFAULT_CONFIDENCE = 0.95
+# with a tolerance, how many matches get played between checks on whether
+# that's enough already (and so the fewest any matchup gets)
+CHECK_EVERY = 100
+
+DuelResult = namedtuple(
+    "DuelResult",
+    ["winner", "turns", "player_damage", "opponent_damage", "damage_by_dimension"],
+)
+
+
+## Policies: given the character whose turn it is and the one they are
+## fighting, return a SpellChoice or SpecialChoice.
+
+
+def random_policy(me, them):
+    """Fight exactly like the computer does in Game.opponent_turn."""
+    return pick_computer_move(me)
+
+
+def spells_only_policy(me, them):
+    """Random spells, never any special abilities."""
+    spell_info = me.magic_info["deals"]
+    dimension = current_rng().choice(able_dimensions(me))
+    return SpellChoice(dimension=dimension, hit=spell_info[dimension]["amount"])
+
+
+def greedy_policy(me, them):
+    """Always cast whichever spell hurts them the most right now."""
+    best = None
+    best_hit = -1
+    deals = me.magic_info["deals"]
+    for dimension in able_dimensions(me):
+        info = deals[dimension]
+        hit = min(them.magic_info["takes"][dimension]["amount"], info["amount"])
+        if hit > best_hit:
+            best, best_hit = SpellChoice(dimension=dimension, hit=info["amount"]), hit
+    return best
+
+
+POLICIES = {
+    "random": random_policy,
+    "spells_only": spells_only_policy,
+    "greedy": greedy_policy,
+}
+
+
+def z_score(confidence=DEFAULT_CONFIDENCE):
+    """How many standard deviations either side a two-sided interval spans."""
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def wilson_interval(successes, trials, z=z_score()):
+    """Wilson score interval for a rate of successes out of trials. Unlike
+    the textbook rate ± z standard errors, it behaves at 0 and 1 (a matchup
+    somebody always wins still gets an interval, and a narrow one).
+    """
+    if not trials:
+        return 0.0, 1.0
+    rate = successes / trials
+    spread = z * z / trials
+    center = (rate + spread / 2) / (1 + spread)
+    half_width = (
+        z * math.sqrt(rate * (1 - rate) / trials + spread / (4 * trials))
+    ) / (1 + spread)
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+class MatchupStats:
+    """Running tally for one player vs. opponent pairing. Everything here is
+    a count or a small histogram, so it stays the same size no matter how many
+    matches get recorded, and two tallies can be merged.
+    """
+
+    def __init__(self, player_name, opponent_name):
+        self.player_name = player_name
+        self.opponent_name = opponent_name
+        self.matches = 0
+        self.player_wins = 0
+        self.opponent_wins = 0
+        self.draws = 0
+        self.total_turns = 0
+        # turns per match -> number of matches
+        self.turn_counts = Counter()
+        # total damage dealt in a match -> number of matches
+        self.player_damage = Counter()
+        self.opponent_damage = Counter()
+        # ("player" or "opponent", dimension) -> total damage over all matches
+        self.damage_by_dimension = Counter()
+
+    def record(self, result):
+        self.matches += 1
+        if result.winner == "player":
+            self.player_wins += 1
+        elif result.winner == "opponent":
+            self.opponent_wins += 1
+        else:
+            self.draws += 1
+        self.total_turns += result.turns
+        self.turn_counts[result.turns] += 1
+        self.player_damage[result.player_damage] += 1
+        self.opponent_damage[result.opponent_damage] += 1
+        self.damage_by_dimension.update(result.damage_by_dimension)
+
+    def merge(self, other):
+        self.matches += other.matches
+        self.player_wins += other.player_wins
+        self.opponent_wins += other.opponent_wins
+        self.draws += other.draws
+        self.total_turns += other.total_turns
+        self.turn_counts.update(other.turn_counts)
+        self.player_damage.update(other.player_damage)
+        self.opponent_damage.update(other.opponent_damage)
+        self.damage_by_dimension.update(other.damage_by_dimension)
+        return self
+
+    @property
+    def player_win_rate(self):
+        return self.player_wins / self.matches if self.matches else 0.0
+
+    @property
+    def opponent_win_rate(self):
+        return self.opponent_wins / self.matches if self.matches else 0.0
+
+    @property
+    def average_turns(self):
+        return self.total_turns / self.matches if self.matches else 0.0
+
+    def win_intervals(self, z=z_score()):
+        """Wilson intervals for the player's and the opponent's win rates."""
+        return (
+            wilson_interval(self.player_wins, self.matches, z),
+            wilson_interval(self.opponent_wins, self.matches, z),
+        )
+
+    def precise_to(self, tolerance, z=z_score()):
+        """Whether both win rates are known to within ± tolerance. Lopsided
+        matchups get there much sooner than close ones: the spread of a rate
+        near 0 or 1 is small.
+        """
+        return all(
+            (high - low) / 2 <= tolerance for low, high in self.win_intervals(z)
+        )
+
+    def summary(self):
+        def _average(histogram):
+            return sum(k * v for k, v in histogram.items()) / (self.matches or 1)
+
+        (low, high), _ = self.win_intervals()
+        return (
+            f"{self.player_name} vs. {self.opponent_name}: "
+            f"{self.player_win_rate:.1%} / {self.opponent_win_rate:.1%} "
+            f"(player {low:.1%}-{high:.1%}) "
+            f"({self.draws} draws) over {self.matches} matches, "
+            f"{self.average_turns:.1f} turns on average, "
+            f"avg damage dealt {_average(self.player_damage):.1f} / "
+            f"{_average(self.opponent_damage):.1f}"
+        )
+
+
+def play_headless(
+    game,
+    player_policy=random_policy,
+    opponent_policy=random_policy,
+    max_turns=DEFAULT_MAX_TURNS,
+    batched=True,
+):
+    """Play out a duel between game.player and game.opponent (player first,
+    same as Game.play), with no input, output or waiting. The duel's random
+    stream is a BatchedStream unless told otherwise.
+
+    Return a DuelResult; winner is "player", "opponent" or None for a draw.
+    """
+    damage = {"player": 0, "opponent": 0}
+    damage_by_dimension = Counter()
+    game.begin_duel(batched=batched)
+
+    turns = 0
+    while turns < max_turns:
+        for side, is_computer, policy in (
+            ("player", False, player_policy),
+            ("opponent", True, opponent_policy),
+        ):
+            me, them = (
+                (game.opponent, game.player)
+                if is_computer
+                else (game.player, game.opponent)
+            )
+            choice = policy(me, them)
+            hit = game.play_move(choice, is_computer=is_computer)
+            turns += 1
+            if isinstance(choice, SpellChoice):
+                damage[side] += hit
+                damage_by_dimension[(side, choice.dimension)] += hit
+
+            # Same (slightly lopsided) checks as Game.play: only the one who
+            # just got attacked is checked for defeat.
+            loser = game.player if is_computer else game.opponent
+            if loser.life <= 0:
+                return DuelResult(
+                    winner=side,
+                    turns=turns,
+                    player_damage=damage["player"],
+                    opponent_damage=damage["opponent"],
+                    damage_by_dimension=damage_by_dimension,
+                )
+
+    return DuelResult(
+        winner=None,
+        turns=turns,
+        player_damage=damage["player"],
+        opponent_damage=damage["opponent"],
+        damage_by_dimension=damage_by_dimension,
+    )
+
+
+def simulate_matchup(
+    player_name,
+    opponent_name,
+    matches,
+    player_policy=random_policy,
+    opponent_policy=random_policy,
+    max_turns=DEFAULT_MAX_TURNS,
+    event_log=None,
+    seed=None,
+    tolerance=None,
+    confidence=DEFAULT_CONFIDENCE,
+    so_far=None,
+):
+    """Run a number of headless duels for one pairing of roster names
+    (directory names, e.g. "nora") and return their MatchupStats. With an
+    events.EventLog, every duel gets recorded to it.
+
+    With a tolerance, matches is only the most it will play: every
+    CHECK_EVERY matches, it stops if both win rates are known to within
+    ± tolerance at the given confidence (see MatchupStats.precise_to). If
+    this pairing already played some matches elsewhere (earlier tournament
+    chunks), so_far is their MatchupStats, and those count toward it too; only
+    the new matches get returned, though.
+
+    The policies, and every duel's seed, draw from one rng.Stream(seed), so
+    the same seed gives the same results.
+    """
+    stats = MatchupStats(player_name, opponent_name)
+    game = Game.for_duel(event_log=event_log)
+    z = z_score(confidence)
+
+    previous_frontend = use_frontend(NullFrontend())
+    previous_rng = use_rng(Stream(seed))
+    try:
+        for played in range(1, matches + 1):
+            game.player = Character(name=player_name.title())
+            game.opponent = Character(name=opponent_name.title())
+            stats.record(
+                play_headless(
+                    game,
+                    player_policy=player_policy,
+                    opponent_policy=opponent_policy,
+                    max_turns=max_turns,
+                )
+            )
+            if tolerance is not None and played % CHECK_EVERY == 0:
+                checked = stats
+                if so_far is not None:
+                    checked = MatchupStats(player_name, opponent_name)
+                    checked.merge(so_far).merge(stats)
+                if checked.precise_to(tolerance, z):
+                    break
+    finally:
+        use_rng(previous_rng)
+        use_frontend(previous_frontend)
+
+    return stats
+
+
+def simulate(
+    player_names,
+    opponent_names,
+    matches,
+    player_policy=random_policy,
+    opponent_policy=random_policy,
+    max_turns=DEFAULT_MAX_TURNS,
+    event_log=None,
+    seed=None,
+    tolerance=None,
+    confidence=DEFAULT_CONFIDENCE,
+):
+    """Run every pairing between two rosters. Nobody fights themselves.
+    Each pairing's seed is split off the given one, and each stops on its own
+    once precise enough, given a tolerance (see simulate_matchup).
+
+    Return dict of (player name, opponent name) -> MatchupStats.
+    """
+    return {
+        (player_name, opponent_name): simulate_matchup(
+            player_name,
+            opponent_name,
+            matches,
+            player_policy=player_policy,
+            opponent_policy=opponent_policy,
+            max_turns=max_turns,
+            event_log=event_log,
+            seed=(
+                None if seed is None else derive_seed(seed, player_name, opponent_name)
+            ),
+            tolerance=tolerance,
+            confidence=confidence,
+        )
+        for player_name in player_names
+        for opponent_name in opponent_names
+        if player_name != opponent_name
+    }
+
+
+def main():
+    roster = sorted(Roster())
+    parser = argparse.ArgumentParser(description="Run headless Magic Fight duels.")
+    parser.add_argument("--players", nargs="+", default=roster, choices=roster)
+    parser.add_argument("--opponents", nargs="+", default=roster, choices=roster)
+    parser.add_argument(
+        "--matches", type=int, default=1000, help="per pairing (at most)"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        help="stop each pairing once its win rates are known to within this",
+    )
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--player-policy", default="random", choices=POLICIES)
+    parser.add_argument("--opponent-policy", default="random", choices=POLICIES)
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS)
+    parser.add_argument(
+        "--record", metavar="LOG", help="append every duel to this event log"
+    )
+    parser.add_argument("--seed", help="for reproducible results")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="afterwards, show which hot paths took the most time (see metrics.py)",
+    )
+    args = parser.parse_args()
+
+    event_log = EventLog(args.record) if args.record else None
+    if args.profile:
+        enable_metrics()
+
+    results = simulate(
+        args.players,
+        args.opponents,
+        args.matches,
+        player_policy=POLICIES[args.player_policy],
+        opponent_policy=POLICIES[args.opponent_policy],
+        max_turns=args.max_turns,
+        event_log=event_log,
+        seed=args.seed,
+        tolerance=args.tolerance,
+        confidence=args.confidence,
+    )
+    if event_log is not None:
+        event_log.close()
+    for stats in results.values():
+        print(stats.summary())
+    print(f"{sum(stats.matches for stats in results.values())} matches in all")
+    if args.profile:
+        print(metrics_summary())
+
+
+if __name__ == "__main__":
+    main()
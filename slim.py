@@ -0,0 +1,342 @@
+"""
+Slim duel state, for simulating a lot of duels at once.
+
+A Character has a __dict__, magic_info as dicts of dicts, and a template that
+holds bios and art. A headless duel only needs four things per side: life,
+which form they are in (shapeshifted, drunk...), their six deal amounts right
+now, and how many turns the other side's effect has left. Everything else
+about a form never changes, so it lives in one shared MatchupForms.
+
+    SlimCharacter   one side of one duel: __slots__ and a six-int array
+    DuelBatch       any number of duels packed into flat arrays (36 bytes
+                    each), which play_batch steps through in lockstep
+
+play_batch plays the same rules as Game.play_move, with both sides fighting
+like the computer (simulation.random_policy), so its results line up with
+simulation.py's statistically, although not roll for roll.
+
+    python slim.py nora winston --duels 1000000 --seed 7
+"""
+
+import argparse
+from array import array
+
+from damage import N_DIMENSIONS, DamageTable
+from game_macros import (
+    CHARACTERS_DIR,
+    DEFAULT_SPECIAL_ABILITY_TURNS,
+    DIMENSIONS,
+    GAME_LIFE,
+    OPPONENT_SPECIAL_ABILITY_CHANCE,
+)
+from rng import BatchedStream
+from simulation import DEFAULT_MAX_TURNS, MatchupStats
+from solver import SHAPESHIFT_TARGETS, form_after, reachable_forms
+
+# What a special ability does to the state (see special_abilities.py)
+SHAPESHIFT, POTION, SOBERING, ORBS = range(4)
+
+
+def _rolls_under(chance):
+    """did_it_happen(chance) is roll() < this (see game_macros.did_it_happen)."""
+    return sum(1 for roll in range(101) if 100 * chance > roll)
+
+
+class MatchupForms:
+    """Every form both sides of a matchup can take, as flat arrays: base deals
+    and takes (six per form), able dimensions and what each special ability
+    does, all indexed by [side][form].
+    """
+
+    def __init__(self, player_namepath, opponent_namepath, overrides=None):
+        self.namepaths = (player_namepath, opponent_namepath)
+        # overrides: namepath -> (deals, takes), see solver.reachable_forms
+        self.forms, self.form_index = zip(
+            *(reachable_forms(namepath, overrides) for namepath in self.namepaths)
+        )
+        # both sides' forms in one damage.DamageTable, the player's first: base
+        # deals and takes, and every spell hit between them
+        self.offsets = (0, len(self.forms[0]))
+        self.damage = DamageTable(
+            [form.namepath for forms in self.forms for form in forms],
+            [
+                (
+                    form.deals,
+                    form.takes,
+                    [1 if idx in form.able else 0 for idx in range(N_DIMENSIONS)],
+                )
+                for forms in self.forms
+                for form in forms
+            ],
+        )
+        self.able = tuple([form.able for form in forms] for forms in self.forms)
+        # (kind, form it leaves you in) for each special ability of each form
+        self.effects = tuple(
+            [
+                tuple(self._effect(side, form, effect) for effect in form.effects)
+                for form in self.forms[side]
+            ]
+            for side in (0, 1)
+        )
+
+    def base_deals(self, side, form):
+        """The six deals a side's form starts out with."""
+        return self.damage.row(self.damage.deals, self.offsets[side] + form)
+
+    def _effect(self, side, form, effect):
+        after = form_after(form, effect)
+        if after is None:
+            return ORBS, None
+        target = self.form_index[side][after]
+        if effect in SHAPESHIFT_TARGETS:
+            return SHAPESHIFT, target
+        return (POTION if after[1] else SOBERING), target
+
+
+class SlimCharacter:
+    __slots__ = ("life", "form", "deals", "effect_turns")
+
+    def __init__(self, life=GAME_LIFE, form=0, deals=None, effect_turns=0):
+        self.life = life
+        # index into MatchupForms.forms[side]
+        self.form = form
+        # six deal amounts, in DIMENSIONS order (the orbs can shuffle them)
+        self.deals = array("h", deals if deals is not None else [0] * N_DIMENSIONS)
+        # turns until the other side's effect wears off
+        self.effect_turns = effect_turns
+
+    @classmethod
+    def from_character(cls, character, matchup_forms, side):
+        """The slim state of a live Character on the given side."""
+        form = matchup_forms.form_index[side][(character.namepath, character.drunk)]
+        deals = character.magic_info["deals"]
+        return cls(
+            life=character.life,
+            form=form,
+            deals=[deals[dim]["amount"] for dim in DIMENSIONS],
+            effect_turns=character.effects.turns_left(),
+        )
+
+
+class DuelBatch:
+    """duels copies of one starting position (fresh duelists, unless given
+    SlimCharacters), packed into arrays: per duel two lives, two forms, twelve
+    deals, two effect counters and two damage tallies. Forms and counters are
+    8-bit and the rest 16-bit, so that's 36 bytes a duel (see nbytes).
+    """
+
+    def __init__(self, matchup_forms, duels, start=None):
+        self.matchup_forms = matchup_forms
+        self.duels = duels
+        if start is None:
+            start = tuple(
+                SlimCharacter(deals=matchup_forms.base_deals(side, 0))
+                for side in (0, 1)
+            )
+        player, opponent = start
+        self.lives = array("h", (player.life, opponent.life)) * duels
+        self.forms = array("B", (player.form, opponent.form)) * duels
+        self.deals = (player.deals + opponent.deals) * duels
+        self.effect_turns = (
+            array("B", (player.effect_turns, opponent.effect_turns)) * duels
+        )
+        self.damage = array("h", (0, 0)) * duels
+
+    def __len__(self):
+        return self.duels
+
+    def __getitem__(self, duel):
+        """(player, opponent) of one duel, as SlimCharacters."""
+        return tuple(self._duelist(2 * duel + side) for side in (0, 1))
+
+    def _duelist(self, slot):
+        start = slot * N_DIMENSIONS
+        return SlimCharacter(
+            life=self.lives[slot],
+            form=self.forms[slot],
+            deals=self.deals[start : start + N_DIMENSIONS],
+            effect_turns=self.effect_turns[slot],
+        )
+
+    def nbytes(self):
+        return sum(
+            values.itemsize * len(values)
+            for values in (
+                self.lives,
+                self.forms,
+                self.deals,
+                self.effect_turns,
+                self.damage,
+            )
+        )
+
+
+def play_batch(batch, max_turns=DEFAULT_MAX_TURNS, rng=None, names=None):
+    """Play every duel in the batch out (player first), both sides fighting
+    like the computer. Return a simulation.MatchupStats.
+    """
+    rng = rng or BatchedStream()
+    names = names or tuple(
+        namepath.rsplit("/", 1)[-1] for namepath in batch.matchup_forms.namepaths
+    )
+    stats = MatchupStats(*names)
+    table = batch.matchup_forms
+    lives, forms, deals = batch.lives, batch.forms, batch.deals
+    effect_turns, damage = batch.effect_turns, batch.damage
+    special_rolls = _rolls_under(OPPONENT_SPECIAL_ABILITY_CHANCE)
+    coin_rolls = _rolls_under(0.5)
+    roll, choice = rng.roll, rng.choice
+    base_deals, takes = table.damage.deals, table.damage.takes
+    hits, n_forms = table.damage.tensor, len(table.damage)
+    # (side, dimension) -> total damage
+    by_dimension = [0] * (2 * N_DIMENSIONS)
+
+    ongoing = array("I", range(batch.duels))
+    for turn in range(max_turns):
+        if not ongoing:
+            break
+        mover = turn % 2
+        other = 1 - mover
+        my_offset, their_offset = table.offsets[mover], table.offsets[other]
+        able, effects = table.able[mover], table.effects[mover]
+        still_going = array("I")
+
+        for duel in ongoing:
+            me, them = 2 * duel + mover, 2 * duel + other
+            form = forms[me]
+            my_effects = effects[form]
+
+            if my_effects and (not able[form] or roll() < special_rolls):
+                kind, target = choice(my_effects)
+                if kind == ORBS:
+                    start = them * N_DIMENSIONS
+                    amounts = list(deals[start : start + N_DIMENSIONS])
+                    rng.shuffle(amounts)
+                    deals[start : start + N_DIMENSIONS] = array("h", amounts)
+                    effect_turns[them] = DEFAULT_SPECIAL_ABILITY_TURNS
+                else:
+                    if kind == SHAPESHIFT:
+                        lives[me] -= 1
+                    elif kind == POTION:
+                        amount = choice(range(1, 6))
+                        lives[me] += -amount if roll() < coin_rolls else amount
+                    elif roll() < coin_rolls:
+                        lives[me] += 1
+                    else:
+                        lives[me] -= 1
+                        target = None
+                    if target is not None:
+                        # a whole new form: fresh magic, no lingering effects
+                        forms[me] = form = target
+                        start = me * N_DIMENSIONS
+                        base = (my_offset + target) * N_DIMENSIONS
+                        deals[start : start + N_DIMENSIONS] = base_deals[
+                            base : base + N_DIMENSIONS
+                        ]
+                        effect_turns[me] = 0
+            else:
+                dimension = choice(able[form])
+                their_form = their_offset + forms[them]
+                if effect_turns[me]:
+                    # deals shuffled by the other side's orbs, so not in the
+                    # table: damage.hit_row's rule, on what they ended up as
+                    hit = min(
+                        takes[their_form * N_DIMENSIONS + dimension],
+                        deals[me * N_DIMENSIONS + dimension],
+                    )
+                else:
+                    hit = hits[
+                        ((my_offset + form) * n_forms + their_form) * N_DIMENSIONS
+                        + dimension
+                    ]
+                lives[them] -= hit
+                damage[me] += hit
+                by_dimension[mover * N_DIMENSIONS + dimension] += hit
+
+            # wear down the mover's effects, as Game.wear_down_existing_effects
+            turns_left = effect_turns[me]
+            if turns_left:
+                if turns_left == 1:
+                    start = me * N_DIMENSIONS
+                    base = (my_offset + form) * N_DIMENSIONS
+                    deals[start : start + N_DIMENSIONS] = base_deals[
+                        base : base + N_DIMENSIONS
+                    ]
+                effect_turns[me] = turns_left - 1
+
+            # only the one who just got attacked is checked, as in Game.play
+            if lives[them] <= 0:
+                _record(stats, ("player", "opponent")[mover], turn + 1, damage, duel)
+            else:
+                still_going.append(duel)
+        ongoing = still_going
+
+    for duel in ongoing:
+        _record(stats, None, max_turns, damage, duel)
+    for side, side_name in enumerate(("player", "opponent")):
+        for dim_idx, dimension in enumerate(DIMENSIONS):
+            total = by_dimension[side * N_DIMENSIONS + dim_idx]
+            if total:
+                stats.damage_by_dimension[(side_name, dimension)] += total
+    return stats
+
+
+def _record(stats, winner, turns, damage, duel):
+    stats.matches += 1
+    if winner == "player":
+        stats.player_wins += 1
+    elif winner == "opponent":
+        stats.opponent_wins += 1
+    else:
+        stats.draws += 1
+    stats.total_turns += turns
+    stats.turn_counts[turns] += 1
+    stats.player_damage[damage[2 * duel]] += 1
+    stats.opponent_damage[damage[2 * duel + 1]] += 1
+
+
+def simulate_slim(
+    player_name, opponent_name, duels, max_turns=DEFAULT_MAX_TURNS, seed=None
+):
+    """simulation.simulate_matchup with both policies random, on slim state:
+    all the duels at once, from one BatchedStream(seed).
+    """
+    matchup_forms = MatchupForms(
+        f"{CHARACTERS_DIR}/{player_name}", f"{CHARACTERS_DIR}/{opponent_name}"
+    )
+    batch = DuelBatch(matchup_forms, duels)
+    return play_batch(
+        batch,
+        max_turns=max_turns,
+        rng=BatchedStream(seed),
+        names=(player_name, opponent_name),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lots of duels on slim state.")
+    parser.add_argument("player")
+    parser.add_argument("opponent")
+    parser.add_argument("--duels", type=int, default=100000)
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS)
+    parser.add_argument("--seed")
+    args = parser.parse_args()
+
+    batch = DuelBatch(
+        MatchupForms(
+            f"{CHARACTERS_DIR}/{args.player}", f"{CHARACTERS_DIR}/{args.opponent}"
+        ),
+        args.duels,
+    )
+    print(f"{args.duels} duels in {batch.nbytes()} bytes of state")
+    stats = play_batch(
+        batch,
+        max_turns=args.max_turns,
+        rng=BatchedStream(args.seed),
+        names=(args.player, args.opponent),
+    )
+    print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Freezing a Game mid-duel into a few kilobytes, and thawing it back out, in
+this process or any other (the server evicts idle sessions this way).
+
+What goes in is only what can't be worked out again from the character files:
+both characters' names, forms, life and whether they're drunk, every effect
+still on them (who it's from, when it wears off, what it changed), the turn,
+the seed, and exactly where both of the duel's random streams are. Everything
+else (spells, taunts, the drunk versions of both, the orbs' overlay on top)
+comes back from the shared templates, like it does for a new Character.
+
+Effects point at whoever caused them, which is a live Character. In a
+snapshot, every character is a number instead: 0 is the player, 1 the
+opponent, and anybody else an effect came from gets saved after them.
+
+Layout (all little-endian):
+
+    header  MAGIC, then format version as a uint16
+    body    the game's fields one after another (see _write_game); text is a
+            uint16 length and UTF-8, each random stream's Mersenne Twister
+            state is its 625 uint32s
+
+    data = snapshot_game(game)
+    game = restore_game(data)
+"""
+
+import os
+import struct
+
+from character import Character
+from effects import Effect
+from game import Game
+from game_macros import DIMENSIONS
+from rng import BatchedStream, Stream
+
+MAGIC = b"MFSNAP"
+# 2: effects keep which dimension's amount went where, not the amounts
+VERSION = 2
+_HEADER = struct.Struct("<6sH")
+_MT_STATE = struct.Struct("<625I")
+
+
+class _Writer:
+    def __init__(self):
+        self.out = bytearray()
+
+    def pack(self, fmt, *values):
+        self.out += struct.pack(fmt, *values)
+
+    def text(self, value):
+        encoded = value.encode("utf-8")
+        self.pack("<H", len(encoded))
+        self.out += encoded
+
+    def seed(self, value):
+        # None, an int (of any size) or a string, like rng.Stream takes
+        if value is None:
+            self.pack("<B", 0)
+        else:
+            self.pack("<B", 1 if isinstance(value, int) else 2)
+            self.text(str(value))
+
+
+class _Reader:
+    def __init__(self, data, offset=0):
+        self.data = memoryview(data)
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values if len(values) > 1 else values[0]
+
+    def raw(self, length):
+        chunk = bytes(self.data[self.offset : self.offset + length])
+        self.offset += length
+        return chunk
+
+    def text(self):
+        return self.raw(self.unpack("<H")).decode("utf-8")
+
+    def seed(self):
+        kind = self.unpack("<B")
+        if kind == 0:
+            return None
+        value = self.text()
+        return int(value) if kind == 1 else value
+
+
+## Random streams
+
+
+def _write_stream(writer, stream):
+    if stream is None:
+        writer.pack("<B", 0)
+        return
+    batched = isinstance(stream, BatchedStream)
+    writer.pack("<B", 2 if batched else 1)
+    writer.seed(stream.initial_seed)
+    version, internal, gauss_next = stream.getstate()
+    writer.pack("<B", version)
+    writer.out += _MT_STATE.pack(*internal)
+    writer.pack("<?d", gauss_next is not None, gauss_next or 0.0)
+    if batched:
+        # what's left of the pre-drawn block, which can only be read by
+        # using it up, so it gets put back
+        rolls = bytes(stream._rolls)
+        stream._rolls = iter(rolls)
+        writer.pack("<II", stream.block_size, len(rolls))
+        writer.out += rolls
+
+
+def _read_stream(reader):
+    kind = reader.unpack("<B")
+    if kind == 0:
+        return None
+    initial_seed = reader.seed()
+    version = reader.unpack("<B")
+    internal = _MT_STATE.unpack(reader.raw(_MT_STATE.size))
+    has_gauss, gauss_next = reader.unpack("<?d")
+    if kind == 2:
+        block_size, length = reader.unpack("<II")
+        stream = BatchedStream(initial_seed, block_size=block_size)
+        stream.setstate((version, internal, gauss_next if has_gauss else None))
+        stream._rolls = iter(reader.raw(length))
+    else:
+        stream = Stream(initial_seed)
+        stream.setstate((version, internal, gauss_next if has_gauss else None))
+    return stream
+
+
+## Characters
+
+
+def _everyone(game):
+    """The player, the opponent, then whoever else their effects came from
+    (and whoever theirs came from...), each once.
+    """
+    characters = [game.player, game.opponent]
+    numbers = {id(game.player): 0, id(game.opponent): 1}
+    for character in characters:
+        for effect in character.effects:
+            if id(effect.source) not in numbers:
+                numbers[id(effect.source)] = len(characters)
+                characters.append(effect.source)
+    return characters, numbers
+
+
+def _write_character(writer, character, numbers):
+    writer.text(character.name)
+    writer.text(character.namepath)
+    writer.pack("<h?", character.life, character.drunk)
+    effects = character.effects
+    writer.pack("<IH", effects.turns_ended, len(effects))
+    for effect in effects:
+        deal_sources = effect.deal_sources or {}
+        writer.pack("<H", numbers[id(effect.source)])
+        writer.text(effect.name)
+        writer.pack("<IB", effect.expires_at, len(deal_sources))
+        for dimension, moved in deal_sources.items():
+            writer.pack(
+                "<BB", DIMENSIONS.index(dimension), DIMENSIONS.index(moved)
+            )
+
+
+def _read_character(reader):
+    """A Character without their effects yet (the sources might not exist
+    yet), and what the effects were: (source number, name, expires at, deal
+    sources or None).
+    """
+    name = reader.text()
+    namepath = reader.text()
+    life, drunk = reader.unpack("<h?")
+    character = Character(name=name, special_namepath=namepath)
+    if drunk:
+        character.become(drunk=True)
+    character.life = life
+    turns_ended, count = reader.unpack("<IH")
+    character.effects.turns_ended = turns_ended
+    effects = []
+    for _ in range(count):
+        source = reader.unpack("<H")
+        effect_name = reader.text()
+        expires_at, moves = reader.unpack("<IB")
+        deal_sources = {}
+        for _ in range(moves):
+            dimension, moved = reader.unpack("<BB")
+            deal_sources[DIMENSIONS[dimension]] = DIMENSIONS[moved]
+        effects.append((source, effect_name, expires_at, deal_sources or None))
+    return character, effects
+
+
+## Games
+
+
+def _write_game(writer, game):
+    writer.text(game.difficulty)
+    writer.pack("<B", len(game.characters_dirs))
+    for characters_dir in game.characters_dirs:
+        writer.text(characters_dir)
+    # who is left on the roster (the player's pick gets taken off it)
+    writer.pack("<H", len(game.all_characters))
+    for name in game.all_characters:
+        writer.text(name)
+
+    writer.pack("<I", game.turn)
+    writer.seed(game.seed)
+    _write_stream(writer, game.rng)
+    _write_stream(writer, game.rules_rng)
+
+    characters, numbers = _everyone(game)
+    writer.pack("<H", len(characters))
+    for character in characters:
+        _write_character(writer, character, numbers)
+
+
+def snapshot_game(game):
+    """The game's state, as bytes for restore_game. Needs both characters
+    picked; the event log (if any) is left out.
+    """
+    writer = _Writer()
+    writer.out += _HEADER.pack(MAGIC, VERSION)
+    _write_game(writer, game)
+    return bytes(writer.out)
+
+
+def restore_game(data, event_log=None):
+    """A Game just like the one snapshot_game() was given, reporting to
+    event_log from here on, if given. ValueError if data is not a snapshot of
+    this version.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Not a game snapshot (too short)")
+    magic, version = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} game snapshot")
+    reader = _Reader(data, _HEADER.size)
+
+    difficulty = reader.text()
+    characters_dirs = tuple(reader.text() for _ in range(reader.unpack("<B")))
+    game = Game(
+        characters_dirs=characters_dirs, difficulty=difficulty, event_log=event_log
+    )
+    on_roster = {reader.text() for _ in range(reader.unpack("<H"))}
+    for name in [name for name in game.all_characters if name not in on_roster]:
+        del game.all_characters[name]
+
+    game.turn = reader.unpack("<I")
+    game.seed = reader.seed()
+    game.rng = _read_stream(reader)
+    game.rules_rng = _read_stream(reader)
+
+    read = [_read_character(reader) for _ in range(reader.unpack("<H"))]
+    characters = [character for character, _ in read]
+    for character, effects in read:
+        for source, name, expires_at, deal_sources in effects:
+            effect = Effect(characters[source], name, deal_sources)
+            character.effects.add(
+                effect, expires_at - character.effects.turns_ended
+            )
+        if effects:
+            character._set_magic_info()
+    game.player, game.opponent = characters[:2]
+    return game
+
+
+def save_snapshot(game, path):
+    """Write snapshot_game(game) to path, all at once (via a temporary file)."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as snapshot_fl:
+        snapshot_fl.write(snapshot_game(game))
+    os.replace(temporary, path)
+
+
+def load_snapshot(path, event_log=None):
+    with open(path, "rb") as snapshot_fl:
+        return restore_game(snapshot_fl.read(), event_log=event_log)
@@ -0,0 +1,605 @@
+"""
+Exact win probabilities, no dice rolled.
+
+A duel's state is small: whose turn it is, both lives, both current forms
+(namepath, and drunk or not), what the Orbs of Disorder did to someone's
+deals, and how many turns that has left to run. So instead of playing a
+matchup a million times, enumerate every state reachable from the start and
+solve for the win probabilities of all of them at once by value iteration
+(the state graph has cycles, since a zero-damage spell just hands the turn
+over).
+
+Each side either plays "random" (exactly like pick_computer_move, special
+ability chance and all) or "optimal" (whatever gives them the best odds).
+Solved matchups are kept for the life of the process, so after the first
+question about a matchup, every other answer is a lookup.
+
+Modelling notes, for the curious:
+- Lives are capped at LIFE_CAP. Only a long streak of lucky potions gets there.
+- After the Orbs of Disorder, it only matters how much damage each of your
+  spells would do (against any form the other side can take), not which
+  dimension ended up with which amount, so that is all a state remembers.
+
+    python solver.py nora winston
+    python solver.py winfield stella --player-mode optimal
+"""
+
+import argparse
+import time
+from collections import Counter, namedtuple
+from itertools import permutations
+
+from character import get_template
+from game_macros import (
+    CHARACTERS_DIR,
+    DEFAULT_SPECIAL_ABILITY_TURNS,
+    DIMENSIONS,
+    GAME_LIFE,
+    OPPONENT_SPECIAL_ABILITY_CHANCE,
+    chance_of_happening,
+)
+
+LIFE_CAP = GAME_LIFE + 10
+MODES = ("random", "optimal")
+
+PLAYER, OPPONENT = 0, 1
+# successors that are not states: the game is over
+PLAYER_WINS, OPPONENT_WINS = -1, -2
+_WINS = (PLAYER_WINS, OPPONENT_WINS)
+
+# where the shapeshifting effects in special_abilities.py take you
+SHAPESHIFT_TARGETS = {
+    "change_to_norm": f"{CHARACTERS_DIR}/nora/norm",
+    "change_to_nora": f"{CHARACTERS_DIR}/nora",
+    "change_to_meadow_sprite": f"{CHARACTERS_DIR}/nora/meadow_sprite",
+}
+
+# A duel state from the outside: forms are (namepath, drunk) pairs, deals are
+# amounts in DIMENSIONS order and turn is "player" or "opponent".
+DuelState = namedtuple(
+    "DuelState",
+    [
+        "turn",
+        "player_life",
+        "opponent_life",
+        "player_form",
+        "opponent_form",
+        "player_deals",
+        "opponent_deals",
+        "player_effect_turns",
+        "opponent_effect_turns",
+    ],
+)
+
+_Form = namedtuple("_Form", ["namepath", "drunk", "deals", "takes", "able", "effects"])
+
+
+def _namepath(name):
+    return name if "/" in name else f"{CHARACTERS_DIR}/{name.lower()}"
+
+
+def _load_form(namepath, drunk, overrides=None):
+    template = get_template(namepath)
+    magic_info = template.magic_info
+    specials = (
+        template.drunk_special_abilities_info
+        if drunk
+        else template.special_abilities_info
+    )
+    amounts = overrides.get(namepath) if overrides else None
+    if amounts is None:
+        amounts = (
+            tuple(magic_info["deals"][dim]["amount"] for dim in DIMENSIONS),
+            tuple(magic_info["takes"][dim]["amount"] for dim in DIMENSIONS),
+        )
+    return _Form(
+        namepath=namepath,
+        drunk=drunk,
+        deals=tuple(amounts[0]),
+        takes=tuple(amounts[1]),
+        able=tuple(
+            idx
+            for idx, dim in enumerate(DIMENSIONS)
+            if magic_info["deals"][dim]["spells"]
+        ),
+        effects=tuple(info["effect"] for info in specials.values()),
+    )
+
+
+def form_after(form, effect):
+    """(namepath, drunk) a special ability effect turns you into, if any."""
+    if effect in SHAPESHIFT_TARGETS:
+        return SHAPESHIFT_TARGETS[effect], False
+    if effect == "potionify":
+        return form.namepath, True
+    if effect == "attempt_sobering":
+        return form.namepath, False
+    if effect == "orbs_of_disorderify":
+        return None
+    raise ValueError(f"The solver does not know the special effect {effect!r}")
+
+
+def canonical_deals(able, deals, other_takes):
+    """What a side's deals amount to: for each able dimension, the hit it
+    would land on every form the other side can take (other_takes), sorted.
+    Two arrangements of the same amounts that look the same here play out
+    exactly the same way.
+    """
+    hits = (tuple(min(takes[dim], deals[dim]) for takes in other_takes) for dim in able)
+    return tuple(sorted(hits))
+
+
+def reachable_forms(namepath, overrides=None):
+    """Every form (_Form) someone starting out at namepath can end up in, the
+    starting one first, plus (namepath, drunk) -> index into that list.
+
+    overrides (namepath -> (deals, takes), both in DIMENSIONS order) stand in
+    for the amounts in those forms' magic.json, for trying out changes.
+    """
+    forms = [_load_form(namepath, False, overrides)]
+    index = {(namepath, False): 0}
+    for form in forms:
+        for effect in form.effects:
+            after = form_after(form, effect)
+            if after is not None and after not in index:
+                index[after] = len(forms)
+                forms.append(_load_form(*after, overrides))
+    return forms, index
+
+
+class SolvedMatchup:
+    """Every state reachable in one matchup, and the chances of each side
+    winning from each of them.
+    """
+
+    def __init__(
+        self,
+        player,
+        opponent,
+        player_mode="random",
+        opponent_mode="random",
+        overrides=None,
+    ):
+        for mode in (player_mode, opponent_mode):
+            if mode not in MODES:
+                raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+        self.modes = (player_mode, opponent_mode)
+        self.namepaths = (_namepath(player), _namepath(opponent))
+        self.special_chance = chance_of_happening(OPPONENT_SPECIAL_ABILITY_CHANCE)
+        self.coin_flip = chance_of_happening(0.5)
+
+        self.forms, self.form_index = zip(
+            *(reachable_forms(namepath, overrides) for namepath in self.namepaths)
+        )
+        # per side: list of canonical deals (see _canonical) and the reverse
+        self.canon = ([], [])
+        self.canon_index = ({}, {})
+        self.base_canon = tuple(
+            [self._canonical(side, form, form.deals) for form in self.forms[side]]
+            for side in (PLAYER, OPPONENT)
+        )
+        self._orbs_outcomes = {}
+
+        self.index = {}
+        self.states = []
+        self.moves = []
+        self.player_wins = []
+        self.opponent_wins = []
+        self._explore(self.start_key())
+        self._solve()
+
+    ## States
+
+    def _canonical(self, side, form, deals):
+        other_takes = [other.takes for other in self.forms[1 - side]]
+        key = canonical_deals(form.able, deals, other_takes)
+        index = self.canon_index[side]
+        if key not in index:
+            index[key] = len(self.canon[side])
+            self.canon[side].append(key)
+        return index[key]
+
+    def start_key(self):
+        return (PLAYER, GAME_LIFE, GAME_LIFE, 0, 0, *self._base(0, 0), 0, 0)
+
+    def _base(self, player_form, opponent_form):
+        return (
+            self.base_canon[PLAYER][player_form],
+            self.base_canon[OPPONENT][opponent_form],
+        )
+
+    def key_from_state(self, state):
+        key = [PLAYER if state.turn == "player" else OPPONENT]
+        lives = (state.player_life, state.opponent_life)
+        key.extend(min(life, LIFE_CAP) for life in lives)
+        forms = []
+        for side, form in enumerate((state.player_form, state.opponent_form)):
+            namepath, drunk = form
+            if (namepath, drunk) not in self.form_index[side]:
+                raise ValueError(f"{namepath} (drunk: {drunk}) is not in this matchup")
+            forms.append(self.form_index[side][(namepath, drunk)])
+        key.extend(forms)
+        for side, deals in enumerate((state.player_deals, state.opponent_deals)):
+            key.append(self._canonical(side, self.forms[side][forms[side]], deals))
+        key.extend((state.player_effect_turns, state.opponent_effect_turns))
+        return tuple(key)
+
+    def _orbs_outcomes_for(self, side, form_idx):
+        """[(probability, canonical deals)] after the Orbs of Disorder shuffle
+        the deals of a side in the given form. The shuffle is uniform over all
+        orderings, and always starts from the same amounts (the orbs only ever
+        reorder them, and wearing off restores them), so this never changes.
+        """
+        cache_key = (side, form_idx)
+        if cache_key not in self._orbs_outcomes:
+            form = self.forms[side][form_idx]
+            counts = Counter(
+                self._canonical(side, form, deals) for deals in permutations(form.deals)
+            )
+            total = sum(counts.values())
+            self._orbs_outcomes[cache_key] = [
+                (count / total, canon) for canon, count in counts.items()
+            ]
+        return self._orbs_outcomes[cache_key]
+
+    ## Transitions
+
+    def _finish(self, mover, lives, forms, deals, effects):
+        """Wrap up the mover's turn: check for a winner the way Game.play
+        does, wear down the mover's effects, and hand the turn over.
+        """
+        other = 1 - mover
+        if lives[other] <= 0:
+            return _WINS[mover]
+        if lives[mover] <= 0:
+            # Nobody checks until after the other side's next turn, but
+            # nothing they do can save the mover by then.
+            return _WINS[other]
+
+        if effects[mover]:
+            if effects[mover] == 1:
+                deals[mover] = self.base_canon[mover][forms[mover]]
+            effects[mover] -= 1
+
+        return (
+            other,
+            min(lives[0], LIFE_CAP),
+            min(lives[1], LIFE_CAP),
+            forms[0],
+            forms[1],
+            deals[0],
+            deals[1],
+            effects[0],
+            effects[1],
+        )
+
+    def _moves_from(self, key):
+        """Everything the mover could do from this state, as a list of
+        (label, chance a random mover picks it, [(probability, successor)]).
+        """
+        mover = key[0]
+        other = 1 - mover
+        lives, forms, deals, effects = (
+            list(key[1:3]),
+            list(key[3:5]),
+            list(key[5:7]),
+            list(key[7:9]),
+        )
+        form = self.forms[mover][forms[mover]]
+
+        moves = []
+        hits = [hit[forms[other]] for hit in self.canon[mover][deals[mover]]]
+        special_chance = self.special_chance if form.effects else 0
+        if not hits:
+            special_chance = 1
+
+        for hit, count in Counter(hits).items():
+            after_lives = list(lives)
+            after_lives[other] -= hit
+            after = self._finish(mover, after_lives, forms, list(deals), list(effects))
+            weight = (1 - special_chance) * count / len(hits)
+            moves.append((("spell", hit), weight, [(1.0, after)]))
+
+        for effect, count in Counter(form.effects).items():
+            moves.append(
+                (
+                    ("special", effect),
+                    special_chance * count / len(form.effects),
+                    self._special_outcomes(
+                        mover, effect, form, lives, forms, deals, effects
+                    ),
+                )
+            )
+
+        return moves
+
+    def _special_outcomes(self, mover, effect, form, lives, forms, deals, effects):
+        other = 1 - mover
+
+        def outcome(life_change=0, new_form=None, other_deals=None):
+            after_lives, after_forms = list(lives), list(forms)
+            after_deals, after_effects = list(deals), list(effects)
+            after_lives[mover] += life_change
+            if new_form is not None:
+                # a whole new Character: fresh magic, no lingering effects
+                after_forms[mover] = self.form_index[mover][new_form]
+                after_deals[mover] = self.base_canon[mover][after_forms[mover]]
+                after_effects[mover] = 0
+            if other_deals is not None:
+                after_deals[other] = other_deals
+                after_effects[other] = DEFAULT_SPECIAL_ABILITY_TURNS
+            return self._finish(
+                mover, after_lives, after_forms, after_deals, after_effects
+            )
+
+        if effect in SHAPESHIFT_TARGETS:
+            return [(1.0, outcome(-1, form_after(form, effect)))]
+
+        if effect == "potionify":
+            drunk = form_after(form, effect)
+            lose = self.coin_flip
+            return [
+                (chance / 5, outcome(sign * amount, drunk))
+                for sign, chance in ((-1, lose), (1, 1 - lose))
+                for amount in range(1, 6)
+            ]
+
+        if effect == "attempt_sobering":
+            return [
+                (self.coin_flip, outcome(1, form_after(form, effect))),
+                (1 - self.coin_flip, outcome(-1)),
+            ]
+
+        if effect == "orbs_of_disorderify":
+            return [
+                (chance, outcome(other_deals=canon))
+                for chance, canon in self._orbs_outcomes_for(other, forms[other])
+            ]
+
+        raise ValueError(f"The solver does not know the special effect {effect!r}")
+
+    def _explore(self, start):
+        if start in self.index:
+            return
+        self.index[start] = len(self.states)
+        self.states.append(start)
+        self.player_wins.append(0.0)
+        self.opponent_wins.append(0.0)
+
+        idx = len(self.states) - 1
+        while idx < len(self.states):
+            moves = []
+            for label, weight, outcomes in self._moves_from(self.states[idx]):
+                resolved = []
+                for chance, successor in outcomes:
+                    if successor not in _WINS and successor not in self.index:
+                        self.index[successor] = len(self.states)
+                        self.states.append(successor)
+                        self.player_wins.append(0.0)
+                        self.opponent_wins.append(0.0)
+                    resolved.append(
+                        (
+                            chance,
+                            successor if successor in _WINS else self.index[successor],
+                        )
+                    )
+                moves.append((label, weight, resolved))
+            self.moves.append(moves)
+            idx += 1
+
+    ## Solving
+
+    def _move_values(self, outcomes):
+        player_wins, opponent_wins = self.player_wins, self.opponent_wins
+        player_value = opponent_value = 0.0
+        for chance, successor in outcomes:
+            if successor == PLAYER_WINS:
+                player_value += chance
+            elif successor == OPPONENT_WINS:
+                opponent_value += chance
+            else:
+                player_value += chance * player_wins[successor]
+                opponent_value += chance * opponent_wins[successor]
+        return player_value, opponent_value
+
+    def _best_move(self, idx):
+        """The move the mover would make from state idx if playing optimally:
+        best chance of winning, minus the other side's chance of winning.
+        """
+        mover = self.states[idx][0]
+        best, best_score, best_values = None, None, None
+        for move in self.moves[idx]:
+            values = self._move_values(move[2])
+            score = values[mover] - values[1 - mover]
+            if best_score is None or score > best_score:
+                best, best_score, best_values = move, score, values
+        return best, best_values
+
+    def _components(self):
+        """Strongly connected components of the state graph, in an order where
+        every component only leads to itself or to ones listed before it
+        (Tarjan's algorithm, minus the recursion).
+        """
+        successors = [
+            {
+                successor
+                for _, _, outcomes in moves
+                for _, successor in outcomes
+                if successor not in _WINS
+            }
+            for moves in self.moves
+        ]
+        order = [None] * len(self.states)
+        low = [0] * len(self.states)
+        on_stack = [False] * len(self.states)
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(len(self.states)):
+            if order[root] is not None:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, iter(successors[root]))]
+            while work:
+                node, todo = work[-1]
+                for successor in todo:
+                    if order[successor] is None:
+                        order[successor] = low[successor] = counter
+                        counter += 1
+                        stack.append(successor)
+                        on_stack[successor] = True
+                        work.append((successor, iter(successors[successor])))
+                        break
+                    if on_stack[successor]:
+                        low[node] = min(low[node], order[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == order[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = False
+                            component.append(member)
+                            if member == node:
+                                break
+                        loops = len(component) > 1 or node in successors[node]
+                        components.append((component, loops))
+
+        return components
+
+    def _solve(self, tolerance=1e-12, max_sweeps=100000):
+        # A random mover's moves can be lumped into one list of outcomes up front.
+        lumped = {}
+        for idx, moves in enumerate(self.moves):
+            if self.modes[self.states[idx][0]] == "random":
+                outcomes = Counter()
+                for _, weight, move_outcomes in moves:
+                    for chance, successor in move_outcomes:
+                        outcomes[successor] += weight * chance
+                lumped[idx] = [
+                    (chance, successor) for successor, chance in outcomes.items()
+                ]
+
+        # Everything a component leads to is already solved by the time we get
+        # to it, so only states that can loop back on themselves need iterating.
+        for component, loops in self._components():
+            # low lives first, since that is mostly where things lead
+            component.sort(key=lambda idx: self.states[idx][1] + self.states[idx][2])
+            for _ in range(max_sweeps if loops else 1):
+                biggest_change = 0.0
+                for idx in component:
+                    if idx in lumped:
+                        values = self._move_values(lumped[idx])
+                    else:
+                        _, values = self._best_move(idx)
+                    biggest_change = max(
+                        biggest_change,
+                        abs(values[0] - self.player_wins[idx]),
+                        abs(values[1] - self.opponent_wins[idx]),
+                    )
+                    self.player_wins[idx], self.opponent_wins[idx] = values
+                if biggest_change < tolerance:
+                    break
+
+    ## Asking questions
+
+    def _idx(self, state):
+        key = self.start_key() if state is None else self.key_from_state(state)
+        if key not in self.index:
+            # Not reachable from the usual start (somebody set up an odd
+            # state by hand), so add whatever it leads to and re-solve.
+            self._explore(key)
+            self._solve()
+        return self.index[key]
+
+    def win_probabilities(self, state=None):
+        """(player's chance of winning, opponent's chance of winning) from the
+        given DuelState, or from the very start of the duel.
+        """
+        idx = self._idx(state)
+        return self.player_wins[idx], self.opponent_wins[idx]
+
+    def best_move(self, state=None):
+        """The best move for whoever's turn it is: ("spell", hit) to cast a
+        spell that lands that much damage, or ("special", effect).
+        """
+        move, _ = self._best_move(self._idx(state))
+        return move[0]
+
+    def best_move_for_key(self, key):
+        """best_move, for one of our own (already explored) state keys."""
+        move, _ = self._best_move(self.index[key])
+        return move[0]
+
+
+# (player namepath, opponent namepath, player mode, opponent mode) -> SolvedMatchup
+_solved = {}
+
+
+def solve(player, opponent, player_mode="random", opponent_mode="random"):
+    """Return the (cached) SolvedMatchup for two roster names or namepaths."""
+    key = (_namepath(player), _namepath(opponent), player_mode, opponent_mode)
+    if key not in _solved:
+        _solved[key] = SolvedMatchup(*key)
+    return _solved[key]
+
+
+def win_probabilities(
+    player, opponent, state=None, player_mode="random", opponent_mode="random"
+):
+    return solve(player, opponent, player_mode, opponent_mode).win_probabilities(state)
+
+
+def state_from_game(game, turn="player"):
+    """Describe a live Game as a DuelState, at the start of someone's turn."""
+
+    def describe(character):
+        deals = character.magic_info["deals"]
+        return (
+            (character.namepath, character.drunk),
+            tuple(deals[dim]["amount"] for dim in DIMENSIONS),
+            character.effects.turns_left(),
+        )
+
+    player_form, player_deals, player_effect_turns = describe(game.player)
+    opponent_form, opponent_deals, opponent_effect_turns = describe(game.opponent)
+    return DuelState(
+        turn=turn,
+        player_life=game.player.life,
+        opponent_life=game.opponent.life,
+        player_form=player_form,
+        opponent_form=opponent_form,
+        player_deals=player_deals,
+        opponent_deals=opponent_deals,
+        player_effect_turns=player_effect_turns,
+        opponent_effect_turns=opponent_effect_turns,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact Magic Fight win chances.")
+    parser.add_argument("player")
+    parser.add_argument("opponent")
+    parser.add_argument("--player-mode", default="random", choices=MODES)
+    parser.add_argument("--opponent-mode", default="random", choices=MODES)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    solved = solve(args.player, args.opponent, args.player_mode, args.opponent_mode)
+    player_chance, opponent_chance = solved.win_probabilities()
+    print(
+        f"{args.player} vs. {args.opponent}: "
+        f"{player_chance:.4%} / {opponent_chance:.4%} "
+        f"({len(solved.states)} states, solved in {time.perf_counter() - started:.2f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
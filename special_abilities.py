@@ -1,19 +1,115 @@
-import copy
-import json
-import random
-import sys
-import time
+import importlib
+from collections import namedtuple
+
+from character import get_template, list_namepaths
+from game_macros import (
+    CHARACTERS_DIR,
+    DEFAULT_SPECIAL_ABILITY_TURNS,
+    did_it_happen,
+    pause,
+    say,
+)
+from rng import current_rng
+
+# What the "effect" of a special.json entry does, and what it costs:
+#   func              called as func(player, opponent, **options), returns the
+#                     (player, opponent) it leaves behind
+#   life_cost         the most life it can cost whoever uses it
+#   turns             how many turns whatever it does lingers (0: it doesn't)
+#   affects_opponent  whether it changes the opponent at all
+EffectInfo = namedtuple(
+    "EffectInfo", ["name", "func", "life_cost", "turns", "affects_opponent"]
+)
+
+# effect name -> EffectInfo, for every effect anyone has registered
+SPECIAL_EFFECTS = {}
+# character directories whose special abilities have all checked out
+_validated_dirs = set()
+
+
+def special_effect(name=None, life_cost=0, turns=0, affects_opponent=False):
+    """Register the decorated function as a special ability effect, under its
+    own name unless given one. Plugin modules can do this too (see
+    load_plugins), without touching this file:
+
+        @special_effect(life_cost=2)
+        def summon_goat(player, opponent, **_):
+            ...
+            return player, opponent
+    """
+
+    def register(func):
+        effect = name or func.__name__
+        if effect in SPECIAL_EFFECTS:
+            raise ValueError(f"Special effect {effect!r} is already registered")
+        SPECIAL_EFFECTS[effect] = EffectInfo(
+            effect, func, life_cost, turns, affects_opponent
+        )
+        return func
+
+    return register
+
+
+def effect_info(effect):
+    try:
+        return SPECIAL_EFFECTS[effect]
+    except KeyError:
+        raise ValueError(f"Unknown special effect {effect!r}") from None
+
 
-from character import Character
-from game_macros import CHARACTERS_DIR, DEFAULT_SPECIAL_ABILITY_TURNS, did_it_happen
+def load_plugins(module_names):
+    """Import each module, so its @special_effect functions get registered."""
+    for module_name in module_names:
+        importlib.import_module(module_name)
+
+
+def special_ability_problems(template):
+    """Everything wrong with one form's special.json and drunk_special.json:
+    each ability needs a description and an effect that is registered.
+    """
+    problems = []
+    for filename, abilities in (
+        ("special.json", template.special_abilities_info),
+        ("drunk_special.json", template.drunk_special_abilities_info),
+    ):
+        for ability_name, info in abilities.items():
+            where = f"{template.namepath}/{filename}: {ability_name!r}"
+            if "description" not in info:
+                problems.append(f"{where} has no description")
+            if "effect" not in info:
+                problems.append(f"{where} has no effect")
+            elif info["effect"] not in SPECIAL_EFFECTS:
+                problems.append(f"{where} has unknown effect {info['effect']!r}")
+    return problems
+
+
+def validate_special_abilities(characters_dirs=(CHARACTERS_DIR,)):
+    """Check every special.json and drunk_special.json under characters_dirs
+    (see special_ability_problems). Raise ValueError listing everything wrong,
+    if anything is. Each directory is
+    only checked once per process (once it passes).
+    """
+    problems = []
+    for characters_dir in characters_dirs:
+        if characters_dir in _validated_dirs:
+            continue
+        found = []
+        for namepath in list_namepaths(characters_dir):
+            found.extend(special_ability_problems(get_template(namepath)))
+        if found:
+            problems.extend(found)
+        else:
+            _validated_dirs.add(characters_dir)
+    if problems:
+        raise ValueError("Bad special abilities:\n" + "\n".join(problems))
 
 
 class SpecialAbility:
     def __init__(self, player, opponent, effect):
         self.player = player
         self.opponent = opponent
-        # literally just load them all from here for now
-        self.effect_func = getattr(sys.modules[__name__], effect)
+        # looked up once here; perform() is then just the call
+        self.effect_func = effect_info(effect).func
 
     def perform(self, **additional_options):
         return self.effect_func(self.player, self.opponent, **additional_options)
@@ -26,27 +122,30 @@ def _shapeshift(
     article="",
 ):
     player.life -= 1
+    old_name = player.name
 
-    shapeshifted = Character(name=name, special_namepath=special_namepath)
-    shapeshifted.life = player.life
+    shapeshifted = player.become(name=name, special_namepath=special_namepath)
 
-    print(f"{player.name} becomes{' ' if article else ''}{article} {name}!")
-    time.sleep(1)
+    say(f"{old_name} becomes{' ' if article else ''}{article} {name}!")
+    pause(1)
 
     return shapeshifted
 
 
+@special_effect(life_cost=1)
 def change_to_norm(player, opponent, **_):
     norm = _shapeshift(player, "Norm", special_namepath=f"{CHARACTERS_DIR}/nora/norm")
     return norm, opponent
 
 
+@special_effect(life_cost=1)
 def change_to_nora(player, opponent, **_):
     nora = _shapeshift(player, "Nora")
     return nora, opponent
 
 
 # TODO: if computer takes on this form, give it an easy out so it doesn't bore people
+@special_effect(life_cost=1)
 def change_to_meadow_sprite(player, opponent, **_):
     meadow_sprite = _shapeshift(
         player,
@@ -62,19 +161,7 @@ def _potion_life_effect():
     drunken character's current life value.
     """
     sign = -1 if did_it_happen() else 1
-    return sign * random.choice(range(1, 6))
-
-
-def _drunkify_string_list(strings):
-    return list(map(lambda string: "".join(reversed(string)), strings))
-
-
-def _drunkify_spells(magic_info):
-    """Flip the given spell descriptions upside down, because we are drunk."""
-    drunken_magic = copy.deepcopy(magic_info)  # it's not THAT big
-    for dimension_info in drunken_magic["deals"].values():
-        dimension_info["spells"] = _drunkify_string_list(dimension_info["spells"])
-    return drunken_magic
+    return sign * current_rng().choice(range(1, 6))
 
 
 def _print_potion_effect(character_name, effect):
@@ -85,79 +172,82 @@ def _print_potion_effect(character_name, effect):
     commentary = (
         "That's some good stuff" if positive_effect else f"Poor {character_name}."
     )
-    print(
+    say(
         f"{character_name} gets drunk, {condrunktion} this time it {action} "
         f"{abs(effect)} life points! {commentary}.\n"
     )
-    time.sleep(1)
+    pause(1)
 
 
+@special_effect(life_cost=5)
 def potionify(player, opponent, **_):
     effect = _potion_life_effect()
     player.life += effect
 
-    drunkard = Character(name=player.name)
-    drunkard.life = player.life
-    drunkard.magic_info = _drunkify_spells(drunkard.magic_info)
-
-    if drunkard.taunts is not None:
-        drunkard.taunts["taunts"] = _drunkify_string_list(drunkard.taunts["taunts"])
-
-    if drunkard.reactions is not None:
-        drunkard.reactions["reactions"] = _drunkify_string_list(
-            drunkard.reactions["reactions"]
-        )
-
-    drunkard._set_special_abilities(
-        special_path=f"{drunkard.namepath}/drunk_special.json"
-    )
+    # same potion-addled look for every drunkard (see CharacterTemplate)
+    drunkard = player.become(drunk=True)
     _print_potion_effect(drunkard.name, effect)
 
     return drunkard, opponent
 
 
+@special_effect(life_cost=1)
 def attempt_sobering(player, opponent, is_computer=False, **_):
     """was it a good idea?"""
     if did_it_happen():
         # Restore defaults!
-        sober = Character(name=player.name)
-        sober.life = player.life + 1
+        sober = player.become(drunk=False)
+        sober.life += 1
 
         if not is_computer:
-            print("It worked! You have magically sobered up and gained 1 life point!\n")
+            say("It worked! You have magically sobered up and gained 1 life point!\n")
         else:
-            print(f"{player.name} has sobered up and gained 1 life point!\n")
-        time.sleep(1)
+            say(f"{player.name} has sobered up and gained 1 life point!\n")
+        pause(1)
         return sober, opponent
     else:
         player.life -= 1
         if not is_computer:
-            print(
+            say(
                 f"There is no shortcut to sobriety, {player.name}. But this crappy "
                 f"concoction did manage to take a life point from you.\n"
             )
         else:
-            print(
+            say(
                 f"{player.name} is learning the hard way that there is no "
                 f"shortcut to sobriety. They lose 1 life point!\n"
             )
-        time.sleep(1)
+        pause(1)
         return player, opponent
 
 
-def orbs_of_disorderify(player, opponent, is_computer=False, **_):
+@special_effect(turns=DEFAULT_SPECIAL_ABILITY_TURNS, affects_opponent=True)
+def orbs_of_disorderify(player, opponent, is_computer=False, onlooker=False, **_):
     """
     Mix up the hit values of the opponent's spells.
     """
-    deal_amounts = [dim["amount"] for dim in opponent.magic_info["deals"].values()]
-
-    for dimension_info in opponent.magic_info["deals"].values():
-        now_deals = deal_amounts.pop(random.randrange(len(deal_amounts)))
-        dimension_info["amount"] = now_deals
+    deals = opponent.magic_info["deals"]
+    # which dimension's amount each one gets; what the amounts are right now
+    # doesn't matter, so the orbs come off cleanly whatever else is on
+    dimensions = list(deals)
 
-    opponent.affected_by_character_turns_left[player] = DEFAULT_SPECIAL_ABILITY_TURNS
-    if is_computer:
-        print(
+    rng = current_rng()
+    opponent.add_effect(
+        player,
+        "orbs_of_disorderify",
+        DEFAULT_SPECIAL_ABILITY_TURNS,
+        deal_sources={
+            dimension: dimensions.pop(rng.randrange(len(dimensions)))
+            for dimension in deals
+        },
+    )
+    if onlooker:
+        say(
+            f"{player.name} has used the Orbs of Disorder to randomly "
+            f"swap the hit values of {opponent.name}'s spells! ✨🔵 ✨🟡\n"
+        )
+    elif is_computer:
+        say(
             f"{player.name} has used the Orbs of Disorder to randomly "
             f"swap the hit values of your spells! Be careful! ✨🔵 ✨🟡\n"
         )
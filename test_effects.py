@@ -0,0 +1,94 @@
+"""
+Lingering effects coming off cleanly: however they overlap, once an effect
+wears off, the magic is what it would be had it never been on.
+
+    python -m pytest -q test_effects.py     (or python -m unittest test_effects)
+"""
+
+import unittest
+
+from character import Character
+from frontend import NullFrontend, use_frontend
+from game import Game
+from game_macros import DIMENSIONS
+from snapshot import restore_game, snapshot_game
+
+ORBS = "orbs_of_disorderify"
+# each dimension gets the amount of the next one along
+ROTATE = dict(zip(DIMENSIONS, DIMENSIONS[1:] + DIMENSIONS[:1]))
+# dark and light trade places (and chaotic and ordered)
+SWAP = {"dark": "light", "light": "dark", "chaotic": "ordered", "ordered": "chaotic"}
+
+
+def _amounts(character):
+    return [character.magic_info["deals"][dim]["amount"] for dim in DIMENSIONS]
+
+
+def _moved(amounts, *sources):
+    """amounts with each of sources' moves laid over them in turn."""
+    for moves in sources:
+        by_dimension = dict(zip(DIMENSIONS, amounts))
+        amounts = [by_dimension[moves.get(dim, dim)] for dim in DIMENSIONS]
+    return amounts
+
+
+def _end_turn(character):
+    # as Game.wear_down_existing_effects
+    for effect in character.effects.wear_down():
+        character.reset(opponent_name=effect.source.name)
+
+
+class OverlappingEffectsTest(unittest.TestCase):
+    def setUp(self):
+        self.previous_frontend = use_frontend(NullFrontend())
+        self.nora = Character("Nora")
+        self.base = _amounts(self.nora)
+        self.winston = Character("Winston")
+        self.stella = Character("Stella")
+
+    def tearDown(self):
+        use_frontend(self.previous_frontend)
+
+    def test_first_of_two_wears_off(self):
+        self.nora.add_effect(self.winston, ORBS, 1, deal_sources=ROTATE)
+        self.nora.add_effect(self.stella, ORBS, 3, deal_sources=SWAP)
+        self.assertEqual(_amounts(self.nora), _moved(self.base, ROTATE, SWAP))
+
+        _end_turn(self.nora)
+        # only Stella's swap is left, on top of Nora's own amounts
+        self.assertEqual(_amounts(self.nora), _moved(self.base, SWAP))
+        _end_turn(self.nora)
+        _end_turn(self.nora)
+        self.assertEqual(_amounts(self.nora), self.base)
+
+    def test_second_of_two_wears_off(self):
+        self.nora.add_effect(self.winston, ORBS, 3, deal_sources=ROTATE)
+        self.nora.add_effect(self.stella, ORBS, 1, deal_sources=SWAP)
+        _end_turn(self.nora)
+        self.assertEqual(_amounts(self.nora), _moved(self.base, ROTATE))
+        _end_turn(self.nora)
+        _end_turn(self.nora)
+        self.assertEqual(_amounts(self.nora), self.base)
+
+    def test_same_source_again_takes_over(self):
+        self.nora.add_effect(self.winston, ORBS, 3, deal_sources=ROTATE)
+        self.nora.add_effect(self.winston, ORBS, 1, deal_sources=SWAP)
+        # the second mix-up starts from the first
+        self.assertEqual(len(self.nora.effects), 1)
+        self.assertEqual(_amounts(self.nora), _moved(self.base, ROTATE, SWAP))
+        _end_turn(self.nora)
+        self.assertEqual(_amounts(self.nora), self.base)
+
+    def test_snapshot_keeps_what_each_changed(self):
+        self.nora.add_effect(self.winston, ORBS, 1, deal_sources=ROTATE)
+        self.nora.add_effect(self.stella, ORBS, 3, deal_sources=SWAP)
+        game = Game.for_duel(self.nora, self.winston)
+        game.begin_duel(seed=1)
+        restored = restore_game(snapshot_game(game)).player
+        self.assertEqual(_amounts(restored), _amounts(self.nora))
+        _end_turn(restored)
+        self.assertEqual(_amounts(restored), _moved(self.base, SWAP))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+The odds everything is balanced on: did_it_happen against chance_of_happening
+for every roll, and BatchedStream's percent rolls.
+
+    python -m pytest -q test_rng.py     (or python -m unittest test_rng)
+"""
+
+import math
+import unittest
+from collections import Counter
+
+from game_macros import chance_of_happening, did_it_happen
+from rng import _PERCENTS, _REJECTED, BatchedStream, use_rng
+
+# the easy ones, and the ones where 100 * chance isn't what it looks like in
+# floating point (100 * 0.07 is 7.000000000000001, 100 * 0.57 is 56.99...)
+CHANCES = (
+    -1,
+    0,
+    0.001,
+    0.005,
+    0.01,
+    0.07,
+    0.1,
+    0.1 + 0.2,
+    0.29,
+    0.5,
+    0.57,
+    0.58,
+    0.99,
+    0.999,
+    1,
+    1.5,
+)
+
+
+class FixedRoll:
+    """Stands in for a stream that always rolls the same number."""
+
+    def __init__(self, roll):
+        self._roll = roll
+
+    def roll(self):
+        return self._roll
+
+
+def _happens(chance, roll):
+    previous = use_rng(FixedRoll(roll))
+    try:
+        return did_it_happen(chance)
+    finally:
+        use_rng(previous)
+
+
+class DidItHappenTest(unittest.TestCase):
+    def test_matches_chance_of_happening_over_every_roll(self):
+        for chance in CHANCES + tuple(step / 100 for step in range(101)):
+            with self.subTest(chance=chance):
+                happened = sum(_happens(chance, roll) for roll in range(101))
+                self.assertEqual(happened / 101, chance_of_happening(chance))
+
+    def test_documented_odds(self):
+        for chance in CHANCES:
+            with self.subTest(chance=chance):
+                expected = (
+                    min(math.ceil(100 * chance), 101) / 101 if chance > 0 else 0
+                )
+                self.assertEqual(chance_of_happening(chance), expected)
+        self.assertEqual(chance_of_happening(0.5), 50 / 101)
+        self.assertEqual(chance_of_happening(1), 100 / 101)
+        self.assertEqual(chance_of_happening(0.001), 1 / 101)
+        # not 7/101 (see the floating point note up top)
+        self.assertEqual(chance_of_happening(0.07), 8 / 101)
+
+    def test_lower_rolls_happen_first(self):
+        # true for a roll means true for every lower roll too
+        for chance in CHANCES:
+            outcomes = [_happens(chance, roll) for roll in range(101)]
+            self.assertEqual(outcomes, sorted(outcomes, reverse=True))
+
+
+class BatchedStreamTest(unittest.TestCase):
+    def test_translation_tables(self):
+        # 0..201 map two-to-one onto 0..100, and 202..255 get thrown away
+        kept = bytes(range(202)).translate(_PERCENTS)
+        self.assertEqual(Counter(kept), {n: 2 for n in range(101)})
+        self.assertEqual(bytes(range(256)).translate(_PERCENTS, _REJECTED), kept)
+
+    def _assert_uniform(self, stream, draws):
+        counts = Counter(stream.roll() for _ in range(draws))
+        self.assertEqual(set(counts), set(range(101)))
+        # chi-squared with 100 degrees of freedom: 99.9% of the time under 149
+        expected = draws / 101
+        chi_squared = sum(
+            (count - expected) ** 2 / expected for count in counts.values()
+        )
+        self.assertLess(chi_squared, 149)
+
+    def test_uniform(self):
+        self._assert_uniform(BatchedStream(1), 202_000)
+
+    def test_uniform_with_tiny_blocks(self):
+        # one byte per block, so about a fifth of the blocks are thrown away
+        # whole (and have to be drawn again rather than run out)
+        self._assert_uniform(BatchedStream(2, block_size=1), 50_500)
+
+    def test_same_seed_same_rolls(self):
+        first = BatchedStream(42, block_size=7)
+        second = BatchedStream(42, block_size=7)
+        self.assertEqual(
+            [first.roll() for _ in range(1000)], [second.roll() for _ in range(1000)]
+        )
+
+    def test_split_ignores_how_much_was_used(self):
+        used = BatchedStream(5)
+        for _ in range(100):
+            used.roll()
+        fresh = BatchedStream(5).split("nora", "winston")
+        split = used.split("nora", "winston")
+        self.assertEqual(
+            [split.roll() for _ in range(100)], [fresh.roll() for _ in range(100)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
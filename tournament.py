@@ -0,0 +1,213 @@
+"""
+Round robin: everybody fights everybody (as player and as opponent), spread
+across a pool of worker processes.
+
+Every chunk of matches gets its own seed, derived from the tournament seed and
+the chunk itself, so a run is reproducible no matter how many workers there
+are or which worker happens to pick up which chunk.
+
+With --tolerance, a pair stops, partway through a chunk if need be, once its
+win rates are pinned down well enough, so lopsided pairs are done long before
+close ones. Close ones still take a while: a rate near 50% needs about
+(1.96 / tolerance)² / 4 matches at 95% confidence, about 4300 for ±0.015.
+
+    python tournament.py --matches 10000 --workers 8 --seed 42
+    python tournament.py --matches 10000 --tolerance 0.01 --chunk-size 500
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from game import Game
+from rng import derive_seed
+from simulation import (
+    DEFAULT_CONFIDENCE,
+    DEFAULT_MAX_TURNS,
+    POLICIES,
+    MatchupStats,
+    simulate_matchup,
+    z_score,
+)
+
+# Small enough to keep lots of cores busy, big enough that shipping results
+# back from the workers is not the bottleneck.
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def _run_chunk(task):
+    (
+        player_name,
+        opponent_name,
+        matches,
+        seed,
+        player_policy,
+        opponent_policy,
+        max_turns,
+        tolerance,
+        confidence,
+        so_far,
+    ) = task
+    return simulate_matchup(
+        player_name,
+        opponent_name,
+        matches,
+        player_policy=POLICIES[player_policy],
+        opponent_policy=POLICIES[opponent_policy],
+        max_turns=max_turns,
+        seed=seed,
+        tolerance=tolerance,
+        confidence=confidence,
+        so_far=so_far,
+    )
+
+
+def _pairs(names):
+    # You cannot be your own opponent (not even you, Adrian).
+    return [
+        (player_name, opponent_name)
+        for player_name in names
+        for opponent_name in names
+        if player_name != opponent_name
+    ]
+
+
+def _chunk_task(pair, chunk_index, matches, seed, chunk_size, *rest):
+    player_name, opponent_name = pair
+    start = chunk_index * chunk_size
+    return (
+        player_name,
+        opponent_name,
+        min(chunk_size, matches - start),
+        derive_seed(seed, player_name, opponent_name, chunk_index),
+        *rest,
+    )
+
+
+def run_tournament(
+    matches,
+    names=None,
+    workers=None,
+    seed=0,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    player_policy="random",
+    opponent_policy="random",
+    max_turns=DEFAULT_MAX_TURNS,
+    tolerance=None,
+    confidence=DEFAULT_CONFIDENCE,
+):
+    """Play `matches` headless duels for every ordered pair of characters
+    (the whole roster by default) on a process pool of `workers` processes.
+
+    With a tolerance, `matches` is the most each pair gets: chunks go out a
+    round at a time, and a pair stops (partway through a chunk, checking every
+    simulation.CHECK_EVERY matches) once its win rates are known to within
+    ± tolerance (see MatchupStats.precise_to). Chunk seeds don't depend on the
+    rounds, so this is just as reproducible.
+
+    Policies are given by name (see simulation.POLICIES) so tasks pickle cheaply.
+    Return dict of (player name, opponent name) -> MatchupStats.
+    """
+    names = sorted(names or Game().all_characters)
+    results = {pair: MatchupStats(*pair) for pair in _pairs(names)}
+    chunks = -(-matches // chunk_size)
+    z = z_score(confidence)
+
+    def chunk_task(pair, chunk_index, so_far=None):
+        return _chunk_task(
+            pair,
+            chunk_index,
+            matches,
+            seed,
+            chunk_size,
+            player_policy,
+            opponent_policy,
+            max_turns,
+            tolerance,
+            confidence,
+            so_far,
+        )
+
+    if tolerance is None:
+        # nothing to wait and see about, so everything at once
+        rounds = [
+            [chunk_task(pair, idx) for pair in results for idx in range(chunks)]
+        ]
+    else:
+        # one chunk per pair per round, which stops partway once the pair is
+        # precise enough counting its earlier chunks (so_far)
+        rounds = (
+            [
+                chunk_task(pair, idx, so_far=stats)
+                for pair, stats in results.items()
+                if not stats.precise_to(tolerance, z)
+            ]
+            for idx in range(chunks)
+        )
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for tasks in rounds:
+            for stats in executor.map(_run_chunk, tasks):
+                results[stats.player_name, stats.opponent_name].merge(stats)
+
+    return results
+
+
+def win_rate_matrix(results):
+    """Return dict of player name -> {opponent name: player win rate}."""
+    matrix = {}
+    for (player_name, opponent_name), stats in results.items():
+        matrix.setdefault(player_name, {})[opponent_name] = stats.player_win_rate
+    return matrix
+
+
+def format_matrix(matrix):
+    names = sorted(set(matrix) | {name for row in matrix.values() for name in row})
+    width = max(len(name) for name in names) + 2
+    lines = [" " * width + "".join(name[:8].rjust(9) for name in names)]
+    for player_name in names:
+        row = matrix.get(player_name, {})
+        cells = "".join(
+            (f"{row[name]:.1%}" if name in row else "-").rjust(9) for name in names
+        )
+        lines.append(player_name.ljust(width) + cells)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a Magic Fight round robin.")
+    parser.add_argument(
+        "--matches", type=int, default=1000, help="per ordered pair (at most)"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        help="stop each pair once its win rates are known to within this",
+    )
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--player-policy", default="random", choices=POLICIES)
+    parser.add_argument("--opponent-policy", default="random", choices=POLICIES)
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS)
+    args = parser.parse_args()
+
+    results = run_tournament(
+        args.matches,
+        workers=args.workers,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+        player_policy=args.player_policy,
+        opponent_policy=args.opponent_policy,
+        max_turns=args.max_turns,
+        tolerance=args.tolerance,
+        confidence=args.confidence,
+    )
+    print("Player win rate (rows: player, columns: opponent)\n")
+    print(format_matrix(win_rate_matrix(results)))
+    print(f"\n{sum(stats.matches for stats in results.values())} matches in all")
+
+
+if __name__ == "__main__":
+    main()